@@ -6,6 +6,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 
 )
+from .serializer import ClaimsTokenRefreshSerializer
 
 # Router للـ Addresses API
 router = DefaultRouter()
@@ -25,7 +26,7 @@ urlpatterns = [
     path('check-password/', CheckPasswordView.as_view(), name='check-password'),
     path('change-password/', ChangePasswordView.as_view(), name='change-password'),
     path('logout/', LogoutView.as_view(), name='logout'),
-    path('refresh-token/', TokenRefreshView.as_view(), name='refresh_token'),
+    path('refresh-token/', TokenRefreshView.as_view(serializer_class=ClaimsTokenRefreshSerializer), name='refresh_token'),
     
     # Addresses API endpoints
     path('', include(router.urls)),
@@ -3,35 +3,42 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import authenticate
 from django.conf import settings
-from django.core.mail import send_mail
+from notifications.email_queue import send_email
 from accounts.models import User
 from accounts.serializer import (ChangePasswordSerializer, CheckPasswordSerializer, ConfirmResetSerializer,
                                  RegisterSerializer, ResendOTPSerializer, ResetPasswordSerializer, UserSerializer, VerifyOTPSerializer,)
 from .otp_manager import OTPManager
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from .tokens import ClaimsRefreshToken
 import secrets  # لتوليد رمز إعادة تعيين آمن
 import hashlib  # لتجزئة رمز إعادة التعيين
 from django.core.cache import cache  # تأكد من استيراد cache
+from project.ratelimit import RateLimitThrottle
 
 
-MAX_VERIFY_ATTEMPTS = 5
 # ثابت لمدة صلاحية رمز إعادة التعيين الذي سيتم إنشاؤه (مثلاً 10 دقائق)
 RESET_TOKEN_TIMEOUT_SECONDS = 10 * 60
 
 
 class AuthBaseView(APIView):
+    # حدود الطلبات لكل view (RATELIMIT_CONFIG في الإعدادات)
+    throttle_classes = [RateLimitThrottle]
+    ratelimit_scopes = ()
+
     def send_otp_email(self, email, otp):
-        send_mail(
+        # طابور البريد: الاستجابة لا تنتظر اتصال SMTP (للتطوير: EMAIL_BACKEND console)
+        send_email(
+            to=email,
             subject="تأكيد حسابك",
-            message=f"رمز التحقق الخاص بك هو: {otp}",
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[email]
+            body=f"رمز التحقق الخاص بك هو: {otp}",
+            from_email=settings.EMAIL_HOST_USER
         )
-        print(f"OTP for {email}: {otp}")
 
 
 class RegisterView(AuthBaseView):
+    ratelimit_scopes = ['register_ip']
+
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if not serializer.is_valid():
@@ -49,6 +56,8 @@ class RegisterView(AuthBaseView):
 
 
 class VerifyOTPView(AuthBaseView):
+    ratelimit_scopes = ['otp_verify_email', 'otp_verify_ip']
+
     def post(self, request):
 
         serializer = VerifyOTPSerializer(data=request.data)
@@ -66,7 +75,7 @@ class VerifyOTPView(AuthBaseView):
         user.is_verified = True
         user.save()
 
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             'access_token': str(refresh.access_token),
             'refresh_token': str(refresh),
@@ -75,6 +84,8 @@ class VerifyOTPView(AuthBaseView):
 
 
 class VerifyResetOTPView(AuthBaseView):
+    ratelimit_scopes = ['otp_verify_email', 'otp_verify_ip']
+
     def post(self, request):
         serializer = VerifyOTPSerializer(data=request.data)
         if not serializer.is_valid():
@@ -83,17 +94,11 @@ class VerifyResetOTPView(AuthBaseView):
         email = serializer.validated_data['email']
         otp = serializer.validated_data['otp']
 
-        otp_cache_key = f'otp:{email}'
-        cached_otp_data = cache.get(otp_cache_key)
-
+        # verify_otp يرفض الرمز المنتهي أو غير الموجود
         result = OTPManager.verify_otp(email, otp)
         if not result['valid']:
             return Response({'error': result['error']}, status=status.HTTP_400_BAD_REQUEST)
 
-        if cached_otp_data is None:
-            return Response({'error': 'كود التحقق منتهي الصلاحية أو غير صحيح، يرجى طلب كود جديد.'},
-                            status=status.HTTP_400_BAD_REQUEST)
-
         reset_token = secrets.token_urlsafe(32)
 
         hashed_reset_token = hashlib.sha256(reset_token.encode()).hexdigest()
@@ -112,6 +117,8 @@ class VerifyResetOTPView(AuthBaseView):
 
 
 class ResendOTPView(AuthBaseView):
+    ratelimit_scopes = ['otp_send_email', 'otp_send_ip']
+
     def post(self, request):
         serializer = ResendOTPSerializer(data=request.data)
         print(request.data)
@@ -122,22 +129,22 @@ class ResendOTPView(AuthBaseView):
 
         email = serializer.validated_data['email']
 
-        # حساب وقت الانتظار المتبقي
-        cooldown = OTPManager.get_resend_cooldown(email)
-        if cooldown > 0:
+        # فحص وقت الانتظار وتوليد OTP جديد في عملية ذرية واحدة
+        otp, cooldown = OTPManager.issue_otp(email)
+        if otp is None:
             return Response({
                 'error': f'يرجى الانتظار {int(cooldown)} ثانية قبل إعادة المحاولة',
                 'waiting_seconds': int(cooldown)
             }, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
-        # توليد OTP جديد
-        otp = OTPManager.generate_otp(email)
         self.send_otp_email(email, otp)
 
         return Response({'message': 'تم إرسال كود التحقق'})
 
 
 class LoginView(AuthBaseView):
+    ratelimit_scopes = ['login_ip', 'login_email']
+
     def post(self, request):
         email = request.data.get('email', None)
         password = request.data.get('password', None)
@@ -147,7 +154,7 @@ class LoginView(AuthBaseView):
         if not user:
             return Response({'error': 'بيانات الاعتماد غير صحيحة'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             'access_token': str(refresh.access_token),
             'refresh_token': str(refresh),
@@ -156,6 +163,8 @@ class LoginView(AuthBaseView):
 
 
 class ResetPasswordView(AuthBaseView):
+    ratelimit_scopes = ['otp_send_email', 'otp_send_ip']
+
     def post(self, request):
         serializer = ResetPasswordSerializer(data=request.data)
         if not serializer.is_valid():
@@ -165,16 +174,14 @@ class ResetPasswordView(AuthBaseView):
         if not User.objects.filter(email=email).exists():
             return Response({'error': 'البريد الإلكتروني غير مسجل'}, status=status.HTTP_404_NOT_FOUND)
 
-        # حساب وقت الانتظار المتبقي
-        cooldown = OTPManager.get_resend_cooldown(email)
-        print(cooldown)
-        if cooldown > 0:
+        # فحص وقت الانتظار وتوليد OTP في عملية ذرية واحدة
+        otp, cooldown = OTPManager.issue_otp(email)
+        if otp is None:
             return Response({
                 'error': f'يرجى الانتظار {int(cooldown)} ثانية قبل إعادة المحاولة',
                 'waiting_seconds': cooldown
             }, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
-        otp = OTPManager.generate_otp(email)
         self.send_otp_email(email, otp)
         return Response({'message': 'تم إرسال كود التحقق'})
 
@@ -235,6 +242,7 @@ class ConfirmResetView(AuthBaseView):
 
 class CheckPasswordView(AuthBaseView):
     permission_classes = [IsAuthenticated]
+    ratelimit_scopes = ['password_check']
 
     def post(self, request):
         serializer = CheckPasswordSerializer(data=request.data)
@@ -249,6 +257,7 @@ class CheckPasswordView(AuthBaseView):
 
 class ChangePasswordView(AuthBaseView):
     permission_classes = [IsAuthenticated]
+    ratelimit_scopes = ['password_check']
 
     def post(self, request):
         serializer = ChangePasswordSerializer(data=request.data)
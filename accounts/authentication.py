@@ -0,0 +1,34 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from . import tokens
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    مصادقة JWT بدون استعلام User لكل طلب: المستخدم يُبنى من claims الـ token
+    (accounts/tokens.py) بعد مقارنة رقم الإصدار المخزن في الكاش.
+    الـ tokens القديمة بدون claims تمر بالمسار العادي (استعلام User).
+    """
+
+    def get_user(self, validated_token):
+        if not tokens.has_claims(validated_token):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed(_("Token contained no recognizable user identification"))
+
+        version = tokens.get_token_version(user_id)
+        if version is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if version != validated_token[tokens.VERSION_CLAIM]:
+            # تغيرت صلاحيات المستخدم بعد إصدار الـ token
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        if not validated_token['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return tokens.user_from_claims(validated_token)
@@ -129,6 +129,12 @@ class User(AbstractBaseUser, PermissionsMixin):
         help_text=_("يحدد ما إذا كان البريد الإلكتروني تم التحقق منه.")
     )
     profile_bg=models.ImageField(upload_to="accounts/profile/%Y/%m/%d/",null=True,blank=True)    
+    token_version = models.PositiveIntegerField(
+        _("إصدار الصلاحيات"),
+        default=0,
+        editable=False,
+        help_text=_("يزيد عند تغيير الصلاحيات فتُرفض جميع tokens السابقة (accounts/tokens.py)")
+    )
     # الحقول المطلوبة للنظام
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -158,6 +164,49 @@ class User(AbstractBaseUser, PermissionsMixin):
         super().clean()
         self.email = self.__class__.objects.normalize_email(self.email)
 
+    # ===== صلاحيات الـ JWT (accounts/tokens.py) =====
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._claims_snapshot = instance._claims_state()
+        return instance
+
+    def _claims_state(self):
+        """قيم حقول الصلاحيات المحملة فقط (بدون تحميل الحقول المؤجلة)"""
+        from .tokens import CLAIM_FIELDS
+        return {field: self.__dict__[field] for field in CLAIM_FIELDS if field in self.__dict__}
+
+    def save(self, *args, **kwargs):
+        snapshot = getattr(self, '_claims_snapshot', None)
+        current = self._claims_state()
+        # حقل صلاحية عُيّن دون تحميله (مؤجل) يُعد تغييراً
+        changed = bool(self.pk and snapshot is not None and any(
+            field not in snapshot or snapshot[field] != value for field, value in current.items()
+        ))
+        if changed:
+            # تغيرت الصلاحيات: tokens السابقة لم تعد صالحة
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        super().save(*args, **kwargs)
+        self._claims_snapshot = self._claims_state()
+        if changed:
+            from .tokens import invalidate_token_versions
+            invalidate_token_versions([self.pk])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            # أول حقل مؤجل يُطلب (مثل المستخدم المبني من claims الـ JWT) يحمّل بقية الحقول معه
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        refreshed = {
+            field: value for field, value in self._claims_state().items()
+            if fields is None or field in fields
+        }
+        self._claims_snapshot = {**getattr(self, '_claims_snapshot', {}), **refreshed}
+
 
 
 
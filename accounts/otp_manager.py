@@ -1,78 +1,236 @@
+"""
+حالة OTP لكل بريد في hash واحد (otp:state:<email>)
 
-from django.core.cache import cache
-import pyotp
-from datetime import datetime, timedelta
+الحقول: secret, attempts, expires_at, resends, last_resend.
+- الإصدار (مع فحص مهلة إعادة الإرسال) والتحقق (مع عد المحاولات) كل منهما
+  سكربت Lua واحد: عملية ذرية ورحلة واحدة إلى Redis بدلاً من get ثم set.
+- نجاح التحقق يستهلك الرمز بـ DEL: طلبان متزامنان بنفس الرمز ينجح أحدهما فقط.
+- بدون django-redis (تطوير/اختبار) يُستخدم Django cache مع قفل داخل العملية.
+"""
+import logging
 import math
+import threading
+import time
+
+import pyotp
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
 OTP_TIMEOUT = 300  # 5 دقائق للصلاحية
 MAX_VERIFY_ATTEMPTS = 5
 MAX_RESEND_ATTEMPTS = 5
 
+OTP_KEY = 'otp:state:{email}'
+
+# إصدار رمز: فحص المهلة (اختياري) + تخزين السر + زيادة عداد الإرسال
+# ARGV: secret, now, otp_timeout, max_resend, check_cooldown
+ISSUE_SCRIPT = """
+local now = tonumber(ARGV[2])
+local timeout = tonumber(ARGV[3])
+local max_resend = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'resends', 'last_resend')
+local resends = tonumber(state[1]) or 0
+local last = tonumber(state[2]) or 0
+if ARGV[5] == '1' and resends >= max_resend then
+    local remaining = math.pow(2, resends - max_resend) * 60 - (now - last)
+    if remaining > 0 then
+        return {0, math.ceil(remaining)}
+    end
+end
+resends = resends + 1
+redis.call('HSET', KEYS[1], 'secret', ARGV[1], 'attempts', 0, 'expires_at', now + timeout,
+           'resends', resends, 'last_resend', now)
+local ttl = timeout
+if resends >= max_resend then
+    ttl = math.max(timeout, math.pow(2, resends - max_resend) * 60)
+end
+redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+return {1, resends}
+"""
+
+# بداية تحقق: الرمز صالح؟ زيادة المحاولات وإرجاع السر
+# ARGV: now, max_attempts -> nil (لا يوجد/منتهي) | {-1, ''} (تجاوز المحاولات) | {attempts, secret}
+VERIFY_SCRIPT = """
+local data = redis.call('HMGET', KEYS[1], 'secret', 'expires_at')
+if not data[1] or (tonumber(data[2]) or 0) < tonumber(ARGV[1]) then
+    return nil
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if attempts > tonumber(ARGV[2]) then
+    return {-1, ''}
+end
+return {attempts, data[1]}
+"""
+
+LOCKED = object()
+
+
+def _key(email):
+    return OTP_KEY.format(email=email)
+
+
+def _cooldown(resends, last_resend, now):
+    """المهلة المتبقية قبل إرسال جديد (أسية بعد MAX_RESEND_ATTEMPTS)"""
+    if resends < MAX_RESEND_ATTEMPTS:
+        return 0
+    remaining = math.pow(2, resends - MAX_RESEND_ATTEMPTS) * 60 - (now - (last_resend or 0))
+    return max(remaining, 0)
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisOTPStore:
+    """hash لكل بريد في Redis - كل عملية سكربت أو أمر واحد"""
+
+    def __init__(self, client):
+        self.client = client
+        self._issue = client.register_script(ISSUE_SCRIPT)
+        self._verify = client.register_script(VERIFY_SCRIPT)
+
+    def issue(self, email, secret, now, check_cooldown):
+        issued, value = self._issue(
+            keys=[_key(email)],
+            args=[secret, now, OTP_TIMEOUT, MAX_RESEND_ATTEMPTS, int(check_cooldown)],
+        )
+        return bool(issued), int(value)
+
+    def begin_verify(self, email, now):
+        result = self._verify(keys=[_key(email)], args=[now, MAX_VERIFY_ATTEMPTS])
+        if result is None:
+            return None
+        if int(result[0]) < 0:
+            return LOCKED
+        return _decode(result[1])
+
+    def consume(self, email):
+        return bool(self.client.delete(_key(email)))
+
+    def resend_state(self, email):
+        resends, last = self.client.hmget(_key(email), 'resends', 'last_resend')
+        return int(resends or 0), float(last or 0)
+
+
+class CacheOTPStore:
+    """
+    بديل عبر Django cache (قيمة dict) عند عدم استخدام django-redis - للتطوير والاختبار.
+    القفل داخل العملية فقط، لذا ليس ذرياً بين عدة عمليات.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def issue(self, email, secret, now, check_cooldown):
+        with self._lock:
+            state = cache.get(_key(email)) or {}
+            resends = state.get('resends', 0)
+            if check_cooldown:
+                remaining = _cooldown(resends, state.get('last_resend'), now)
+                if remaining > 0:
+                    return False, math.ceil(remaining)
+            resends += 1
+            ttl = OTP_TIMEOUT
+            if resends >= MAX_RESEND_ATTEMPTS:
+                ttl = max(OTP_TIMEOUT, math.pow(2, resends - MAX_RESEND_ATTEMPTS) * 60)
+            cache.set(_key(email), {
+                'secret': secret,
+                'attempts': 0,
+                'expires_at': now + OTP_TIMEOUT,
+                'resends': resends,
+                'last_resend': now,
+            }, math.ceil(ttl))
+            return True, resends
+
+    def begin_verify(self, email, now):
+        with self._lock:
+            state = cache.get(_key(email))
+            if not state or state.get('expires_at', 0) < now:
+                return None
+            state['attempts'] += 1
+            cache.set(_key(email), state, max(1, math.ceil(state['expires_at'] - now)))
+            if state['attempts'] > MAX_VERIFY_ATTEMPTS:
+                return LOCKED
+            return state['secret']
+
+    def consume(self, email):
+        with self._lock:
+            existed = cache.get(_key(email)) is not None
+            cache.delete(_key(email))
+            return existed
+
+    def resend_state(self, email):
+        state = cache.get(_key(email)) or {}
+        return state.get('resends', 0), state.get('last_resend', 0)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    """اختيار مخزن OTP حسب الـ cache المستخدم (Redis أو Django cache)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    from django_redis import get_redis_connection
+                    _store = RedisOTPStore(get_redis_connection('default'))
+                except (ImportError, NotImplementedError):
+                    _store = CacheOTPStore()
+    return _store
+
+
+def _new_otp():
+    secret = pyotp.random_base32()
+    return secret, pyotp.TOTP(secret, interval=OTP_TIMEOUT).now()
+
+
 class OTPManager:
     @staticmethod
     def generate_otp(email):
-        secret = pyotp.random_base32()
-        otp = pyotp.TOTP(secret, interval=OTP_TIMEOUT).now()
-        
-        # تخزين السر مع الوقت وعدد المحاولات
-        cache_data = {
-            'secret': secret,
-            'verify_attempts': 0,
-        }
-        # زيادة عداد الإرسال
-        OTPManager.increment_resend_count(email)
-        
-        cache.set(f'otp:{email}', cache_data, OTP_TIMEOUT)
-       
+        """إصدار رمز جديد (بدون فحص المهلة) وزيادة عداد الإرسال"""
+        secret, otp = _new_otp()
+        get_otp_store().issue(email, secret, time.time(), check_cooldown=False)
         return otp
 
+    @staticmethod
+    def issue_otp(email):
+        """
+        فحص مهلة إعادة الإرسال وإصدار الرمز في عملية ذرية واحدة.
+        ترجع (otp, 0) أو (None, ثواني الانتظار).
+        """
+        secret, otp = _new_otp()
+        issued, value = get_otp_store().issue(email, secret, time.time(), check_cooldown=True)
+        if not issued:
+            return None, value
+        return otp, 0
+
     @staticmethod
     def verify_otp(email, otp):
-        cache_key = f'otp:{email}'
-        data = cache.get(cache_key)
-        
-        if not data:
+        store = get_otp_store()
+        secret = store.begin_verify(email, time.time())
+
+        if secret is None:
             return {'valid': False, 'error': 'OTP منتهي الصلاحية او غير صحيح'}
-        
+
         # التحقق من عدد محاولات التحقق
-        if data['verify_attempts'] >= MAX_VERIFY_ATTEMPTS:
+        if secret is LOCKED:
             return {'valid': False, 'error': 'تم تجاوز الحد الأقصى للمحاولات'}
-        
-        # زيادة عداد المحاولات
-        data['verify_attempts'] += 1
-        cache.set(cache_key, data, OTP_TIMEOUT)
-        
-        totp = pyotp.TOTP(data['secret'], interval=OTP_TIMEOUT)
-        if totp.verify(otp):
-            
-            cache.delete(cache_key)
-            OTPManager.reset_resend_count(email)
+
+        totp = pyotp.TOTP(secret, interval=OTP_TIMEOUT)
+        # الاستهلاك بالحذف: يحذف أيضاً عداد الإرسال كما في السابق
+        if totp.verify(otp) and store.consume(email):
             return {'valid': True}
         return {'valid': False,'error':"رمز التحقق غير صحيح"}
 
     @staticmethod
     def get_resend_cooldown(email):
-        resend_count = cache.get(f'resend_count:{email}', 0)
-        if resend_count < MAX_RESEND_ATTEMPTS:
-            return 0
-        
-        # معادلة زيادة وقت الانتظار (أسية)
-        wait_minutes = math.pow(2, resend_count - MAX_RESEND_ATTEMPTS)
-        last_resend_time = cache.get(f'last_resend:{email}')
-        
-        if last_resend_time:
-            elapsed = datetime.now() - last_resend_time
-            remaining = timedelta(minutes=wait_minutes) - elapsed
-            return max(remaining.total_seconds(), 0)
-        
-        return wait_minutes * 60
+        resends, last_resend = get_otp_store().resend_state(email)
+        return _cooldown(resends, last_resend, time.time())
 
     @staticmethod
-    def increment_resend_count(email):
-        count = cache.get(f'resend_count:{email}', 0) + 1
-        cache.set(f'resend_count:{email}', count)
-        cache.set(f'last_resend:{email}', datetime.now())
-        return count
-    @staticmethod
     def reset_resend_count(email):
-        cache.delete(f'resend_count:{email}')
-        cache.delete(f'last_resend:{email}')
\ No newline at end of file
+        get_otp_store().consume(email)
@@ -1,6 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .tokens import ClaimsRefreshToken, set_claims
 
 User = get_user_model()
 
@@ -41,5 +46,38 @@ class ChangePasswordSerializer(serializers.Serializer):
 
 class CheckPasswordSerializer(serializers.Serializer):
     password = serializers.CharField()
-    
-    
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    تجديد access token مع claims من صف المستخدم الحالي (accounts/tokens.py).
+    الـ refresh token يحمل tv وقت إصداره؛ نسخه كما هو بعد تغيير الصلاحيات
+    يعطي access token مرفوضاً (token_revoked) في كل طلب.
+    """
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).first() if user_id else None
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+
+        set_claims(refresh, user)
+        data = {"access": str(refresh.access_token)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # تطبيق blacklist غير مثبت
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data["refresh"] = str(refresh)
+
+        return data
+
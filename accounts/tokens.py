@@ -0,0 +1,124 @@
+"""
+JWT يحمل صلاحيات المستخدم (claims) مع رقم إصدار للإبطال
+
+- ClaimsRefreshToken.for_user(): يضيف is_active, is_staff, is_superuser,
+  is_vendor, is_delivery ورقم الإصدار tv إلى الـ token (وتُنسخ إلى access).
+- المصادقة (accounts/authentication.py) تبني المستخدم من هذه الـ claims بدون
+  استعلام؛ الحقول الأخرى تُحمّل عند أول استخدام (استعلام واحد).
+- أي تغيير في حقول الصلاحيات عبر User.save() يرفع token_version، فتُرفض كل
+  الـ tokens السابقة للمستخدم. رقم الإصدار الحالي مخزن في الكاش لكل مستخدم.
+- refresh-token (ClaimsTokenRefreshSerializer) يعيد كتابة الـ claims ورقم الإصدار
+  من صف المستخدم الحالي، فلا يُنسخ tv قديم إلى access token مرفوض مسبقاً.
+
+    AUTH_CONFIG = {'TOKEN_VERSION_CACHE_TTL': 3600}
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_VERSION_CACHE_TTL = 60 * 60
+
+VERSION_CLAIM = 'tv'
+CLAIM_FIELDS = ('is_active', 'is_staff', 'is_superuser', 'is_vendor', 'is_delivery')
+
+TOKEN_VERSION_KEY = 'auth:tv:{user_id}'
+
+
+def get_token_version_cache_ttl():
+    config = getattr(settings, 'AUTH_CONFIG', {})
+    return int(config.get('TOKEN_VERSION_CACHE_TTL', DEFAULT_TOKEN_VERSION_CACHE_TTL))
+
+
+def _key(user_id):
+    return TOKEN_VERSION_KEY.format(user_id=user_id)
+
+
+def set_claims(token, user):
+    """كتابة صلاحيات المستخدم الحالية ورقم الإصدار في الـ token"""
+    for field in CLAIM_FIELDS:
+        token[field] = bool(getattr(user, field))
+    token[VERSION_CLAIM] = user.token_version
+    return token
+
+
+class ClaimsRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        return set_claims(super().for_user(user), user)
+
+
+# ===== رقم الإصدار =====
+
+def get_token_version(user_id):
+    """رقم الإصدار الحالي من الكاش، أو من DB عند الغياب. None إذا لم يوجد المستخدم."""
+    from .models import User
+
+    try:
+        version = cache.get(_key(user_id))
+        if version is not None:
+            return version
+    except Exception as e:
+        logger.warning(f'token version cache get failed for user {user_id}: {e}')
+
+    version = User.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+    if version is not None:
+        try:
+            cache.set(_key(user_id), version, get_token_version_cache_ttl())
+        except Exception as e:
+            logger.warning(f'token version cache set failed for user {user_id}: {e}')
+    return version
+
+
+def invalidate_token_versions(user_ids):
+    """حذف الإصدار المخزن بعد نجاح المعاملة (الطلب التالي يقرأ من DB)"""
+    keys = [_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+
+    def _delete():
+        try:
+            cache.delete_many(keys)
+        except Exception as e:
+            logger.warning(f'token version invalidation failed for {len(keys)} users: {e}')
+
+    transaction.on_commit(_delete)
+
+
+def bump_token_versions(user_ids):
+    """إبطال جميع tokens لمستخدمين (للتحديثات الجماعية التي لا تمر بـ save)"""
+    from .models import User
+
+    user_ids = list(user_ids)
+    updated = User.objects.filter(pk__in=user_ids).update(token_version=F('token_version') + 1)
+    invalidate_token_versions(user_ids)
+    return updated
+
+
+# ===== المستخدم من الـ claims =====
+
+def has_claims(payload):
+    return VERSION_CLAIM in payload and all(field in payload for field in CLAIM_FIELDS)
+
+
+def user_from_claims(payload):
+    """
+    User غير مكتمل من claims موقعة: id وحقول الصلاحيات فقط؛ أول وصول لحقل آخر
+    يحمّل بقية الحقول باستعلام واحد (User.refresh_from_db).
+    """
+    from .models import User
+
+    loaded = {
+        'id': payload[api_settings.USER_ID_CLAIM],
+        'token_version': payload[VERSION_CLAIM],
+        **{field: bool(payload[field]) for field in CLAIM_FIELDS},
+    }
+    # from_db يقرأ القيم بترتيب حقول النموذج
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in loaded]
+    return User.from_db('default', field_names, [loaded[name] for name in field_names])
@@ -0,0 +1,137 @@
+"""
+جمع ملفات الصور غير المستخدمة (content-addressed)
+
+ملفات المحتوى (core/image_storage.py) قد يشترك فيها أكثر من مالك، فلا تحذفها
+endpoints الحذف والاستبدال. هذا الجمع يحذف الأصل ونسخه المشتقة WebP
+(core/image_variants.py) عندما لا يشير إليه أي حقل رابط في REFERENCE_FIELDS،
+بشرط أن يكون أقدم من GC_MIN_AGE_S (الرفع يسبق حفظ الرابط في النموذج).
+
+    python manage.py gc_images [--dry-run] [--min-age-hours 24]
+
+    IMAGE_UPLOAD_CONFIG = {'GC_MIN_AGE_S': 86400}
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import image_variants
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GC_MIN_AGE_S = 60 * 60 * 24
+
+# حقول الروابط التي تحفظ صوراً مرفوعة
+REFERENCE_FIELDS = [
+    ('products.Product', 'cover_image_url'),
+    ('products.ProductVariant', 'cover_image_url'),
+    ('products.ProductImage', 'image_url'),
+    ('stores.Store', 'logo_url'),
+    ('stores.Store', 'cover_image_url'),
+    ('stores.PlatformCategory', 'image_url'),
+    ('notifications.NotificationMessage', 'image_url'),
+    ('notifications.Notification', 'image_url'),
+]
+
+# <dir>/<sha[:2]>/<sha> هو "جذر" الأصل ونسخه المشتقة (<sha>.<ext> و <sha>.<name>.webp)
+_STEM_RE = re.compile(r'^(?P<stem>(?:.*/)?[0-9a-f]{2}/[0-9a-f]{64})(\.[a-z]+)?\.[a-z0-9]+$')
+
+
+def get_gc_min_age():
+    config = getattr(settings, 'IMAGE_UPLOAD_CONFIG', {})
+    return int(config.get('GC_MIN_AGE_S', DEFAULT_GC_MIN_AGE_S))
+
+
+def content_stem(path):
+    """جذر ملف المحتوى (بدون الامتداد واسم النسخة)، أو None لغير ملفات المحتوى"""
+    match = _STEM_RE.match(path or '')
+    return match.group('stem') if match else None
+
+
+def referenced_stems():
+    """جذور كل ملفات المحتوى المشار إليها من REFERENCE_FIELDS"""
+    stems = set()
+    for model_label, field_name in REFERENCE_FIELDS:
+        model = apps.get_model(model_label)
+        urls = (
+            model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+            .values_list(field_name, flat=True).distinct()
+        )
+        for url in urls.iterator(chunk_size=2000):
+            stem = content_stem(image_variants.storage_path(url))
+            if stem:
+                stems.add(stem)
+    return stems
+
+
+def iter_content_files(storage=None, root=''):
+    """مسارات ملفات المحتوى في التخزين (مرور متكرر على المجلدات)"""
+    storage = storage or default_storage
+    dirs, files = storage.listdir(root)
+    prefix = f'{root}/' if root else ''
+    for name in files:
+        path = prefix + name
+        if content_stem(path):
+            yield path
+    for name in dirs:
+        yield from iter_content_files(storage, prefix + name)
+
+
+@dataclass
+class GCResult:
+    scanned: int = 0
+    kept: int = 0
+    deleted: list = field(default_factory=list)
+    bytes_freed: int = 0
+
+
+def collect(min_age=None, dry_run=False, storage=None):
+    """
+    حذف ملفات المحتوى غير المشار إليها والأقدم من min_age ثانية. الأصل ونسخه
+    تُحذف معاً أو تبقى معاً (أي ملف أحدث من المهلة يُبقي المجموعة كلها).
+    dry_run=True يرجع ما سيُحذف بدون حذف.
+    """
+    storage = storage or default_storage
+    min_age = get_gc_min_age() if min_age is None else min_age
+    cutoff = timezone.now() - timedelta(seconds=min_age)
+    # المراجع تُقرأ قبل المرور على الملفات: ما يُرفع بعدها أحدث من cutoff
+    stems = referenced_stems()
+
+    result = GCResult()
+    groups = {}
+    for path in iter_content_files(storage):
+        result.scanned += 1
+        stem = content_stem(path)
+        if stem in stems:
+            result.kept += 1
+        else:
+            groups.setdefault(stem, []).append(path)
+
+    for stem, paths in groups.items():
+        try:
+            if any(storage.get_modified_time(path) > cutoff for path in paths):
+                result.kept += len(paths)
+                continue
+            for path in paths:
+                size = storage.size(path)
+                if not dry_run:
+                    storage.delete(path)
+                result.deleted.append(path)
+                result.bytes_freed += size
+        except Exception as e:
+            logger.warning(f"Image GC skipped {stem}: {e}")
+            result.kept += len([path for path in paths if path not in result.deleted])
+
+    if result.deleted and not dry_run:
+        # سجلات النسخ (ImageAsset والكاش) للأصول المحذوفة
+        image_variants.forget(result.deleted)
+    logger.info(
+        f"Image GC: {len(result.deleted)} of {result.scanned} content files "
+        f"{'would be ' if dry_run else ''}deleted ({result.bytes_freed} bytes)"
+    )
+    return result
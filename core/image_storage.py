@@ -0,0 +1,151 @@
+"""
+تخزين الصور المرفوعة حسب المحتوى (content-addressed)
+
+- الرفع يُقرأ على أجزاء: HashingMemoryUploadHandler للملفات الصغيرة (حتى
+  MEMORY_LIMIT) و HashingTemporaryUploadHandler لما فوقها (ملف مؤقت على القرص)،
+  وكلاهما يحسب sha256 أثناء استلام الأجزاء، فالذاكرة لكل رفع محدودة بحجم الجزء.
+- اسم الملف هو البصمة: <folder>/<sha[:2]>/<sha><ext>. الصورة نفسها المرفوعة من
+  عدة بائعين تُخزن مرة واحدة ويُرجع رابطها الموجود.
+- لأن الملف قد يكون مشتركاً، مسارات المحتوى لا تُحذف من endpoints الحذف والاستبدال؛
+  الملفات التي لم يعد يشير إليها أي نموذج تُحذف بأمر gc_images (core/image_gc.py).
+
+    IMAGE_UPLOAD_CONFIG = {
+        'MEMORY_LIMIT': 256 * 1024,
+        'CHUNK_SIZE': 64 * 1024,
+    }
+"""
+import hashlib
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_LIMIT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# الامتداد من نوع المحتوى حتى لا يختلف اسم الصورة نفسها بين .jpeg و .JPG
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+
+# <sha>.<ext> أو نسخة مشتقة <sha>.<name>.webp (core/image_variants.py)
+CONTENT_PATH_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z]+)?\.[a-z0-9]+$')
+
+
+def _get_config(name, default):
+    return getattr(settings, 'IMAGE_UPLOAD_CONFIG', {}).get(name, default)
+
+
+def get_memory_limit():
+    return int(_get_config('MEMORY_LIMIT', DEFAULT_MEMORY_LIMIT))
+
+
+def get_chunk_size():
+    return int(_get_config('CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+
+# ===== معالجات الرفع =====
+
+class HashingUploadMixin:
+    """يحسب sha256 للملف أثناء استلام أجزائه ويضعه في file.sha256"""
+
+    def new_file(self, *args, **kwargs):
+        # قبل super(): معالج الذاكرة يرفع StopFutureHandlers عند تفعيله
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if getattr(self, 'activated', True):
+            self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file_obj = super().file_complete(file_size)
+        if file_obj is not None:
+            file_obj.sha256 = self._sha256.hexdigest()
+        return file_obj
+
+
+class HashingMemoryUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """الرفع الصغير في الذاكرة (حتى MEMORY_LIMIT بدلاً من FILE_UPLOAD_MAX_MEMORY_SIZE)"""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.activated = content_length <= get_memory_limit()
+
+
+class HashingTemporaryUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """الرفع الأكبر يُكتب جزءاً جزءاً إلى ملف مؤقت"""
+
+
+def upload_handlers(request):
+    return [HashingMemoryUploadHandler(request), HashingTemporaryUploadHandler(request)]
+
+
+# ===== التخزين =====
+
+def file_sha256(file_obj):
+    """بصمة الملف: من معالج الرفع إن وُجدت، وإلا قراءة على أجزاء"""
+    digest = getattr(file_obj, 'sha256', None)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    for chunk in file_obj.chunks(get_chunk_size()):
+        sha.update(chunk)
+    file_obj.seek(0)
+    return sha.hexdigest()
+
+
+def file_extension(file_obj):
+    content_type = (getattr(file_obj, 'content_type', '') or '').split(';')[0].strip().lower()
+    if content_type in CONTENT_TYPE_EXTENSIONS:
+        return CONTENT_TYPE_EXTENSIONS[content_type]
+    return os.path.splitext(file_obj.name or '')[1].lower() or '.jpg'
+
+
+def content_path(folder, digest, ext):
+    return f"{folder.strip('/')}/{digest[:2]}/{digest}{ext}"
+
+
+def is_content_addressed(path):
+    """هل المسار ملف محتوى قد يشترك فيه أكثر من مالك؟"""
+    return bool(CONTENT_PATH_RE.search(path or ''))
+
+
+def _touch(storage, path):
+    # الرابط المعاد لرفع مكرر لم يُحفظ في نموذج بعد: تحديث وقت التعديل يحميه
+    # من gc_images خلال مهلة GC_MIN_AGE_S
+    try:
+        os.utime(storage.path(path))
+    except (NotImplementedError, OSError) as e:
+        logger.debug(f"Could not touch {path}: {e}")
+
+
+def store_image(file_obj, folder='uploads', storage=None):
+    """
+    حفظ الصورة بمسار بصمتها. ترجع (path, sha256, created)؛
+    created=False إذا كانت الصورة مخزنة مسبقاً (يُرجع المسار الموجود بدون كتابة).
+    """
+    storage = storage or default_storage
+    digest = file_sha256(file_obj)
+    path = content_path(folder, digest, file_extension(file_obj))
+
+    if storage.exists(path):
+        _touch(storage, path)
+        return path, digest, False
+
+    # الحفظ يقرأ الملف على أجزاء (أو ينقل الملف المؤقت مباشرة في FileSystemStorage)
+    saved_path = storage.save(path, file_obj)
+    if saved_path != path:
+        # رفع متزامن لنفس الصورة سبقنا إلى المسار: نحتفظ بنسخته
+        storage.delete(saved_path)
+        return path, digest, False
+    return path, digest, True
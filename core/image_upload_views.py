@@ -1,10 +1,6 @@
 import os
 import time
-import hashlib
-from datetime import datetime
-from uuid import uuid4
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -12,6 +8,9 @@ from rest_framework import status, permissions, parsers
 from rest_framework.parsers import MultiPartParser, FormParser
 import logging
 
+from . import image_variants
+from .image_storage import is_content_addressed, store_image, upload_handlers
+
 logger = logging.getLogger(__name__)
 
 class BaseImageUploadView(APIView):
@@ -22,6 +21,11 @@ class BaseImageUploadView(APIView):
     permission_classes = [permissions.IsAuthenticated]  # ✅ تأمين - يجب المصادقة
     parser_classes = [MultiPartParser, FormParser]
     
+    def dispatch(self, request, *args, **kwargs):
+        # قراءة الرفع على أجزاء مع حساب البصمة (core/image_storage.py)
+        request.upload_handlers = upload_handlers(request)
+        return super().dispatch(request, *args, **kwargs)
+    
     def validate_image(self, file_obj, max_size=5*1024*1024):
         """التحقق من صحة الصورة"""
         if not file_obj:
@@ -38,20 +42,22 @@ class BaseImageUploadView(APIView):
         return True, None
     
     def save_image(self, file_obj, folder='uploads'):
-        """حفظ الصورة وإرجاع URL"""
-        ext = os.path.splitext(file_obj.name)[1].lower() or '.jpg'
-        today = datetime.utcnow()
-        dir_path = f"{folder}/{today.year:04d}/{today.month:02d}/{today.day:02d}"
-        filename = f"{uuid4().hex}{ext}"
-        upload_path = f"{dir_path}/{filename}"
-        
+        """
+        حفظ الصورة بمسار بصمتها (sha256) وإرجاع (path, hash, created).
+        الصورة المخزنة مسبقاً لا تُكتب مرة أخرى ويُرجع مسارها الموجود.
+        """
         try:
-            raw = file_obj.read()
-            saved_path = default_storage.save(upload_path, ContentFile(raw))
-            file_hash = hashlib.sha256(raw).hexdigest()[:16]
+            saved_path, digest, created = store_image(file_obj, folder)
+            file_hash = digest[:16]
             
-            logger.info(f"Image saved: {saved_path}, hash: {file_hash}")
-            return saved_path, file_hash
+            logger.info(f"Image {'saved' if created else 'deduplicated'}: {saved_path}, hash: {file_hash}")
+            if created:
+                # النسخ المشتقة (مصغرة، متوسطة، كبيرة) بصيغة WebP في الخلفية
+                try:
+                    image_variants.schedule(saved_path)
+                except Exception as e:
+                    logger.warning(f"Could not schedule image variants for {saved_path}: {e}")
+            return saved_path, file_hash, created
         except Exception as e:
             logger.error(f"Failed to save image: {e}")
             raise e
@@ -80,7 +86,7 @@ class UploadImageView(BaseImageUploadView):
         
         try:
             # حفظ الصورة
-            saved_path, file_hash = self.save_image(file_obj, folder)
+            saved_path, file_hash, created = self.save_image(file_obj, folder)
             
             # إنشاء URL مطلق
             file_url = default_storage.url(saved_path)
@@ -100,6 +106,7 @@ class UploadImageView(BaseImageUploadView):
                 'url': absolute_url,
                 'file_path': saved_path,
                 'file_size': file_obj.size,
+                'duplicate': not created,
                 'message': 'تم رفع الصورة بنجاح'
             }, status=201)
             
@@ -129,7 +136,7 @@ class ProductImageUploadView(BaseImageUploadView):
         
         try:
             # حفظ الصورة
-            saved_path, file_hash = self.save_image(file_obj, folder)
+            saved_path, file_hash, created = self.save_image(file_obj, folder)
             
             # إنشاء URL مطلق
             file_url = default_storage.url(saved_path)
@@ -149,6 +156,7 @@ class ProductImageUploadView(BaseImageUploadView):
                 'url': absolute_url,
                 'file_path': saved_path,
                 'file_size': file_obj.size,
+                'duplicate': not created,
                 'message': 'تم رفع صورة المنتج بنجاح'
             }, status=201)
             
@@ -172,7 +180,7 @@ class StoreImageUploadView(BaseImageUploadView):
         
         try:
             # حفظ الصورة
-            saved_path, file_hash = self.save_image(file_obj, 'stores')
+            saved_path, file_hash, created = self.save_image(file_obj, 'stores')
             
             # إنشاء URL مطلق
             file_url = default_storage.url(saved_path)
@@ -186,6 +194,7 @@ class StoreImageUploadView(BaseImageUploadView):
                 'url': absolute_url,
                 'file_path': saved_path,
                 'file_size': file_obj.size,
+                'duplicate': not created,
                 'message': 'تم رفع صورة المتجر بنجاح'
             }, status=201)
             
@@ -215,6 +224,11 @@ class DeleteImageAPIView(APIView):
                 rel_path = rel_path[len(settings.MEDIA_URL):]
 
             full_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+            if is_content_addressed(rel_path):
+                # ملف محتوى قد يستخدمه مالكون آخرون: لا يُحذف هنا، بل بأمر gc_images
+                # عندما لا يشير إليه أي نموذج
+                logger.info(f"Shared image kept: {rel_path}")
+                return Response({'deleted': False, 'shared': True, 'message': 'الصورة مشتركة وستُحذف تلقائياً عند عدم استخدامها'}, status=200)
             if os.path.exists(full_path):
                 os.remove(full_path)
                 logger.info(f"Image deleted: {full_path}")
@@ -249,7 +263,10 @@ class ReplaceImageAPIView(BaseImageUploadView):
                 if rel_path.startswith(settings.MEDIA_URL):
                     rel_path = rel_path[len(settings.MEDIA_URL):]
                 full_path = os.path.join(settings.MEDIA_ROOT, rel_path)
-                if os.path.exists(full_path):
+                if is_content_addressed(rel_path):
+                    # الصورة القديمة قد تكون مشتركة مع مالكين آخرين (تُحذف بأمر gc_images)
+                    logger.info(f"Shared image kept on replace: {rel_path}")
+                elif os.path.exists(full_path):
                     os.remove(full_path)
                     logger.info(f"Old image deleted: {full_path}")
             except Exception as e:
@@ -263,7 +280,7 @@ class ReplaceImageAPIView(BaseImageUploadView):
 
         try:
             # حفظ الصورة الجديدة
-            saved_path, file_hash = self.save_image(image, folder)
+            saved_path, file_hash, created = self.save_image(image, folder)
             
             # إنشاء URL مطلق
             file_url = default_storage.url(saved_path)
@@ -276,6 +293,7 @@ class ReplaceImageAPIView(BaseImageUploadView):
                 'image_url': absolute_url,
                 'url': absolute_url,
                 'file_path': saved_path,
+                'duplicate': not created,
                 'message': 'تم استبدال الصورة بنجاح'
             }, status=201)
             
@@ -0,0 +1,262 @@
+"""
+نسخ مشتقة من الصور المرفوعة (مصغرة، متوسطة، كبيرة) بصيغة WebP خارج مسار الطلب
+
+- بعد الرفع يُجدول generate(path) (thread محلي محدود أو Celery) فيولد بـ Pillow
+  كل نسخة بصيغة WebP باسم ثابت بجانب الأصل: <stem>.<name>.webp، ويسجل
+  المسارات في ImageAsset.
+- serializers القوائم تختار الحجم المناسب (core/serializers.py: ImageVariantField)؛
+  حالة النسخ تُقرأ من الكاش دفعة واحدة لكل صفحة، والأصل يُرجع إذا لم تجهز بعد.
+
+    IMAGE_UPLOAD_CONFIG = {
+        'VARIANTS': {'thumb': 240, 'medium': 720, 'large': 1600},
+        'VARIANT_QUALITY': 80,
+        'VARIANT_QUEUE': 'thread',
+        'VARIANT_WORKERS': 2,
+        'VARIANT_CACHE_TTL': 86400,
+    }
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # أقصى بُعد (عرض أو ارتفاع) لكل نسخة
+    'VARIANTS': {'thumb': 240, 'medium': 720, 'large': 1600},
+    'VARIANT_QUALITY': 80,
+    'VARIANT_QUEUE': 'thread',
+    'VARIANT_WORKERS': 2,
+    'VARIANT_CACHE_TTL': 60 * 60 * 24,
+}
+
+CACHE_KEY = 'img:variants:{digest}'
+
+# لا توجد نسخ (أو لم تجهز بعد) - تُخزن حتى لا يُسأل DB في كل قائمة
+NO_VARIANTS = {}
+
+
+def _get_config(name):
+    return getattr(settings, 'IMAGE_UPLOAD_CONFIG', {}).get(name, DEFAULTS[name])
+
+
+def get_variant_sizes():
+    return dict(_get_config('VARIANTS'))
+
+
+# ===== المسارات =====
+
+def variant_path(path, name):
+    stem = os.path.splitext(path)[0]
+    return f"{stem}.{name}.webp"
+
+
+def storage_path(url):
+    """مسار التخزين من رابط صورة (مطلق أو /media/...)، أو None إذا لم يكن من MEDIA"""
+    if not url:
+        return None
+    path = urlparse(url).path
+    media_url = urlparse(settings.MEDIA_URL).path
+    if not path.startswith(media_url):
+        return None
+    return path[len(media_url):] or None
+
+
+def variant_url(url, path, variant):
+    """رابط النسخة بنفس صيغة الرابط الأصلي (مطلق أو نسبي)"""
+    parsed = urlparse(url)
+    if parsed.path.endswith(path):
+        return parsed._replace(path=parsed.path[:-len(path)] + variant).geturl()
+    return default_storage.url(variant)
+
+
+def _cache_key(path):
+    return CACHE_KEY.format(digest=hashlib.md5(path.encode()).hexdigest())
+
+
+# ===== التوليد =====
+
+def _open_image(path, max_size):
+    from PIL import Image, ImageOps
+
+    with default_storage.open(path, 'rb') as f:
+        image = Image.open(f)
+        # JPEG: فك الترميز مباشرة بدقة أقل (أسرع وذاكرة أقل للصور الكبيرة)
+        image.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def _encode(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def generate(path, force=False):
+    """
+    توليد النسخ المشتقة لصورة في التخزين وتسجيلها. ترجع {name: path} أو {} عند الفشل.
+    """
+    from PIL import Image
+    from .models import ImageAsset
+
+    asset, _ = ImageAsset.objects.get_or_create(path=path)
+    if asset.status == ImageAsset.Status.READY and not force:
+        return asset.variants
+
+    sizes = get_variant_sizes()
+    quality = int(_get_config('VARIANT_QUALITY'))
+    try:
+        image = _open_image(path, max(sizes.values()))
+        width, height = image.size
+        variants = {}
+        # من الأكبر إلى الأصغر: كل نسخة تُصغر من السابقة بدلاً من الأصل
+        for name, max_size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            if max(image.size) > max_size:
+                image = image.copy()
+                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            target = variant_path(path, name)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            variants[name] = default_storage.save(target, ContentFile(_encode(image, quality)))
+    except Exception as e:
+        logger.warning(f"Image variants failed for {path}: {e}")
+        ImageAsset.objects.filter(pk=asset.pk).update(status=ImageAsset.Status.FAILED)
+        return {}
+
+    ImageAsset.objects.filter(pk=asset.pk).update(
+        width=width, height=height, variants=variants, status=ImageAsset.Status.READY
+    )
+    _cache_set({path: variants})
+    logger.info(f"Image variants ready for {path}: {sorted(variants)}")
+    return variants
+
+
+# ===== الجدولة =====
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(_get_config('VARIANT_WORKERS')), thread_name_prefix='image-variants'
+        )
+    return _executor
+
+
+def _generate_in_thread(path):
+    try:
+        generate(path)
+    finally:
+        close_old_connections()
+
+
+def schedule(path):
+    """جدولة توليد النسخ بدون انتظار (لا يؤخر استجابة الرفع)"""
+    mode = _get_config('VARIANT_QUEUE')
+    if mode == 'sync':
+        return generate(path)
+    if mode == 'celery':
+        from .tasks import generate_image_variants_task
+        try:
+            generate_image_variants_task.delay(path)
+            return None
+        except Exception as e:
+            logger.warning(f"Could not enqueue image variants for {path} to Celery ({e}); using local thread")
+    _get_executor().submit(_generate_in_thread, path)
+    return None
+
+
+# ===== القراءة =====
+
+def _cache_set(mapping):
+    try:
+        cache.set_many(
+            {_cache_key(path): variants for path, variants in mapping.items()},
+            int(_get_config('VARIANT_CACHE_TTL')),
+        )
+    except Exception as e:
+        logger.warning(f"Image variants cache set failed: {e}")
+
+
+def _cache_add(path, variants):
+    try:
+        cache.add(_cache_key(path), variants, int(_get_config('VARIANT_CACHE_TTL')))
+    except Exception as e:
+        logger.warning(f"Image variants cache add failed: {e}")
+
+
+def forget(paths):
+    """حذف سجلات النسخ لأصول حُذفت من التخزين (core/image_gc.py)"""
+    from .models import ImageAsset
+
+    paths = list(paths)
+    ImageAsset.objects.filter(path__in=paths).delete()
+    try:
+        cache.delete_many([_cache_key(p) for p in paths])
+    except Exception as e:
+        logger.warning(f"Image variants cache delete failed: {e}")
+
+
+def get_variants(paths):
+    """
+    النسخ الجاهزة لعدة صور: {path: {name: variant_path}}. قراءة واحدة من الكاش
+    واستعلام واحد للناقص. صورة بدون نسخ جاهزة تُرجع {}.
+    """
+    from .models import ImageAsset
+
+    paths = {p for p in paths if p}
+    if not paths:
+        return {}
+    keys = {_cache_key(p): p for p in paths}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Image variants cache get failed: {e}")
+        cached = {}
+    found = {keys[key]: value for key, value in cached.items()}
+
+    missing = paths - found.keys()
+    if missing:
+        rows = dict(
+            ImageAsset.objects.filter(path__in=missing, status=ImageAsset.Status.READY)
+            .values_list('path', 'variants')
+        )
+        loaded = {p: rows.get(p, NO_VARIANTS) for p in missing}
+        _cache_set({p: v for p, v in loaded.items() if v})
+        for p, v in loaded.items():
+            if not v:
+                # add وليس set: لا يطغى على نتيجة generate() التي انتهت للتو
+                _cache_add(p, v)
+        found.update(loaded)
+    return found
+
+
+def resolve_urls(urls, size, variants=None):
+    """
+    {url: رابط النسخة size} لعدة روابط؛ الرابط يبقى كما هو إذا لم تكن النسخة جاهزة
+    أو لم يكن من MEDIA. variants: نتيجة get_variants مسبقة (اختياري).
+    """
+    paths = {url: storage_path(url) for url in urls if url}
+    if variants is None:
+        variants = get_variants(paths.values())
+    resolved = {}
+    for url, path in paths.items():
+        variant = (variants.get(path) or {}).get(size) if path else None
+        resolved[url] = variant_url(url, path, variant) if variant else url
+    return resolved
+
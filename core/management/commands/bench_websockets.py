@@ -0,0 +1,357 @@
+import asyncio
+import gc
+import json
+import logging
+import os
+import resource
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import re_path
+
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from project import consumers, order_access, realtime_log, ws_auth_cache
+
+User = get_user_model()
+
+
+class BenchChannelLayer(InMemoryChannelLayer):
+    """
+    InMemoryChannelLayer ينظف المنتهي بالمرور على جميع القنوات في كل send/receive
+    (O(عدد الاتصالات) لكل رسالة). هنا التنظيف مرة كل ثانية على الأكثر حتى يقيس
+    الاختبار طبقة consumers وليس هذا التنظيف.
+    """
+
+    cleanup_interval = 1.0
+    _last_cleanup = 0.0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self._last_cleanup >= self.cleanup_interval:
+            self._last_cleanup = now
+            super()._clean_expired()
+
+
+BENCH_CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'core.management.commands.bench_websockets.BenchChannelLayer',
+        'CONFIG': {'capacity': 10000, 'expiry': 60},
+    }
+}
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-websockets',
+        'OPTIONS': {'MAX_ENTRIES': 10_000_000},
+    }
+}
+
+application = URLRouter([
+    re_path(r'ws/dashboard/$', consumers.DashboardConsumer.as_asgi()),
+    re_path(r'ws/driver/$', consumers.DriverConsumer.as_asgi()),
+    re_path(r'ws/order/(?P<order_id>\d+)/$', consumers.OrderTrackingConsumer.as_asgi()),
+])
+
+
+def percentiles(samples):
+    """p50/p90/p99/max بالمللي ثانية"""
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] / 1e6
+
+    return {
+        'count': len(samples),
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'max': samples[-1] / 1e6,
+    }
+
+
+def rss_bytes():
+    """الذاكرة المقيمة الحالية (Linux) أو الذروة كبديل"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'قياس حمل WebSocket (لوحة التحكم، الموصلون، متابعة الطلبات) داخل عملية واحدة '
+        'عبر WebsocketCommunicator و InMemoryChannelLayer - بدون شبكة أو Redis أو قاعدة بيانات'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=500, help='عدد الموصلين (لكل موصل طلب واحد)')
+        parser.add_argument(
+            '--subscribers-per-order', type=int, default=2,
+            help='اتصالات متابعة لكل طلب (أجهزة/تبويبات العميل)'
+        )
+        parser.add_argument('--dashboards', type=int, default=10, help='اتصالات لوحة التحكم')
+        parser.add_argument('--pings', type=int, default=10, help='تحديثات الموقع لكل موصل')
+        parser.add_argument('--interval-ms', type=float, default=200, help='الفاصل بين تحديثات الموصل')
+        parser.add_argument('--dashboard-messages', type=int, default=10, help='رسائل stats_update للوحة التحكم')
+        parser.add_argument('--format', default='json', choices=['json', 'delta'], help='صيغة بث الموقع للمشتركين')
+        parser.add_argument(
+            '--location-rate-hz', type=float, default=0,
+            help='LOCATION_MAX_RATE_HZ أثناء القياس (0 = بدون تحديد معدل)'
+        )
+        parser.add_argument('--connect-concurrency', type=int, default=200, help='اتصالات متزامنة أثناء الإنشاء')
+        parser.add_argument('--timeout', type=float, default=10, help='مهلة الاتصال/الاستقبال بالثواني')
+        parser.add_argument('--tracemalloc', action='store_true', help='قياس ذاكرة Python لكل اتصال بدقة (أبطأ)')
+
+    def handle(self, *args, **options):
+        realtime_config = {
+            'LOCATION_MAX_RATE_HZ': options['location_rate_hz'],
+            'LOCATION_MIN_DISTANCE_M': 0,
+            'LOCATION_REPLAY_SIZE': 1,
+        }
+        realtime_logger = logging.getLogger(realtime_log.LOGGER_NAME)
+        previous_level = realtime_logger.level
+        # العدادات تعمل دائماً؛ أسطر السجل (آلاف الاتصالات) تُكتم أثناء القياس
+        realtime_logger.setLevel(logging.WARNING)
+        realtime_log.reset_metrics()
+        try:
+            with override_settings(
+                CHANNEL_LAYERS=BENCH_CHANNEL_LAYERS,
+                CACHES=BENCH_CACHES,
+                REALTIME_CONFIG=realtime_config,
+            ):
+                report = asyncio.run(self._run(options))
+        finally:
+            realtime_logger.setLevel(previous_level)
+        self._report(report, options)
+
+    # ===== الإعداد =====
+
+    def _make_users(self, options):
+        """مستخدمون غير محفوظين + كاش الصلاحيات، بحيث لا يلمس أي consumer قاعدة البيانات"""
+        next_id = iter(range(10_000_000, 100_000_000))
+        orders = []
+        for i in range(options['drivers']):
+            driver = User(id=next(next_id), email=f'driver-{i}@bench.local', is_delivery=True)
+            # لا يوجد DeliveryProfile: hasattr(user, 'deliveryprofile') بدون استعلام
+            driver._state.fields_cache['deliveryprofile'] = None
+            ws_auth_cache.set_driver_eligibility(driver.id, True)
+            order_id = next(next_id)
+            customer = User(id=next(next_id), email=f'customer-{i}@bench.local')
+            order_access.cache_order_parties(order_id, customer.id, None, driver.id)
+            orders.append((order_id, driver, [customer] * options['subscribers_per_order']))
+        staff = [
+            User(id=next(next_id), email=f'staff-{i}@bench.local', is_staff=True)
+            for i in range(options['dashboards'])
+        ]
+        return orders, staff
+
+    async def _connect(self, path, user, semaphore, stats, kind, timeout):
+        communicator = WebsocketCommunicator(application, path)
+        communicator.scope['user'] = user
+        async with semaphore:
+            started = time.perf_counter_ns()
+            connected, _ = await communicator.connect(timeout=timeout)
+            if connected:
+                # رسالة connection_established ضمن زمن الاتصال
+                await communicator.receive_output(timeout)
+            stats['connect'][kind].append(time.perf_counter_ns() - started)
+        if not connected:
+            stats['failed'][kind] += 1
+            return None
+        return communicator
+
+    # ===== القراءة =====
+
+    async def _read_locations(self, communicator, expected, stats, timeout):
+        received = 0
+        while received < expected:
+            try:
+                message = await communicator.receive_output(timeout)
+            except asyncio.TimeoutError:
+                stats['missed'] += expected - received
+                return
+            if message.get('type') != 'websocket.send':
+                return
+            frame = json.loads(message.get('text') or '{}')
+            ts = frame.get('ts')
+            if isinstance(ts, int) and not frame.get('replay') and not frame.get('r'):
+                stats['fanout'].append(time.perf_counter_ns() - ts)
+            received += 1
+
+    async def _read_dashboard(self, communicator, expected, stats, timeout):
+        for _ in range(expected):
+            try:
+                message = await communicator.receive_output(timeout)
+            except asyncio.TimeoutError:
+                stats['missed'] += 1
+                continue
+            payload = json.loads(message.get('text') or '{}')
+            ts = payload.get('stats', {}).get('ts')
+            if ts:
+                stats['dashboard'].append(time.perf_counter_ns() - ts)
+
+    # ===== الحركة =====
+
+    async def _drive(self, driver_comm, publisher, options, stats, order_index):
+        base_lat, base_lng = 15.0 + order_index * 1e-3, 44.0
+        interval = options['interval_ms'] / 1000.0
+        # توزيع البداية حتى لا تصل جميع التحديثات في نفس اللحظة
+        await asyncio.sleep((order_index % 100) / 100 * interval)
+        for i in range(options['pings']):
+            sent = time.perf_counter_ns()
+            await driver_comm.send_to(text_data=json.dumps({'type': 'ping', 'timestamp': sent}))
+            await publisher.send_to(text_data=json.dumps({
+                'type': 'location_update',
+                'lat': base_lat + i * 1e-4,
+                'lng': base_lng,
+                'speed': 30,
+                'heading': 90,
+                'ts': time.perf_counter_ns(),
+            }))
+            try:
+                pong = json.loads(await driver_comm.receive_from(options['timeout']))
+                stats['ping'].append(time.perf_counter_ns() - pong['timestamp'])
+            except asyncio.TimeoutError:
+                stats['missed'] += 1
+            await asyncio.sleep(interval)
+
+    async def _broadcast_dashboard(self, options):
+        from channels.layers import get_channel_layer
+        layer = get_channel_layer()
+        for _ in range(options['dashboard_messages']):
+            await layer.group_send('dashboard_updates', {
+                'type': 'stats_update',
+                'stats': {'ts': time.perf_counter_ns()},
+            })
+            await asyncio.sleep(options['interval_ms'] / 1000.0)
+
+    # ===== التشغيل =====
+
+    async def _run(self, options):
+        timeout = options['timeout']
+        stats = {
+            'connect': {'dashboard': [], 'driver': [], 'publisher': [], 'subscriber': []},
+            'failed': {'dashboard': 0, 'driver': 0, 'publisher': 0, 'subscriber': 0},
+            'fanout': [], 'ping': [], 'dashboard': [], 'missed': 0,
+        }
+        orders, staff = await asyncio.to_thread(self._make_users, options)
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        gc.collect()
+        if options['tracemalloc']:
+            tracemalloc.start()
+        mem_before = tracemalloc.get_traced_memory()[0] if options['tracemalloc'] else rss_bytes()
+
+        connect_started = time.perf_counter()
+        dashboards = await asyncio.gather(*[
+            self._connect('/ws/dashboard/', user, semaphore, stats, 'dashboard', timeout) for user in staff
+        ])
+        drivers = await asyncio.gather(*[
+            self._connect('/ws/driver/', driver, semaphore, stats, 'driver', timeout)
+            for _, driver, _ in orders
+        ])
+        query = f"?format={options['format']}&replay=0"
+        publishers = await asyncio.gather(*[
+            self._connect(f'/ws/order/{order_id}/{query}', driver, semaphore, stats, 'publisher', timeout)
+            for order_id, driver, _ in orders
+        ])
+        subscribers = await asyncio.gather(*[
+            asyncio.gather(*[
+                self._connect(f'/ws/order/{order_id}/{query}', customer, semaphore, stats, 'subscriber', timeout)
+                for customer in customers
+            ])
+            for order_id, _, customers in orders
+        ])
+        connect_elapsed = time.perf_counter() - connect_started
+
+        gc.collect()
+        mem_after = tracemalloc.get_traced_memory()[0] if options['tracemalloc'] else rss_bytes()
+        if options['tracemalloc']:
+            tracemalloc.stop()
+        all_connections = [
+            c for c in (*dashboards, *drivers, *publishers, *(s for subs in subscribers for s in subs)) if c
+        ]
+
+        # الناشر عضو في مجموعة الطلب أيضاً: يقرأ نسخته من البث
+        traffic_started = time.perf_counter()
+        readers = [
+            self._read_locations(subscriber, options['pings'], stats, timeout)
+            for subs in subscribers for subscriber in subs if subscriber
+        ]
+        readers += [
+            self._read_locations(publisher, options['pings'], {'fanout': [], 'missed': 0}, timeout)
+            for publisher in publishers if publisher
+        ]
+        readers += [
+            self._read_dashboard(dashboard, options['dashboard_messages'], stats, timeout)
+            for dashboard in dashboards if dashboard
+        ]
+        movers = [
+            self._drive(driver_comm, publisher, options, stats, index)
+            for index, (driver_comm, publisher) in enumerate(zip(drivers, publishers))
+            if driver_comm and publisher
+        ]
+        await asyncio.gather(*readers, *movers, self._broadcast_dashboard(options))
+        traffic_elapsed = time.perf_counter() - traffic_started
+
+        await asyncio.gather(*[c.disconnect() for c in all_connections], return_exceptions=True)
+
+        return {
+            'stats': stats,
+            'connections': len(all_connections),
+            'connect_elapsed': connect_elapsed,
+            'traffic_elapsed': traffic_elapsed,
+            'memory_delta': mem_after - mem_before,
+            'metrics': realtime_log.get_metrics()['counters'],
+        }
+
+    # ===== التقرير =====
+
+    def _line(self, label, samples):
+        summary = percentiles(samples)
+        if summary is None:
+            self.stdout.write(f'{label}: لا توجد عينات')
+            return
+        self.stdout.write(
+            f"{label}: n={summary['count']} p50={summary['p50']:.2f}ms p90={summary['p90']:.2f}ms "
+            f"p99={summary['p99']:.2f}ms max={summary['max']:.2f}ms"
+        )
+
+    def _report(self, report, options):
+        stats = report['stats']
+        connections = report['connections'] or 1
+        metrics = report['metrics']
+        frames = metrics.get('ws.order.frames_out', 0)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"=== {options['drivers']} موصل × {options['subscribers_per_order']} مشترك/طلب، "
+            f"{options['dashboards']} لوحة تحكم، format={options['format']} ==="
+        ))
+        self.stdout.write(
+            f"الاتصالات: {report['connections']} في {report['connect_elapsed']:.2f}s "
+            f"({report['connections'] / max(report['connect_elapsed'], 1e-9):,.0f} اتصال/ثانية) | "
+            f"فشل: {sum(stats['failed'].values())}"
+        )
+        for kind, samples in stats['connect'].items():
+            self._line(f'زمن الاتصال ({kind})', samples)
+        self._line('زمن بث الموقع (موصل → مشترك)', stats['fanout'])
+        self._line('ping/pong الموصل', stats['ping'])
+        self._line('بث لوحة التحكم', stats['dashboard'])
+        self.stdout.write(
+            f"الإطارات المرسلة: {frames} في {report['traffic_elapsed']:.2f}s "
+            f"({frames / max(report['traffic_elapsed'], 1e-9):,.0f} إطار/ثانية) | "
+            f"بايتات: {metrics.get('ws.order.bytes_out', 0):,} | مفقود: {stats['missed']}"
+        )
+        source = 'tracemalloc' if options['tracemalloc'] else 'RSS'
+        self.stdout.write(
+            f"الذاكرة لكل اتصال ({source}): {report['memory_delta'] / connections / 1024:.1f} KiB"
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core import image_gc
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed images (and their WebP variants) that no model references any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="List what would be deleted without deleting")
+        parser.add_argument("--min-age-hours", type=float, default=None,
+                            help="Keep unreferenced files newer than this (default: GC_MIN_AGE_S)")
+
+    def handle(self, *args, **options):
+        min_age = None if options["min_age_hours"] is None else int(options["min_age_hours"] * 3600)
+        result = image_gc.collect(min_age=min_age, dry_run=options["dry_run"])
+
+        if options["verbosity"] > 1:
+            for path in result.deleted:
+                self.stdout.write(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Image GC: {len(result.deleted)} {'would be deleted' if options['dry_run'] else 'deleted'}, "
+            f"{result.kept} kept of {result.scanned} content files ({result.bytes_freed} bytes)"
+        ))
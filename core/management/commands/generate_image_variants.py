@@ -0,0 +1,59 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core import image_variants
+from core.models import ImageAsset
+from products.models import Product, ProductImage, ProductVariant
+from stores.models import Store
+
+
+# حقول الصور المعروضة في القوائم
+IMAGE_FIELDS = [
+    (Product, 'cover_image_url'),
+    (ProductVariant, 'cover_image_url'),
+    (ProductImage, 'image_url'),
+    (Store, 'logo_url'),
+    (Store, 'cover_image_url'),
+]
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail/medium/WebP variants for images uploaded before the variants pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate variants that are already ready")
+        parser.add_argument("--async", dest="run_async", action="store_true",
+                            help="Schedule generation (VARIANT_QUEUE) instead of running it here")
+
+    def handle(self, *args, **options):
+        paths = set()
+        for model, field in IMAGE_FIELDS:
+            for url in model.objects.exclude(**{field: ''}).values_list(field, flat=True).distinct().iterator():
+                path = image_variants.storage_path(url)
+                if path:
+                    paths.add(path)
+
+        if not options["force"]:
+            ready = set(
+                ImageAsset.objects.filter(path__in=paths, status=ImageAsset.Status.READY)
+                .values_list('path', flat=True)
+            )
+            paths -= ready
+
+        generated = missing = failed = 0
+        for path in sorted(paths):
+            if not default_storage.exists(path):
+                missing += 1
+                continue
+            if options["run_async"]:
+                image_variants.schedule(path)
+                generated += 1
+            elif image_variants.generate(path, force=options["force"]):
+                generated += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Image variants: {generated} {'scheduled' if options['run_async'] else 'generated'}, "
+            f"{failed} failed, {missing} missing files"
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from products import search
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index (products/search.py) for all products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Products indexed per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+
+        terms = 0
+        for start in range(0, len(product_ids), batch_size):
+            terms += search.index_products(product_ids[start:start + batch_size], autocomplete=False)
+        search.invalidate_autocomplete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Search index: {len(product_ids)} products, {terms} terms"
+        ))
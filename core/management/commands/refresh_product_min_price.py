@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.min_price from variant prices (used by price ordering and facets)"
+
+    def handle(self, *args, **options):
+        updated = Product.refresh_min_price()
+        self.stdout.write(self.style.SUCCESS(f"min_price refreshed for {updated} products"))
@@ -0,0 +1,57 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class ImageAsset(models.Model):
+    """
+    نسخ مشتقة من صورة مرفوعة (مصغرة، متوسطة، كبيرة) بصيغة WebP تُولد في الخلفية
+    (core/image_variants.py). path هو مسار الأصل في التخزين.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('قيد التوليد')
+        READY = 'ready', _('جاهزة')
+        FAILED = 'failed', _('فشلت')
+
+    path = models.CharField(
+        max_length=500,
+        unique=True,
+        verbose_name=_('مسار الصورة الأصلية')
+    )
+    width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('العرض')
+    )
+    height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('الارتفاع')
+    )
+    variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('النسخ المشتقة'),
+        help_text=_('{"thumb": "<path>", "medium": "<path>", "large": "<path>"}')
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name=_('الحالة')
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('تاريخ الإنشاء')
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('تاريخ التحديث')
+    )
+
+    class Meta:
+        verbose_name = _('صورة مرفوعة')
+        verbose_name_plural = _('الصور المرفوعة')
+
+    def __str__(self):
+        return f"{self.path} ({self.status})"
@@ -1,4 +1,8 @@
-from rest_framework.pagination import CursorPagination
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
 from rest_framework.response import Response
 
 class CustomCursorPagination(CursorPagination):
@@ -17,3 +21,119 @@ class CustomCursorPagination(CursorPagination):
             'results': data,
             'count': len(data) if data else 0,
         })
+
+
+class KeysetCursorPagination(CustomCursorPagination):
+    """
+    Cursor على كل حقول الترتيب (keyset) بدلاً من الحقل الأول مع offset:
+    الموضع يحمل قيم جميع الحقول، والفلترة (a, id) < (va, vid) تبدأ من الفهرس
+    المركب مباشرة، فالصفحة العميقة بنفس تكلفة الأولى.
+
+    الترتيب يؤخذ من queryset (يحدده الـ view) وآخر حقل فيه يجب أن يكون فريداً
+    (id). الحقول لا تقبل NULL.
+
+    اختياري للتوافق مع العملاء الحاليين (Flutter): بدون ?cursor= أو ?page_size=
+    لا تقسيم والاستجابة مصفوفة كاملة كما كانت. مع أحدهما تكون
+    {next, previous, results} بدون count (كان طول الصفحة وليس الإجمالي).
+    """
+    opt_in_params = ('cursor', 'page_size')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(queryset.query.order_by)
+        return ordering or super().get_ordering(request, queryset, view)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(str(value))
+        return json.dumps(values)
+
+    def _keyset_filter(self, queryset, position, reverse):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        # (f1 op v1) OR (f1 = v1 AND f2 op v2) OR ...
+        condition, equal = Q(), Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        # حد للحقل الأول حتى يُستخدم الفهرس كمدى
+        first = self.ordering[0]
+        bound = 'lte' if first.startswith('-') != reverse else 'gte'
+        return queryset.filter(Q(**{f"{first.lstrip('-')}__{bound}": values[0]}) & condition)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not any(param in request.query_params for param in self.opt_in_params):
+            return None
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = self._keyset_filter(queryset, current_position, reverse)
+
+        # عنصر إضافي لمعرفة وجود صفحة تالية (بدون offset: المواضع فريدة)
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering)
+            if len(results) > len(self.page) else None
+        )
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else self.next_position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering) if self.page else self.previous_position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
@@ -0,0 +1,81 @@
+from rest_framework import serializers
+
+from . import image_variants
+
+
+class ImageVariantField(serializers.Field):
+    """
+    رابط صورة بالحجم المناسب للـ endpoint (thumb أو medium أو large) بدلاً من الأصل.
+
+    في القوائم (many=True) تُقرأ حالة النسخ لجميع عناصر الصفحة دفعة واحدة عند
+    أول عنصر؛ إذا لم تجهز النسخة بعد يُرجع الرابط الأصلي.
+    """
+
+    def __init__(self, size='medium', absolute=False, **kwargs):
+        kwargs['read_only'] = True
+        self.size = size
+        self.absolute = absolute
+        super().__init__(**kwargs)
+
+    def _memo(self):
+        root = self.root
+        # عناصر الصفحة كلها (نفس الحقل على كل عنصر) في قراءة واحدة
+        if isinstance(root, serializers.ListSerializer) and self.parent is root.child:
+            prime_variant_images(self, (id(root), self.field_name), root.instance or [], self.get_attribute)
+        return _variants_memo(self)
+
+    def to_representation(self, value):
+        if not value or not value.strip():
+            return None
+        memo = self._memo()
+        path = image_variants.storage_path(value)
+        if path and path not in memo:
+            memo.update(image_variants.get_variants([path]))
+        url = image_variants.resolve_urls([value], self.size, memo)[value]
+        request = self.context.get('request')
+        if self.absolute and request and not url.startswith('http'):
+            return request.build_absolute_uri(url)
+        return url
+
+
+def _variants_memo(serializer):
+    # في الـ context وليس على الـ root: serializers متداخلة تُنشأ داخل
+    # to_representation بنفس الـ context تشترك في نفس النتائج
+    return serializer.context.setdefault('_image_variants_memo', {})
+
+
+def prime_variant_images(serializer, key, objects, url_of):
+    """
+    قراءة حالة النسخ لروابط كل objects دفعة واحدة (مرة واحدة لكل key في الـ context).
+    url_of(obj) ترجع رابط الصورة للعنصر.
+    """
+    primed = serializer.context.setdefault('_image_variants_primed', set())
+    if key in primed:
+        return
+    primed.add(key)
+    memo = _variants_memo(serializer)
+    paths = []
+    for obj in objects:
+        try:
+            paths.append(image_variants.storage_path(url_of(obj)))
+        except Exception:
+            continue
+    memo.update(image_variants.get_variants([p for p in paths if p and p not in memo]))
+
+
+def variant_image_url(serializer, url, size, url_of=None):
+    """
+    نفس ImageVariantField لـ SerializerMethodField (رابط واحد).
+    url_of(obj): رابط الصورة لأي عنصر؛ في القوائم تُقرأ حالة النسخ لجميع العناصر
+    عند أول عنصر.
+    """
+    if not url:
+        return url
+    root = serializer.root
+    if url_of is not None and isinstance(root, serializers.ListSerializer) and serializer is root.child:
+        prime_variant_images(serializer, (id(root), url_of), root.instance or [], url_of)
+    memo = _variants_memo(serializer)
+    path = image_variants.storage_path(url)
+    if path and path not in memo:
+        memo.update(image_variants.get_variants([path]))
+    return image_variants.resolve_urls([url], size, memo)[url]
@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from . import image_gc, image_variants
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_image_variants_task(path):
+    """
+    مهمة توليد النسخ المشتقة لصورة مرفوعة (تُجدول من core.image_variants.schedule)
+    """
+    return image_variants.generate(path)
+
+
+@shared_task
+def collect_image_garbage_task():
+    """
+    مهمة حذف ملفات الصور غير المشار إليها (core/image_gc.py) - للجدولة الدورية
+    """
+    result = image_gc.collect()
+    return {'scanned': result.scanned, 'deleted': len(result.deleted), 'bytes_freed': result.bytes_freed}
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import User
+from products.models import Product
+from stores.models import Store
+
+from .pagination import KeysetCursorPagination
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# بريد الإشعارات داخل الاختبار (locmem outbox) بدلاً من وسيط Celery
+SYNC_EMAIL = {**settings.NOTIFICATIONS_CONFIG, 'EMAIL_QUEUE': 'sync'}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, NOTIFICATIONS_CONFIG=SYNC_EMAIL)
+class KeysetCursorPaginationTests(TestCase):
+    """الترقيم keyset على كل حقول الترتيب (core/pagination.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(email='owner@example.com', password='Passw0rd!x')
+        store = Store.objects.create(owner=owner, name='Store', description='d', status=Store.StoreStatus.ACTIVE)
+        # قيم ترتيب متساوية عبر حدود الصفحات
+        for rating in (5, 4, 4, 4, 4, 3, 3, 1):
+            Product.objects.create(store=store, name=f'product {rating}', average_rating=rating)
+        cls.queryset = Product.objects.order_by('-average_rating', '-id')
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def _page(self, url):
+        paginator = KeysetCursorPagination()
+        page = paginator.paginate_queryset(self.queryset, Request(self.factory.get(url)))
+        return paginator, page
+
+    def _ids(self, page):
+        return [product.pk for product in page]
+
+    def test_pages_forward_across_equal_sort_values(self):
+        expected = list(self.queryset.values_list('pk', flat=True))
+        seen, url = [], '/products/?page_size=3'
+        while url:
+            paginator, page = self._page(url)
+            seen.extend(self._ids(page))
+            url = paginator.get_next_link()
+        self.assertEqual(seen, expected)
+
+    def test_pages_back_with_previous_link(self):
+        expected = list(self.queryset.values_list('pk', flat=True))
+        pages, url = [], '/products/?page_size=3'
+        while url:
+            paginator, page = self._page(url)
+            pages.append(self._ids(page))
+            url = paginator.get_next_link()
+
+        # من الصفحة الأخيرة إلى الأولى بروابط previous
+        paginator, _ = self._page(self._last_page_url())
+        back = [pages[-1]]
+        url = paginator.get_previous_link()
+        while url:
+            paginator, page = self._page(url)
+            back.insert(0, self._ids(page))
+            url = paginator.get_previous_link()
+        self.assertEqual(back, pages)
+        self.assertEqual([pk for page in back for pk in page], expected)
+
+    def _last_page_url(self):
+        url, last = '/products/?page_size=3', None
+        while url:
+            last = url
+            url = self._page(url)[0].get_next_link()
+        return last
+
+    def test_first_page_has_no_previous_link(self):
+        paginator, page = self._page('/products/?page_size=3')
+        self.assertEqual(len(page), 3)
+        self.assertIsNone(paginator.get_previous_link())
+        self.assertIsNotNone(paginator.get_next_link())
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('garbage', 'cD1bIjEiXQ=='):  # غير قابل للفك / موضع بعدد حقول خاطئ
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(NotFound):
+                    self._page(f'/products/?cursor={cursor}')
+
+    def test_no_pagination_without_cursor_or_page_size(self):
+        paginator, page = self._page('/products/')
+        self.assertIsNone(page)
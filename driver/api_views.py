@@ -27,8 +27,8 @@ from project.driver_notifications_service import (
     notify_all_drivers
 )
 # ===== إضافة WebSocket للموصل - نهاية التعديل =====
+from project.ratelimit import ratelimit
 
-MAX_VERIFY_ATTEMPTS = 5
 # ثابت لمدة صلاحية رمز إعادة التعيين الذي سيتم إنشاؤه (مثلاً 10 دقائق)
 RESET_TOKEN_TIMEOUT_SECONDS = 10 * 60
 
@@ -37,6 +37,7 @@ RESET_TOKEN_TIMEOUT_SECONDS = 10 * 60
 class ApplyDeliveryView(APIView):
     """تطبيق الموصل للانضمام كسائق توصيل"""
     
+    @method_decorator(ratelimit('driver_apply'))
     def post(self, request):
         try:
             # استخراج البيانات من الطلب
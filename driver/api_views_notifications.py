@@ -5,10 +5,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.db.models import Q
 
+from . import notification_inbox
 from .models_notifications import DriverNotification, NotificationTemplate
 from .serializers_notifications import DriverNotificationSerializer
 
@@ -28,15 +26,13 @@ def get_driver_notifications(request):
             }, status=status.HTTP_403_FORBIDDEN)
         
         # معاملات الاستعلام
-        page = int(request.GET.get('page', 1))
         limit = min(int(request.GET.get('limit', 20)), 50)  # حد أقصى 50
+        cursor = request.GET.get('cursor')
         unread_only = request.GET.get('unread_only', 'false').lower() == 'true'
         notification_type = request.GET.get('type', None)
         
-        # بناء الاستعلام
-        queryset = DriverNotification.objects.filter(
-            driver=request.user
-        ).select_related('driver')
+        # بناء الاستعلام (مع استبعاد الإشعارات المنتهية الصلاحية)
+        queryset = notification_inbox.active_notifications(request.user.id)
         
         # تصفية الإشعارات غير المقروءة فقط
         if unread_only:
@@ -46,23 +42,38 @@ def get_driver_notifications(request):
         if notification_type:
             queryset = queryset.filter(notification_type=notification_type)
         
-        # استبعاد الإشعارات المنتهية الصلاحية
-        queryset = queryset.filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
-        )
-        
-        # ترقيم الصفحات
-        offset = (page - 1) * limit
-        total_count = queryset.count()
-        notifications = queryset[offset:offset + limit]
-        
-        # إحصائيات
-        unread_count = DriverNotification.objects.filter(
-            driver=request.user,
-            is_read=False
-        ).filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
-        ).count()
+        # إحصائيات من العدادات المخزنة
+        stats = notification_inbox.get_counts(request.user.id)
+        
+        if cursor is not None:
+            # ترقيم keyset: بدون COUNT ولا OFFSET
+            try:
+                notifications, next_cursor = notification_inbox.list_page(queryset, limit, cursor or None)
+            except ValueError:
+                return Response({
+                    'success': False,
+                    'message': 'قيمة cursor غير صالحة'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            pagination = {
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
+        else:
+            # ترقيم الصفحات (للتوافق مع الإصدارات السابقة من التطبيق)
+            page = int(request.GET.get('page', 1))
+            offset = (page - 1) * limit
+            if unread_only or notification_type:
+                total_count = queryset.count()
+            else:
+                total_count = stats['total_count']
+            notifications = queryset.order_by('-created_at', '-id')[offset:offset + limit]
+            pagination = {
+                'current_page': page,
+                'total_pages': (total_count + limit - 1) // limit,
+                'total_count': total_count,
+                'has_next': offset + limit < total_count,
+                'has_previous': page > 1
+            }
         
         # تسلسل البيانات
         serializer = DriverNotificationSerializer(notifications, many=True)
@@ -71,17 +82,8 @@ def get_driver_notifications(request):
             'success': True,
             'data': {
                 'notifications': serializer.data,
-                'pagination': {
-                    'current_page': page,
-                    'total_pages': (total_count + limit - 1) // limit,
-                    'total_count': total_count,
-                    'has_next': offset + limit < total_count,
-                    'has_previous': page > 1
-                },
-                'stats': {
-                    'unread_count': unread_count,
-                    'total_count': total_count
-                }
+                'pagination': pagination,
+                'stats': stats
             }
         })
         
@@ -106,23 +108,14 @@ def mark_notification_as_read(request, notification_id):
                 'message': 'غير مصرح لك بالوصول لهذه البيانات'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # البحث عن الإشعار
-        notification = get_object_or_404(
-            DriverNotification,
-            id=notification_id,
-            driver=request.user
-        )
-        
-        # تمييز كمقروء
-        notification.mark_as_read()
-        
-        # إحصائيات محدثة
-        unread_count = DriverNotification.objects.filter(
-            driver=request.user,
-            is_read=False
-        ).filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
-        ).count()
+        # تمييز كمقروء بـ UPDATE مشروط (بدون تحميل الإشعار)
+        found, counts = notification_inbox.mark_read(request.user.id, notification_id)
+        if not found:
+            return Response({
+                'success': False,
+                'message': 'الإشعار غير موجود'
+            }, status=status.HTTP_404_NOT_FOUND)
+        unread_count = counts['unread_count']
         
         return Response({
             'success': True,
@@ -154,15 +147,7 @@ def mark_all_notifications_as_read(request):
             }, status=status.HTTP_403_FORBIDDEN)
         
         # تحديث جميع الإشعارات غير المقروءة
-        updated_count = DriverNotification.objects.filter(
-            driver=request.user,
-            is_read=False
-        ).filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
-        ).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+        updated_count, counts = notification_inbox.mark_all_read(request.user.id)
         
         return Response({
             'success': True,
@@ -194,23 +179,14 @@ def delete_notification(request, notification_id):
                 'message': 'غير مصرح لك بالوصول لهذه البيانات'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # البحث عن الإشعار
-        notification = get_object_or_404(
-            DriverNotification,
-            id=notification_id,
-            driver=request.user
-        )
-        
         # حذف الإشعار
-        notification.delete()
-        
-        # إحصائيات محدثة
-        unread_count = DriverNotification.objects.filter(
-            driver=request.user,
-            is_read=False
-        ).filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
-        ).count()
+        found, counts = notification_inbox.delete_notification(request.user.id, notification_id)
+        if not found:
+            return Response({
+                'success': False,
+                'message': 'الإشعار غير موجود'
+            }, status=status.HTTP_404_NOT_FOUND)
+        unread_count = counts['unread_count']
         
         return Response({
             'success': True,
@@ -241,20 +217,10 @@ def get_notifications_count(request):
                 'message': 'غير مصرح لك بالوصول لهذه البيانات'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # عدد الإشعارات غير المقروءة
-        unread_count = DriverNotification.objects.filter(
-            driver=request.user,
-            is_read=False
-        ).filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
-        ).count()
-        
-        # إجمالي الإشعارات
-        total_count = DriverNotification.objects.filter(
-            driver=request.user
-        ).filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
-        ).count()
+        # العدادات المخزنة (تُحدَّث أيضاً عبر WebSocket: notifications_count)
+        counts = notification_inbox.get_counts(request.user.id)
+        unread_count = counts['unread_count']
+        total_count = counts['total_count']
         
         return Response({
             'success': True,
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DriverConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "driver"
+
+    def ready(self):
+        """تحميل signals عند بدء التطبيق"""
+        import driver.signals  # إبطال كاش مصادقة WebSocket
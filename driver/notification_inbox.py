@@ -0,0 +1,241 @@
+"""
+صندوق إشعارات الموصل: عدادات مخزنة وتحديثات مجمعة
+
+- عدد غير المقروء والإجمالي لكل موصل في الكاش (مفتاحان قابلان لـ incr/decr)،
+  يُحسبان من قاعدة البيانات في استعلام aggregate واحد عند غيابهما فقط.
+- مدة صلاحية العداد لا تتجاوز أقرب expires_at، حتى لا يحسب إشعارات انتهت صلاحيتها.
+- الإنشاء (signals) والقراءة والحذف تعدّل العداد مباشرة؛ المسارات المجمعة
+  (إشعار جميع الموصلين) تحذف العدادات في طلب واحد ليُعاد حسابها عند الحاجة.
+- كل تغيير يُدفع للموصل عبر WebSocket (notifications_count) بدلاً من polling.
+"""
+import base64
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models_notifications import DriverNotification
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNTER_TTL = 60 * 10
+
+UNREAD_KEY = 'driver:inbox:unread:{driver_id}'
+TOTAL_KEY = 'driver:inbox:total:{driver_id}'
+
+
+def get_counter_ttl():
+    config = getattr(settings, 'REALTIME_CONFIG', {})
+    return int(config.get('DRIVER_INBOX_COUNTER_TTL', DEFAULT_COUNTER_TTL))
+
+
+def active_notifications(driver_id):
+    """إشعارات الموصل غير المنتهية الصلاحية"""
+    return DriverNotification.objects.filter(driver_id=driver_id).filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
+    )
+
+
+# ===== العدادات =====
+
+def _keys(driver_id):
+    return UNREAD_KEY.format(driver_id=driver_id), TOTAL_KEY.format(driver_id=driver_id)
+
+
+def recount(driver_id):
+    """حساب العدادات من قاعدة البيانات (استعلام واحد) وتخزينها"""
+    now = timezone.now()
+    stats = active_notifications(driver_id).aggregate(
+        unread=Count('id', filter=Q(is_read=False)),
+        total=Count('id'),
+        next_expiry=Min('expires_at'),
+    )
+    counts = {'unread_count': stats['unread'], 'total_count': stats['total']}
+
+    ttl = get_counter_ttl()
+    if stats['next_expiry']:
+        ttl = min(ttl, max(1, int((stats['next_expiry'] - now).total_seconds())))
+    unread_key, total_key = _keys(driver_id)
+    try:
+        cache.set_many({unread_key: counts['unread_count'], total_key: counts['total_count']}, ttl)
+    except Exception as e:
+        logger.warning(f'driver inbox counter set failed for {driver_id}: {e}')
+    return counts
+
+
+def get_counts(driver_id):
+    """{'unread_count', 'total_count'} من الكاش أو بإعادة الحساب"""
+    unread_key, total_key = _keys(driver_id)
+    try:
+        cached = cache.get_many([unread_key, total_key])
+    except Exception as e:
+        logger.warning(f'driver inbox counter get failed for {driver_id}: {e}')
+        cached = {}
+    if unread_key in cached and total_key in cached:
+        return {
+            'unread_count': max(0, cached[unread_key]),
+            'total_count': max(0, cached[total_key]),
+        }
+    return recount(driver_id)
+
+
+def _adjust(driver_id, unread=0, total=0):
+    """تعديل العدادات المخزنة؛ إذا كانت غير موجودة تُترك لإعادة الحساب"""
+    unread_key, total_key = _keys(driver_id)
+    try:
+        for key, delta in ((unread_key, unread), (total_key, total)):
+            if delta:
+                cache.incr(key, delta)
+    except ValueError:
+        # أحد المفتاحين غير موجود: حذف الآخر حتى لا يبقى عداد جزئي
+        invalidate(driver_id)
+    except Exception as e:
+        logger.warning(f'driver inbox counter update failed for {driver_id}: {e}')
+        invalidate(driver_id)
+
+
+def invalidate(driver_id):
+    try:
+        cache.delete_many(_keys(driver_id))
+    except Exception as e:
+        logger.warning(f'driver inbox counter invalidation failed for {driver_id}: {e}')
+
+
+def invalidate_many(driver_ids):
+    """حذف عدادات عدة موصلين في طلب واحد (بعد bulk_create)"""
+    keys = [key for driver_id in driver_ids for key in _keys(driver_id)]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f'driver inbox counter invalidation failed for {len(driver_ids)} drivers: {e}')
+
+
+async def ainvalidate_many(driver_ids):
+    """نسخة async من invalidate_many"""
+    keys = [key for driver_id in driver_ids for key in _keys(driver_id)]
+    if not keys:
+        return
+    try:
+        await cache.adelete_many(keys)
+    except Exception as e:
+        logger.warning(f'driver inbox counter invalidation failed for {len(driver_ids)} drivers: {e}')
+
+
+def record_created(driver_id, is_read=False, expires_at=None):
+    """
+    إشعار جديد (بعد الـ commit). إشعار له expires_at يحذف العدادات بدلاً من
+    زيادتها: إعادة الحساب تقصّر مدة صلاحيتها حتى لا يُحسب بعد انتهائه.
+    """
+    if expires_at is not None:
+        invalidate(driver_id)
+        return
+    _adjust(driver_id, unread=0 if is_read else 1, total=1)
+
+
+def record_deleted(driver_id, was_read):
+    _adjust(driver_id, unread=0 if was_read else -1, total=-1)
+
+
+# ===== دفع العدادات عبر WebSocket =====
+
+def push_counts(driver_id, counts=None):
+    """إرسال العدادات الحالية لاتصال الموصل"""
+    from project.driver_notifications_service import driver_notification_service
+
+    counts = counts or get_counts(driver_id)
+    driver_notification_service.send_to_driver(driver_id, 'notifications_count', counts)
+    return counts
+
+
+def push_broadcast_delta(unread=1, total=1):
+    """إشعار جميع الموصلين بإضافة إشعار عام (بدون حساب عداد كل موصل)"""
+    from project.driver_notifications_service import driver_notification_service
+
+    driver_notification_service.send_to_all_drivers('notifications_count', {
+        'unread_delta': unread,
+        'total_delta': total,
+    })
+
+
+# ===== العمليات المجمعة =====
+
+def mark_read(driver_id, notification_id):
+    """
+    تمييز إشعار واحد كمقروء بـ UPDATE مشروط.
+    ترجع (found, counts)؛ found=False إذا لم يكن الإشعار للموصل.
+    """
+    updated = DriverNotification.objects.filter(
+        id=notification_id, driver_id=driver_id, is_read=False
+    ).update(is_read=True, read_at=timezone.now())
+    if updated:
+        _adjust(driver_id, unread=-1)
+        return True, push_counts(driver_id)
+    exists = DriverNotification.objects.filter(id=notification_id, driver_id=driver_id).exists()
+    return exists, get_counts(driver_id)
+
+
+def mark_all_read(driver_id):
+    """تمييز جميع الإشعارات كمقروءة بـ UPDATE واحد. ترجع (updated_count, counts)"""
+    updated = active_notifications(driver_id).filter(is_read=False).update(
+        is_read=True, read_at=timezone.now()
+    )
+    counts = get_counts(driver_id)
+    if updated or counts['unread_count']:
+        unread_key, _ = _keys(driver_id)
+        try:
+            cache.set(unread_key, 0, get_counter_ttl())
+        except Exception as e:
+            logger.warning(f'driver inbox counter set failed for {driver_id}: {e}')
+            invalidate(driver_id)
+        counts = push_counts(driver_id, {**counts, 'unread_count': 0})
+    return updated, counts
+
+
+def delete_notification(driver_id, notification_id):
+    """حذف إشعار (استعلام قراءة حالة واحد + DELETE). ترجع (found, counts)"""
+    is_read = (
+        DriverNotification.objects.filter(id=notification_id, driver_id=driver_id)
+        .values_list('is_read', flat=True).first()
+    )
+    if is_read is None:
+        return False, get_counts(driver_id)
+    # الحذف بـ QuerySet.delete لا يرسل post_delete لكل صف، لذا يُعدّل العداد هنا
+    deleted, _ = DriverNotification.objects.filter(id=notification_id, driver_id=driver_id).delete()
+    if deleted:
+        record_deleted(driver_id, was_read=is_read)
+    return True, push_counts(driver_id)
+
+
+# ===== الترقيم keyset =====
+
+def encode_cursor(notification):
+    raw = f'{notification.created_at.isoformat()}|{notification.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(created_at, id) أو ValueError"""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except Exception as e:
+        raise ValueError('invalid cursor') from e
+
+
+def list_page(queryset, limit, cursor=None):
+    """
+    صفحة keyset على (created_at, id) تنازلياً - تستخدم فهرس (driver, -created_at)
+    بدون COUNT ولا OFFSET. ترجع (items, next_cursor).
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    items = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
@@ -0,0 +1,56 @@
+"""
+إشارات تطبيق الموصلين: إبطال كاش مصادقة WebSocket عند تغيّر المستخدم أو ملف الموصل،
+وتحديث عدادات صندوق الإشعارات عند إنشاء إشعار
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import User
+from project import ws_auth_cache
+from . import notification_inbox
+from .models import DeliveryProfile
+from .models_notifications import DriverNotification
+
+# حقول تتغير باستمرار ولا تؤثر على صلاحية الاتصال
+USER_VOLATILE_FIELDS = {'last_login'}
+# حقول ملف الموصل التي تحدد أهلية الاتصال
+DRIVER_ELIGIBILITY_FIELDS = {'verification_status', 'suspended'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_ws_auth(sender, instance, **kwargs):
+    """إبطال نسخة المستخدم المخزنة لاتصالات WebSocket"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= USER_VOLATILE_FIELDS:
+        return
+    ws_auth_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=DeliveryProfile)
+@receiver(post_delete, sender=DeliveryProfile)
+def invalidate_driver_ws_auth(sender, instance, **kwargs):
+    """إبطال نتيجة أهلية الموصل عند تغيّر حالة التحقق أو الإيقاف"""
+    update_fields = kwargs.get('update_fields')
+    # تحديثات الموقع وآخر ظهور لا تغيّر الأهلية
+    if update_fields and not (set(update_fields) & DRIVER_ELIGIBILITY_FIELDS):
+        return
+    ws_auth_cache.invalidate_driver(instance.user_id)
+
+
+@receiver(post_save, sender=DriverNotification)
+def count_new_driver_notification(sender, instance, created, **kwargs):
+    """
+    زيادة عدادات الموصل ودفعها بعد الـ commit فقط، حتى لا يبقى إشعار تراجعت
+    معاملته في العداد (bulk_create لا يمر من هنا)
+    """
+    if not created:
+        return
+    driver_id, is_read, expires_at = instance.driver_id, instance.is_read, instance.expires_at
+
+    def record():
+        notification_inbox.record_created(driver_id, is_read=is_read, expires_at=expires_at)
+        notification_inbox.push_counts(driver_id)
+
+    transaction.on_commit(record)
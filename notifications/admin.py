@@ -2,32 +2,34 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Notification, FCMDevice, NotificationTemplate
+from .models import Notification, NotificationMessage, FCMDevice, NotificationTemplate
+from . import summary
 
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     """إدارة الإشعارات في لوحة الإدارة"""
     list_display = [
-        'title', 'user_email', 'type', 'priority', 'is_read', 
+        'display_title', 'user_email', 'type', 'priority', 'is_read', 
         'created_at', 'read_status_badge'
     ]
     list_filter = [
         'type', 'priority', 'is_read', 'created_at'
     ]
     search_fields = [
-        'title', 'body', 'user__email', 'user__name'
+        'title', 'body', 'message__title', 'user__email', 'user__name'
     ]
     readonly_fields = [
         'created_at', 'read_at', 'read_status_badge'
     ]
+    raw_id_fields = ['message']
     list_per_page = 25
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
     
     fieldsets = (
         ('معلومات أساسية', {
-            'fields': ('user', 'title', 'body', 'type', 'priority')
+            'fields': ('user', 'message', 'title', 'body', 'type', 'priority')
         }),
         ('بيانات إضافية', {
             'fields': ('data', 'image_url', 'related_id'),
@@ -65,23 +67,43 @@ class NotificationAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         """تحسين الاستعلامات"""
-        return super().get_queryset(request).select_related('user')
+        return super().get_queryset(request).select_related('user', 'message')
+    
+    def display_title(self, obj):
+        return obj.content.title
+    display_title.short_description = 'العنوان'
     
     actions = ['mark_as_read', 'mark_as_unread']
     
     def mark_as_read(self, request, queryset):
         """تعليم الإشعارات المحددة كمقروءة"""
+        user_ids = summary.affected_users(queryset)
         updated = queryset.update(is_read=True)
+        summary.invalidate(user_ids)
         self.message_user(request, f'تم تعليم {updated} إشعار كمقروء')
     mark_as_read.short_description = 'تعليم كمقروء'
     
     def mark_as_unread(self, request, queryset):
         """تعليم الإشعارات المحددة كغير مقروءة"""
+        user_ids = summary.affected_users(queryset)
         updated = queryset.update(is_read=False, read_at=None)
+        summary.invalidate(user_ids)
         self.message_user(request, f'تم تعليم {updated} إشعار كغير مقروء')
     mark_as_unread.short_description = 'تعليم كغير مقروء'
 
 
+@admin.register(NotificationMessage)
+class NotificationMessageAdmin(admin.ModelAdmin):
+    """الرسائل الجماعية (المحتوى المشترك بين المستلمين)"""
+    list_display = ['title', 'type', 'priority', 'recipients_count', 'created_at']
+    list_filter = ['type', 'priority', 'created_at']
+    search_fields = ['title', 'body']
+    readonly_fields = ['recipients_count', 'created_at']
+    list_per_page = 25
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+
+
 @admin.register(FCMDevice)
 class FCMDeviceAdmin(admin.ModelAdmin):
     """إدارة أجهزة FCM في لوحة الإدارة"""
@@ -0,0 +1,263 @@
+"""
+تحليل الجمهور على دفعات (streaming) للإشعارات الجماعية
+
+بدلاً من تحميل جميع معرفات المستخدمين في الذاكرة:
+- تُقرأ المعرفات بترقيم keyset (id > آخر معرف) على دفعات ثابتة الحجم
+- يُخزن محتوى الإشعار مرة واحدة (NotificationMessage)، وتُنشأ لكل دفعة صفوف
+  Notification خفيفة (user_id + message + حالة القراءة) بـ bulk_create
+- يُجدول إرسال FCM لكل دفعة كمهمة Celery مستقلة
+
+الذاكرة والزمن لكل دفعة ثابتان مهما كبر عدد المستخدمين.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from . import summary
+from .models import Notification, NotificationMessage, NotificationType, NotificationPriority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUDIENCE_CHUNK_SIZE = 1000
+
+
+def get_chunk_size():
+    config = getattr(settings, 'NOTIFICATIONS_CONFIG', {})
+    return int(config.get('AUDIENCE_CHUNK_SIZE', DEFAULT_AUDIENCE_CHUNK_SIZE))
+
+
+def customers_queryset():
+    """الجمهور الافتراضي للإعلانات: العملاء النشطون (بدون البائعين والموظفين)"""
+    User = get_user_model()
+    return User.objects.filter(is_active=True, is_vendor=False, is_staff=False)
+
+
+def iter_row_chunks(queryset, fields=(), chunk_size=None, after_id=None):
+    """
+    قراءة صفوف QuerySet على دفعات بترقيم keyset، كل عنصر (pk, *fields).
+    كل دفعة استعلام مستقل على فهرس المفتاح الأساسي (لا OFFSET ولا cursor مفتوح).
+    after_id: البدء بعد هذا المعرف (استئناف إرسال متوقف).
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    rows_qs = queryset.order_by('pk').values_list('pk', *fields)
+    last_id = after_id
+    while True:
+        page = rows_qs if last_id is None else rows_qs.filter(pk__gt=last_id)
+        chunk = list(page[:chunk_size].iterator())
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def iter_id_chunks(queryset, chunk_size=None, after_id=None):
+    """معرفات فقط من iter_row_chunks"""
+    for chunk in iter_row_chunks(queryset, (), chunk_size, after_id):
+        yield [row[0] for row in chunk]
+
+
+async def aiter_id_chunks(queryset, chunk_size=None):
+    """نسخة async من iter_id_chunks"""
+    chunk_size = chunk_size or get_chunk_size()
+    ids_qs = queryset.order_by('pk').values_list('pk', flat=True)
+    last_id = None
+    while True:
+        page = ids_qs if last_id is None else ids_qs.filter(pk__gt=last_id)
+        chunk = [pk async for pk in page[:chunk_size]]
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]
+
+
+def iter_list_chunks(ids, chunk_size=None):
+    """تقسيم قائمة معرفات جاهزة إلى دفعات"""
+    chunk_size = chunk_size or get_chunk_size()
+    ids = list(ids)
+    for i in range(0, len(ids), chunk_size):
+        yield ids[i:i + chunk_size]
+
+
+def build_notifications(
+    user_ids,
+    title,
+    body,
+    notification_type=NotificationType.SYSTEM,
+    priority=NotificationPriority.NORMAL,
+    data=None,
+    image_url=None,
+    related_id=None
+):
+    """كائنات الإشعارات (غير محفوظة) لدفعة معرفات"""
+    return [
+        Notification(
+            user_id=user_id,
+            title=title,
+            body=body,
+            type=notification_type,
+            priority=priority,
+            data=data or {},
+            image_url=image_url,
+            related_id=related_id
+        )
+        for user_id in user_ids
+    ]
+
+
+def _record_chunk(notifications):
+    """تحديث ملخصات المستخدمين (الدفعة بنفس النوع والأولوية)"""
+    if notifications:
+        summary.record_created(
+            [notification.user_id for notification in notifications],
+            notifications[0].type, notifications[0].priority
+        )
+
+
+def create_notifications_chunk(user_ids, *args, **kwargs):
+    """إنشاء إشعارات دفعة واحدة مباشرة بـ user_id"""
+    notifications = Notification.objects.bulk_create(build_notifications(user_ids, *args, **kwargs))
+    _record_chunk(notifications)
+    return notifications
+
+
+async def acreate_notifications_chunk(user_ids, *args, **kwargs):
+    """نسخة async من create_notifications_chunk"""
+    notifications = await Notification.objects.abulk_create(build_notifications(user_ids, *args, **kwargs))
+    await sync_to_async(_record_chunk, thread_sensitive=False)(notifications)
+    return notifications
+
+
+# ===== الرسائل الجماعية: المحتوى مرة واحدة + صف خفيف لكل مستلم =====
+
+def build_message(
+    title,
+    body,
+    notification_type=NotificationType.SYSTEM,
+    priority=NotificationPriority.NORMAL,
+    data=None,
+    image_url=None,
+    related_id=None
+):
+    """رسالة جماعية (غير محفوظة)"""
+    return NotificationMessage(
+        title=title,
+        body=body,
+        type=notification_type,
+        priority=priority,
+        data=data or {},
+        image_url=image_url,
+        related_id=related_id
+    )
+
+
+def build_deliveries(user_ids, message):
+    """صفوف الاستلام (بدون نسخ المحتوى) - النوع والأولوية للفلترة والملخص"""
+    return [
+        Notification(
+            user_id=user_id,
+            message=message,
+            type=message.type,
+            priority=message.priority
+        )
+        for user_id in user_ids
+    ]
+
+
+def create_deliveries_chunk(user_ids, message):
+    """إنشاء صفوف استلام دفعة واحدة لرسالة محفوظة"""
+    notifications = Notification.objects.bulk_create(build_deliveries(user_ids, message))
+    _record_chunk(notifications)
+    return notifications
+
+
+async def acreate_deliveries_chunk(user_ids, message):
+    """نسخة async من create_deliveries_chunk"""
+    notifications = await Notification.objects.abulk_create(build_deliveries(user_ids, message))
+    await sync_to_async(_record_chunk, thread_sensitive=False)(notifications)
+    return notifications
+
+
+def finish_message(message, recipients_count):
+    """تسجيل عدد المستلمين بعد آخر دفعة"""
+    NotificationMessage.objects.filter(pk=message.pk).update(recipients_count=recipients_count)
+    message.recipients_count = recipients_count
+
+
+def enqueue_or_run(task, *args):
+    """
+    جدولة مهمة Celery، وإذا لم يكن الوسيط متاحاً يتم تنفيذها مباشرة.
+    """
+    try:
+        task.delay(*args)
+    except Exception as e:
+        logger.warning(f"Could not enqueue {task.name} ({e}); running inline")
+        try:
+            task(*args)
+        except Exception as inline_error:
+            logger.error(f"Inline run of {task.name} failed: {inline_error}")
+
+
+def enqueue_push_chunk(user_ids, title, body, data=None, image_url=None):
+    """جدولة إرسال FCM لدفعة واحدة"""
+    from .tasks import send_fcm_chunk_task
+    enqueue_or_run(send_fcm_chunk_task, list(user_ids), title, body, data, image_url)
+
+
+def enqueue_personalized_push_chunk(rendered, data=None, image_url=None):
+    """جدولة إرسال FCM مخصص (عنوان/محتوى لكل مستخدم) لدفعة واحدة"""
+    from .tasks import send_fcm_personalized_chunk_task
+    enqueue_or_run(send_fcm_personalized_chunk_task, [list(row) for row in rendered], data, image_url)
+
+
+def send_to_audience(
+    queryset,
+    title,
+    body,
+    notification_type=NotificationType.SYSTEM,
+    priority=NotificationPriority.NORMAL,
+    data=None,
+    image_url=None,
+    related_id=None,
+    send_fcm=True,
+    chunk_size=None,
+    progress=None
+):
+    """
+    إرسال إشعار لجمهور (QuerySet مستخدمين) على دفعات.
+    ترجع عدد الإشعارات المنشأة.
+
+    progress: dict يُحدّث بعد كل دفعة ناجحة {'message_id', 'last_id', 'total'}.
+    تمرير progress من محاولة سابقة يستأنف بعد آخر دفعة بنفس الرسالة، فلا
+    تُكرر الإشعارات ولا الـ push للدفعات التي نجحت.
+    """
+    from .firebase_config import is_fcm_enabled
+
+    progress = progress if progress is not None else {}
+    push = send_fcm and is_fcm_enabled()
+    message = None
+    if progress.get('message_id'):
+        message = NotificationMessage.objects.filter(pk=progress['message_id']).first()
+    total = progress.get('total', 0) if message is not None else 0
+    after_id = progress.get('last_id') if message is not None else None
+    chunks = 0
+    for user_ids in iter_id_chunks(queryset, chunk_size, after_id=after_id):
+        if message is None:
+            message = build_message(title, body, notification_type, priority, data, image_url, related_id)
+            message.save()
+        create_deliveries_chunk(user_ids, message)
+        if push:
+            enqueue_push_chunk(user_ids, title, body, data, image_url)
+        total += len(user_ids)
+        chunks += 1
+        progress.update(message_id=message.pk, last_id=user_ids[-1], total=total)
+
+    if message is not None:
+        finish_message(message, total)
+    logger.info(f"Audience notification '{title}' created for {total} users in {chunks} chunks")
+    return total
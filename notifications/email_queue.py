@@ -0,0 +1,274 @@
+"""
+طابور إرسال البريد الإلكتروني (الإشعارات و OTP)
+
+الطلب لا ينتظر SMTP: send_email() يضع الرسالة في طابور ويرجع مباشرة، وthread
+خلفي في نفس العملية يجمع الرسائل في دفعات (EMAIL_BATCH_SIZE أو بعد
+EMAIL_BATCH_WAIT_MS).
+- 'celery' (افتراضي): كل دفعة مهمة send_emails_task واحدة وتبقى في الوسيط حتى
+  يرسلها العامل (مع الإرسال من الـ thread إذا لم يكن الوسيط متاحاً). الرسائل لا
+  تبقى في ذاكرة العملية إلا مدة تجميع الدفعة. إعادة المحاولة عبر self.retry بما
+  لم يُرسل فقط (EMAIL_TASK_MAX_RETRIES)، بدون انتظار يشغل العامل.
+- 'thread': الـ thread يرسل الدفعات بنفسه. بدون وسيط، لكن ما في الطابور يضيع إذا
+  توقفت العملية أو انهارت قبل الإرسال (بما فيه رموز OTP).
+- 'sync': إرسال مباشر داخل الطلب (للتشخيص).
+
+في كل عملية اتصال SMTP واحد مفتوح (get_connection) يُعاد استخدامه بين الدفعات
+ويُغلق بعد EMAIL_IDLE_CLOSE_S ثانية بدون إرسال؛ عند الفشل يُعاد فتحه مع backoff.
+الدفعة تُرسل رسالة رسالة على نفس الاتصال، فإعادة المحاولة تبدأ من أول رسالة لم
+تُرسل ولا تتكرر رسائل وصلت.
+
+للتطوير والاختبار: EMAIL_BACKEND = console أو filebased (EMAIL_FILE_PATH) في الإعدادات.
+
+    NOTIFICATIONS_CONFIG = {
+        'EMAIL_QUEUE': 'celery',
+        'EMAIL_BATCH_SIZE': 50,
+        'EMAIL_BATCH_WAIT_MS': 200,
+        'EMAIL_MAX_RETRIES': 3,
+        'EMAIL_RETRY_BACKOFF_S': 2,
+        'EMAIL_RETRY_MAX_DELAY_S': 300,
+        'EMAIL_TASK_MAX_RETRIES': 8,
+        'EMAIL_IDLE_CLOSE_S': 60,
+    }
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'EMAIL_QUEUE': 'celery',
+    'EMAIL_BATCH_SIZE': 50,
+    'EMAIL_BATCH_WAIT_MS': 200,
+    'EMAIL_MAX_RETRIES': 3,
+    'EMAIL_RETRY_BACKOFF_S': 2,
+    'EMAIL_RETRY_MAX_DELAY_S': 300,
+    'EMAIL_TASK_MAX_RETRIES': 8,
+    'EMAIL_IDLE_CLOSE_S': 60,
+}
+
+
+def _get_config(name):
+    return getattr(settings, 'NOTIFICATIONS_CONFIG', {}).get(name, DEFAULTS[name])
+
+
+def get_retry_delay(attempt):
+    """backoff أسي للمحاولة attempt (من 0) بحد أقصى EMAIL_RETRY_MAX_DELAY_S"""
+    backoff = float(_get_config('EMAIL_RETRY_BACKOFF_S'))
+    return min(backoff * (2 ** attempt), float(_get_config('EMAIL_RETRY_MAX_DELAY_S')))
+
+
+def get_task_max_retries():
+    return int(_get_config('EMAIL_TASK_MAX_RETRIES'))
+
+
+def build_payload(to, subject, body, html=None, from_email=None):
+    """رسالة بصيغة قابلة للتسلسل (JSON) لتمريرها إلى Celery"""
+    return {
+        'to': [to] if isinstance(to, str) else list(to),
+        'subject': subject,
+        'body': body,
+        'html': html,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+    }
+
+
+def build_message(payload, connection=None):
+    message = EmailMultiAlternatives(
+        subject=payload['subject'],
+        body=payload['body'],
+        from_email=payload['from_email'],
+        to=payload['to'],
+        connection=connection,
+    )
+    if payload.get('html'):
+        message.attach_alternative(payload['html'], 'text/html')
+    return message
+
+
+class EmailBatchError(Exception):
+    """فشل دفعة بعد استنفاد المحاولات؛ unsent = الرسائل التي لم تُرسل"""
+
+    def __init__(self, sent, unsent):
+        super().__init__(f'{len(unsent)} emails not sent')
+        self.sent = sent
+        self.unsent = unsent
+
+
+class PooledMailer:
+    """اتصال بريد واحد لكل عملية، يُفتح عند الحاجة ويُعاد استخدامه"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connection = None
+        self._last_used = 0.0
+
+    def _open(self):
+        if self._connection is None:
+            self._connection = get_connection(fail_silently=False)
+            self._connection.open()
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def close_if_idle(self):
+        with self._lock:
+            if self._connection is not None and time.monotonic() - self._last_used > _get_config('EMAIL_IDLE_CLOSE_S'):
+                self._close()
+
+    def send_batch(self, payloads, retries=None):
+        """
+        إرسال دفعة عبر الاتصال المشترك رسالة رسالة، مع إعادة المحاولة (backoff
+        أسي) وإعادة فتح الاتصال بعد أي خطأ. المحاولة التالية تبدأ من الرسالة التي
+        فشلت، فلا يُعاد إرسال ما وصل (send_messages في SMTP يتوقف في منتصف
+        الدفعة بدون أن يخبر بما أُرسل). ترجع عدد الرسائل المرسلة، أو EmailBatchError
+        بعد استنفاد المحاولات (retries=0: بدون انتظار، لمهمة Celery).
+        """
+        if not payloads:
+            return 0
+        retries = int(_get_config('EMAIL_MAX_RETRIES')) if retries is None else retries
+        attempt = 0
+        done = 0
+        while True:
+            with self._lock:
+                try:
+                    connection = self._open()
+                    while done < len(payloads):
+                        connection.send_messages([build_message(payloads[done], connection)])
+                        done += 1
+                        self._last_used = time.monotonic()
+                    return done
+                except Exception as e:
+                    self._close()
+                    unsent = payloads[done:]
+                    if attempt >= retries:
+                        logger.error(f"Email batch: {len(unsent)} of {len(payloads)} failed after {attempt + 1} attempts: {e}")
+                        raise EmailBatchError(done, unsent) from e
+                    logger.warning(f"Email batch: {len(unsent)} of {len(payloads)} pending (attempt {attempt + 1}): {e}")
+            time.sleep(get_retry_delay(attempt))
+            attempt += 1
+
+
+_mailer = PooledMailer()
+
+
+def get_mailer():
+    return _mailer
+
+
+class EmailWorker:
+    """
+    thread خلفي يجمع الرسائل من الطابور في دفعات ويرسلها (أو يضع كل دفعة في
+    Celery كمهمة واحدة في وضع 'celery')
+    """
+
+    def __init__(self, mailer):
+        self.mailer = mailer
+        self.queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def submit(self, payloads):
+        self._ensure_started()
+        for payload in payloads:
+            self.queue.put(payload)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='email-queue', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self, timeout):
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        batch_size = int(_get_config('EMAIL_BATCH_SIZE'))
+        deadline = time.monotonic() + float(_get_config('EMAIL_BATCH_WAIT_MS')) / 1000
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch):
+        if _get_config('EMAIL_QUEUE') == 'celery' and _dispatch(batch):
+            return
+        try:
+            self.mailer.send_batch(batch)
+        except EmailBatchError as e:
+            # بعد استنفاد المحاولات: الرسائل المتبقية تُسجل وتُهمل حتى لا يتوقف الطابور
+            logger.error(f"Dropped {len(e.unsent)} emails: {[p['to'] for p in e.unsent]}")
+        except Exception:
+            logger.error(f"Dropped {len(batch)} emails: {[p['to'] for p in batch]}")
+
+    def _run(self):
+        idle_timeout = max(1.0, float(_get_config('EMAIL_IDLE_CLOSE_S')))
+        while True:
+            batch = self._next_batch(idle_timeout)
+            if not batch:
+                self.mailer.close_if_idle()
+                continue
+            self._send(batch)
+
+    def flush(self):
+        """إرسال ما تبقى في الطابور (عند إيقاف العملية)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._send(batch)
+        self.mailer.close()
+
+
+def _dispatch(batch):
+    """دفعة واحدة كمهمة Celery واحدة؛ False إذا لم يكن الوسيط متاحاً"""
+    from .tasks import send_emails_task
+    try:
+        send_emails_task.delay(batch)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not enqueue {len(batch)} emails to Celery ({e}); sending locally")
+        return False
+
+
+_worker = EmailWorker(_mailer)
+
+
+def enqueue(payloads):
+    """وضع رسائل جاهزة (build_payload) في طابور الإرسال"""
+    if _get_config('EMAIL_QUEUE') == 'sync':
+        return _mailer.send_batch(payloads)
+    _worker.submit(payloads)
+    return len(payloads)
+
+
+def send_email(to, subject, body, html=None, from_email=None):
+    """إرسال بريد بدون انتظار SMTP"""
+    return enqueue([build_payload(to, subject, body, html, from_email)])
@@ -1,10 +1,10 @@
 """
 خدمة إرسال الإشعارات عبر البريد الإلكتروني
 """
-from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.html import strip_tags
+from . import email_queue
 import logging
 
 logger = logging.getLogger(__name__)
@@ -48,26 +48,15 @@ class EmailNotificationService:
             if html_template and context:
                 html_content = render_to_string(html_template, context)
                 text_content = strip_tags(html_content)
-                
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body=text_content,
-                    from_email=from_email,
-                    to=[recipient_email]
-                )
-                email.attach_alternative(html_content, "text/html")
-                email.send(fail_silently=False)
             else:
-                # إرسال نص بسيط
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=from_email,
-                    recipient_list=[recipient_email],
-                    fail_silently=False
-                )
+                # نص بسيط
+                html_content = None
+                text_content = message
             
-            logger.info(f"Email notification sent to {recipient_email}: {subject}")
+            # وضع الرسالة في طابور الإرسال (بدون انتظار SMTP داخل الطلب)
+            email_queue.send_email(recipient_email, subject, text_content, html_content, from_email)
+            
+            logger.info(f"Email notification queued for {recipient_email}: {subject}")
             return True
             
         except Exception as e:
@@ -0,0 +1,350 @@
+"""
+محرك الإرسال الجماعي لإشعارات FCM (fan-out)
+
+- جلب رموز الأجهزة النشطة لجميع المستخدمين في استعلام واحد
+- تقسيم الرموز إلى دفعات multicast (حد FCM هو 500 رمز لكل رسالة)
+- إرسال الدفعات بالتوازي عبر ThreadPoolExecutor مشترك
+- تجميع الرموز الميتة وإلغاء تفعيلها في UPDATE واحد
+- الإرسال الفعلي يمر عبر notifications.fcm_transport (Firebase أو بديل محلي)
+- الإشعارات المخصصة (عنوان/محتوى لكل مستخدم): رموز الدفعة في استعلام واحد
+  ورسائل مستقلة ترسل حتى 500 في طلب send_each (send_personalized)
+- نسخ async (asend_to_users / asend_to_tokens): ORM غير متزامن للرموز والتنظيف،
+  والطلبات الشبكية على نفس الـ executor بدون حجز thread pool الخاص بـ sync_to_async
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from .models import FCMDevice
+from .fcm_transport import FakeUnregisteredError, get_transport
+
+try:
+    from firebase_admin import messaging
+    from firebase_admin import exceptions as firebase_exceptions
+except ImportError:
+    messaging = None
+    firebase_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+FCM_MAX_MULTICAST_TOKENS = 500
+DEFAULT_FCM_MAX_WORKERS = 8
+
+
+def _get_config():
+    return getattr(settings, 'NOTIFICATIONS_CONFIG', {})
+
+
+def get_batch_size():
+    """حجم الدفعة من الإعدادات مع احترام حد FCM"""
+    size = int(_get_config().get('FCM_BATCH_SIZE', FCM_MAX_MULTICAST_TOKENS))
+    return max(1, min(size, FCM_MAX_MULTICAST_TOKENS))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Thread pool مشترك لطلبات FCM (I/O شبكي فقط، بدون ORM)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(_get_config().get('FCM_MAX_WORKERS', DEFAULT_FCM_MAX_WORKERS))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fcm-fanout')
+    return _executor
+
+
+@dataclass
+class FanoutResult:
+    """نتيجة إرسال جماعي"""
+    token_count: int = 0
+    batch_count: int = 0
+    success_count: int = 0
+    failure_count: int = 0
+    dead_tokens: list = field(default_factory=list)
+    deactivated_count: int = 0
+
+    def merge_batch(self, success, failure, dead):
+        self.batch_count += 1
+        self.success_count += success
+        self.failure_count += failure
+        self.dead_tokens.extend(dead)
+
+
+def resolve_tokens(user_ids):
+    """
+    رموز الأجهزة النشطة لمجموعة مستخدمين في استعلام واحد.
+    user_ids يمكن أن يكون قائمة أو QuerySet من المعرفات (يتحول إلى subquery).
+    """
+    return list(
+        FCMDevice.objects.filter(user_id__in=user_ids, is_active=True)
+        .values_list('registration_token', flat=True)
+    )
+
+
+def resolve_tokens_by_user(user_ids):
+    """{user_id: [tokens]} للأجهزة النشطة في استعلام واحد"""
+    tokens = {}
+    rows = FCMDevice.objects.filter(user_id__in=user_ids, is_active=True).values_list('user_id', 'registration_token')
+    for user_id, token in rows:
+        tokens.setdefault(user_id, []).append(token)
+    return tokens
+
+
+async def aresolve_tokens(user_ids):
+    """نسخة async من resolve_tokens"""
+    return [
+        token async for token in
+        FCMDevice.objects.filter(user_id__in=user_ids, is_active=True)
+        .values_list('registration_token', flat=True)
+    ]
+
+
+def _message_fields(title, body, data=None, image_url=None):
+    """الحقول المشتركة بين رسالة multicast والرسالة المفردة"""
+    return dict(
+        notification=messaging.Notification(
+            title=title,
+            body=body,
+            image=image_url
+        ),
+        data={str(k): str(v) for k, v in (data or {}).items()},  # تحويل جميع القيم إلى strings
+        android=messaging.AndroidConfig(
+            notification=messaging.AndroidNotification(
+                channel_id='high_importance_channel',
+                priority='high',
+                default_sound=True,
+                default_vibrate_timings=True,
+                default_light_settings=True
+            )
+        ),
+        apns=messaging.APNSConfig(
+            payload=messaging.APNSPayload(
+                aps=messaging.Aps(
+                    alert=messaging.ApsAlert(title=title, body=body),
+                    sound='default',
+                    badge=1
+                )
+            )
+        )
+    )
+
+
+def build_multicast_message(tokens, title, body, data=None, image_url=None):
+    """بناء رسالة FCM متعددة المستقبلين"""
+    return messaging.MulticastMessage(tokens=tokens, **_message_fields(title, body, data, image_url))
+
+
+def build_message(token, title, body, data=None, image_url=None):
+    """بناء رسالة FCM لرمز واحد (للمحتوى المخصص لكل مستخدم)"""
+    return messaging.Message(token=token, **_message_fields(title, body, data, image_url))
+
+
+def is_dead_token_error(exc):
+    """هل يعني الخطأ أن الرمز لم يعد صالحاً نهائياً؟ (الأخطاء المؤقتة لا تلغي الرمز)"""
+    if messaging is None or exc is None:
+        return False
+    dead_errors = (messaging.UnregisteredError, messaging.SenderIdMismatchError, FakeUnregisteredError)
+    if firebase_exceptions is not None:
+        dead_errors += (firebase_exceptions.InvalidArgumentError,)
+    return isinstance(exc, dead_errors)
+
+
+def send_batch(tokens, title, body, data=None, image_url=None):
+    """
+    إرسال دفعة واحدة. ترجع (success_count, failure_count, dead_tokens).
+    """
+    try:
+        message = build_multicast_message(tokens, title, body, data, image_url)
+        response = get_transport().send_multicast(message)
+    except Exception as e:
+        logger.error(f'Error sending FCM batch of {len(tokens)} tokens: {e}')
+        return 0, len(tokens), []
+    return _batch_outcome(response, tokens)
+
+
+def send_each_batch(messages):
+    """
+    إرسال دفعة رسائل مفردة مختلفة المحتوى. ترجع (success_count, failure_count, dead_tokens).
+    """
+    tokens = [message.token for message in messages]
+    try:
+        response = get_transport().send_each(messages)
+    except Exception as e:
+        logger.error(f'Error sending FCM batch of {len(messages)} messages: {e}')
+        return 0, len(messages), []
+    return _batch_outcome(response, tokens)
+
+
+def _batch_outcome(response, tokens):
+    dead = []
+    transient = []
+    if response.failure_count > 0:
+        for idx, resp in enumerate(response.responses):
+            if not resp.success:
+                if is_dead_token_error(resp.exception):
+                    dead.append(tokens[idx])
+                else:
+                    transient.append(resp.exception)
+    if transient:
+        # سطر واحد لكل دفعة بدلاً من سطر لكل رمز
+        logger.warning(f'FCM batch: {len(transient)} transient errors (e.g. {transient[0]})')
+    return response.success_count, response.failure_count, dead
+
+
+DEACTIVATE_IN_CHUNK = 5000  # حد آمن لعدد المتغيرات في IN
+
+
+def deactivate_tokens(tokens):
+    """إلغاء تفعيل الرموز الميتة بـ UPDATE مجمع (مقسّم فقط إذا تجاوز حد IN)"""
+    deactivated = 0
+    for i in range(0, len(tokens), DEACTIVATE_IN_CHUNK):
+        deactivated += FCMDevice.objects.filter(
+            registration_token__in=tokens[i:i + DEACTIVATE_IN_CHUNK],
+            is_active=True
+        ).update(is_active=False)
+    return deactivated
+
+
+async def adeactivate_tokens(tokens):
+    """نسخة async من deactivate_tokens"""
+    deactivated = 0
+    for i in range(0, len(tokens), DEACTIVATE_IN_CHUNK):
+        deactivated += await FCMDevice.objects.filter(
+            registration_token__in=tokens[i:i + DEACTIVATE_IN_CHUNK],
+            is_active=True
+        ).aupdate(is_active=False)
+    return deactivated
+
+
+def _split_batches(tokens, batch_size=None):
+    batch_size = min(batch_size or get_batch_size(), FCM_MAX_MULTICAST_TOKENS)
+    return [tokens[i:i + batch_size] for i in range(0, len(tokens), batch_size)]
+
+
+def _log_result(result):
+    logger.info(
+        f'FCM fan-out: {result.success_count}/{result.token_count} delivered in '
+        f'{result.batch_count} batches, {result.deactivated_count} tokens deactivated'
+    )
+
+
+def send_to_tokens(tokens, title, body, data=None, image_url=None, cleanup=True,
+                   batch_size=None, executor=None):
+    """
+    إرسال لرموز محددة: دفعات متوازية ثم تنظيف الرموز الميتة مرة واحدة.
+    cleanup=False يجمع الرموز الميتة في النتيجة بدون لمس قاعدة البيانات.
+    batch_size / executor لتجاوز الإعدادات (أداة القياس).
+    """
+    result = FanoutResult(token_count=len(tokens))
+    if not tokens:
+        return result
+    if messaging is None:
+        logger.warning("Firebase messaging not available")
+        return result
+
+    batches = _split_batches(tokens, batch_size)
+
+    if len(batches) == 1:
+        result.merge_batch(*send_batch(batches[0], title, body, data, image_url))
+    else:
+        executor = executor or get_executor()
+        futures = [
+            executor.submit(send_batch, batch, title, body, data, image_url)
+            for batch in batches
+        ]
+        for future in futures:
+            result.merge_batch(*future.result())
+
+    if cleanup:
+        result.deactivated_count = deactivate_tokens(result.dead_tokens)
+
+    _log_result(result)
+    return result
+
+
+async def asend_to_tokens(tokens, title, body, data=None, image_url=None, cleanup=True,
+                          batch_size=None, executor=None):
+    """
+    نسخة async من send_to_tokens: الدفعات تُنتظر من event loop مباشرة
+    (send_batch لا يلمس قاعدة البيانات) والتنظيف عبر ORM غير متزامن.
+    """
+    result = FanoutResult(token_count=len(tokens))
+    if not tokens:
+        return result
+    if messaging is None:
+        logger.warning("Firebase messaging not available")
+        return result
+
+    loop = asyncio.get_running_loop()
+    executor = executor or get_executor()
+    responses = await asyncio.gather(*[
+        loop.run_in_executor(executor, send_batch, batch, title, body, data, image_url)
+        for batch in _split_batches(tokens, batch_size)
+    ])
+    for response in responses:
+        result.merge_batch(*response)
+
+    if cleanup:
+        result.deactivated_count = await adeactivate_tokens(result.dead_tokens)
+
+    _log_result(result)
+    return result
+
+
+def send_to_users(user_ids, title, body, data=None, image_url=None):
+    """إرسال نفس الإشعار لمجموعة مستخدمين"""
+    tokens = resolve_tokens(user_ids)
+    if not tokens:
+        logger.info("No active FCM devices for the target users")
+        return FanoutResult()
+    return send_to_tokens(tokens, title, body, data, image_url)
+
+
+def send_personalized(rendered, data=None, image_url=None, cleanup=True):
+    """
+    إرسال محتوى مختلف لكل مستخدم: rendered = [(user_id, title, body), ...].
+    الرموز في استعلام واحد، ثم دفعات send_each متوازية وتنظيف الرموز الميتة مرة واحدة.
+    """
+    tokens_by_user = resolve_tokens_by_user([user_id for user_id, _, _ in rendered])
+    if not tokens_by_user:
+        logger.info("No active FCM devices for the target users")
+        return FanoutResult()
+    if messaging is None:
+        logger.warning("Firebase messaging not available")
+        return FanoutResult()
+
+    messages = [
+        build_message(token, title, body, data, image_url)
+        for user_id, title, body in rendered
+        for token in tokens_by_user.get(user_id, ())
+    ]
+    result = FanoutResult(token_count=len(messages))
+    batches = _split_batches(messages)
+    if len(batches) == 1:
+        result.merge_batch(*send_each_batch(batches[0]))
+    else:
+        executor = get_executor()
+        for future in [executor.submit(send_each_batch, batch) for batch in batches]:
+            result.merge_batch(*future.result())
+
+    if cleanup:
+        result.deactivated_count = deactivate_tokens(result.dead_tokens)
+
+    _log_result(result)
+    return result
+
+
+async def asend_to_users(user_ids, title, body, data=None, image_url=None):
+    """نسخة async من send_to_users"""
+    tokens = await aresolve_tokens(user_ids)
+    if not tokens:
+        logger.info("No active FCM devices for the target users")
+        return FanoutResult()
+    return await asend_to_tokens(tokens, title, body, data, image_url)
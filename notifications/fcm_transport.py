@@ -0,0 +1,169 @@
+"""
+طبقة النقل لإشعارات FCM
+
+كل مسارات FCM (notifications/fcm_fanout.py) ترسل عبر get_transport() بدلاً من
+استدعاء firebase_admin.messaging مباشرة، بحيث يمكن استبدال Firebase ببديل محلي
+لاختبار الحمل بدون شبكة.
+
+الاختيار من الإعدادات:
+    NOTIFICATIONS_CONFIG = {
+        'FCM_TRANSPORT': 'firebase',  # أو 'fake' أو مسار كلاس كامل
+        'FCM_FAKE_OPTIONS': {'latency_ms': 30, 'failure_rate': 0.01},
+    }
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    from firebase_admin import messaging
+    from firebase_admin import exceptions as firebase_exceptions
+except ImportError:
+    messaging = None
+    firebase_exceptions = None
+
+
+class FirebaseTransport:
+    """الإرسال الفعلي عبر Firebase Admin SDK"""
+    name = 'firebase'
+    is_fake = False
+
+    def send_multicast(self, message):
+        # send_multicast يعتمد على batch endpoint الذي أوقفته Google
+        send = getattr(messaging, 'send_each_for_multicast', None) or messaging.send_multicast
+        return send(message)
+
+    def send_each(self, messages):
+        # رسائل مختلفة المحتوى (حتى 500) في طلب واحد
+        return messaging.send_each(messages)
+
+
+# ===== البديل المحلي =====
+
+class FakeUnregisteredError(Exception):
+    """يُستخدم عند عدم توفر firebase_admin"""
+
+
+class FakeUnavailableError(Exception):
+    """يُستخدم عند عدم توفر firebase_admin"""
+
+
+@dataclass
+class FakeSendResponse:
+    success: bool
+    exception: Exception = None
+    message_id: str = None
+
+
+@dataclass
+class FakeBatchResponse:
+    responses: list
+    success_count: int
+    failure_count: int
+
+
+class FakeTransport:
+    """
+    بديل داخل العملية لـ Firebase messaging:
+    - latency_ms / jitter_ms: زمن كل طلب multicast
+    - failure_rate: نسبة الأخطاء المؤقتة (لا تلغي الرمز)
+    - invalid_rate: نسبة الرموز غير الصالحة عشوائياً (Unregistered)
+    - invalid_prefix: أي رمز يبدأ بهذه البادئة يُعتبر غير صالح دائماً
+    """
+    name = 'fake'
+    is_fake = True
+
+    def __init__(self, latency_ms=20, jitter_ms=5, failure_rate=0.0, invalid_rate=0.0,
+                 invalid_prefix='invalid', seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.invalid_rate = invalid_rate
+        self.invalid_prefix = invalid_prefix
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.calls = 0
+        self.tokens_sent = 0
+        self.max_batch = 0
+
+    def _unregistered_error(self, token):
+        if messaging is not None:
+            return messaging.UnregisteredError(f'Requested entity was not found: {token}')
+        return FakeUnregisteredError(token)
+
+    def _unavailable_error(self):
+        if firebase_exceptions is not None:
+            return firebase_exceptions.UnavailableError('Simulated FCM outage')
+        return FakeUnavailableError('Simulated FCM outage')
+
+    def send_multicast(self, message):
+        return self._respond(list(message.tokens))
+
+    def send_each(self, messages):
+        return self._respond([message.token for message in messages])
+
+    def _respond(self, tokens):
+        with self._lock:
+            self.calls += 1
+            self.tokens_sent += len(tokens)
+            self.max_batch = max(self.max_batch, len(tokens))
+            rolls = [(self._random.random(), self._random.random()) for _ in tokens]
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        responses = []
+        for token, (invalid_roll, failure_roll) in zip(tokens, rolls):
+            if token.startswith(self.invalid_prefix) or invalid_roll < self.invalid_rate:
+                responses.append(FakeSendResponse(False, self._unregistered_error(token)))
+            elif failure_roll < self.failure_rate:
+                responses.append(FakeSendResponse(False, self._unavailable_error()))
+            else:
+                responses.append(FakeSendResponse(True, message_id=f'fake/{token}'))
+
+        success = sum(1 for r in responses if r.success)
+        return FakeBatchResponse(responses, success, len(responses) - success)
+
+
+TRANSPORT_ALIASES = {
+    'firebase': 'notifications.fcm_transport.FirebaseTransport',
+    'fake': 'notifications.fcm_transport.FakeTransport',
+}
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def build_transport(name=None, **options):
+    """إنشاء طبقة نقل بالاسم المختصر أو بمسار الكلاس"""
+    config = getattr(settings, 'NOTIFICATIONS_CONFIG', {})
+    name = name or config.get('FCM_TRANSPORT', 'firebase')
+    transport_class = import_string(TRANSPORT_ALIASES.get(name, name))
+    if not options and getattr(transport_class, 'is_fake', False):
+        options = config.get('FCM_FAKE_OPTIONS', {})
+    return transport_class(**options)
+
+
+def get_transport():
+    """طبقة النقل الحالية (تُنشأ مرة واحدة من الإعدادات)"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = build_transport()
+    return _transport
+
+
+def set_transport(transport):
+    """استبدال طبقة النقل (للاختبار وأداة القياس). None = العودة للإعدادات"""
+    global _transport
+    with _transport_lock:
+        _transport = transport
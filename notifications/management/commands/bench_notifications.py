@@ -0,0 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notifications import audience, fcm_fanout
+from notifications.fcm_transport import FakeTransport, set_transport
+from notifications.models import FCMDevice
+
+User = get_user_model()
+
+BENCH_EMAIL_DOMAIN = '@bench.local'
+
+
+class Command(BaseCommand):
+    help = 'قياس أداء مسار إشعارات FCM باستخدام بديل Firebase المحلي (بدون شبكة)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipients',
+            type=int,
+            nargs='+',
+            default=[10000],
+            help='عدد المستقبلين لكل جولة قياس (مثال: --recipients 10000 100000 1000000)'
+        )
+        parser.add_argument('--tokens-per-user', type=int, default=1, help='عدد الأجهزة لكل مستخدم')
+        parser.add_argument('--batch-size', type=int, default=None, help='عدد الرموز في كل multicast (الحد 500)')
+        parser.add_argument('--workers', type=int, default=8, help='عدد الدفعات المتوازية')
+        parser.add_argument('--latency-ms', type=float, default=20, help='زمن كل طلب FCM المحاكى')
+        parser.add_argument('--jitter-ms', type=float, default=5, help='تذبذب الزمن المحاكى')
+        parser.add_argument('--failure-rate', type=float, default=0.01, help='نسبة الأخطاء المؤقتة')
+        parser.add_argument('--invalid-rate', type=float, default=0.02, help='نسبة الرموز غير الصالحة')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--db',
+            action='store_true',
+            help='تشغيل المسار الكامل على قاعدة البيانات (مستخدمون وأجهزة وإشعارات) ثم التراجع عن كل شيء'
+        )
+
+    def handle(self, *args, **options):
+        transport = FakeTransport(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            failure_rate=options['failure_rate'],
+            invalid_rate=options['invalid_rate'],
+            seed=options['seed'],
+        )
+        set_transport(transport)
+        executor = ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='fcm-bench')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"بدء القياس: latency={options['latency_ms']}ms workers={options['workers']} "
+            f"failure_rate={options['failure_rate']} invalid_rate={options['invalid_rate']} "
+            f"mode={'db' if options['db'] else 'transport'}"
+        ))
+
+        try:
+            for recipients in options['recipients']:
+                transport.reset_stats()
+                if options['db']:
+                    stats = self._bench_db(recipients, options, transport)
+                else:
+                    stats = self._bench_transport(recipients, options, executor)
+                self._report(recipients, stats, transport, options)
+        finally:
+            set_transport(None)
+            executor.shutdown(wait=False)
+
+    def _bench_transport(self, recipients, options, executor):
+        """إرسال مباشر لرموز مولدة في الذاكرة (بدون قاعدة بيانات)"""
+        tokens = [
+            f'bench-{user}-{device}'
+            for user in range(recipients)
+            for device in range(options['tokens_per_user'])
+        ]
+        started = time.perf_counter()
+        result = fcm_fanout.send_to_tokens(
+            tokens, 'bench', 'benchmark notification',
+            cleanup=False, batch_size=options['batch_size'], executor=executor
+        )
+        elapsed = time.perf_counter() - started
+        return {
+            'elapsed': elapsed,
+            'tokens': result.token_count,
+            'success': result.success_count,
+            'failure': result.failure_count,
+            'dead': len(result.dead_tokens),
+            'deactivated': None,
+            'notifications': None,
+        }
+
+    def _bench_db(self, recipients, options, transport):
+        """المسار الكامل: audience → bulk_create → FCM لكل دفعة → تنظيف الرموز، ثم rollback"""
+        from project.celery import app as celery_app
+
+        previous_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with transaction.atomic():
+                self.stdout.write(f'تجهيز {recipients} مستخدم...')
+                self._seed(recipients, options['tokens_per_user'])
+                bench_users = User.objects.filter(email__endswith=BENCH_EMAIL_DOMAIN)
+
+                started = time.perf_counter()
+                created = audience.send_to_audience(bench_users, 'bench', 'benchmark notification')
+                elapsed = time.perf_counter() - started
+
+                devices = FCMDevice.objects.filter(user__in=bench_users)
+                stats = {
+                    'elapsed': elapsed,
+                    'tokens': transport.tokens_sent,
+                    'success': None,
+                    'failure': None,
+                    'dead': None,
+                    'deactivated': devices.filter(is_active=False).count(),
+                    'notifications': created,
+                }
+                transaction.set_rollback(True)
+        finally:
+            celery_app.conf.task_always_eager = previous_eager
+        return stats
+
+    def _seed(self, recipients, tokens_per_user, chunk=5000):
+        run = int(time.time())
+        for start in range(0, recipients, chunk):
+            users = User.objects.bulk_create([
+                User(email=f'bench-{run}-{i}{BENCH_EMAIL_DOMAIN}', name='bench')
+                for i in range(start, min(start + chunk, recipients))
+            ])
+            FCMDevice.objects.bulk_create([
+                FCMDevice(
+                    user_id=user.pk,
+                    registration_token=f'bench-{run}-{user.pk}-{device}',
+                    device_type='android'
+                )
+                for user in users
+                for device in range(tokens_per_user)
+            ])
+
+    def _report(self, recipients, stats, transport, options):
+        elapsed = stats['elapsed'] or 1e-9
+        batch_size = min(options['batch_size'] or fcm_fanout.get_batch_size(), fcm_fanout.FCM_MAX_MULTICAST_TOKENS)
+        efficiency = (transport.tokens_sent / (transport.calls * batch_size)) if transport.calls else 0
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'=== {recipients} مستقبل ==='))
+        self.stdout.write(f"الزمن: {elapsed:.2f}s")
+        self.stdout.write(f"الرموز المرسلة: {stats['tokens']} ({stats['tokens'] / elapsed:,.0f} إشعار/ثانية)")
+        if stats['notifications'] is not None:
+            self.stdout.write(f"إشعارات قاعدة البيانات: {stats['notifications']} ({stats['notifications'] / elapsed:,.0f}/ثانية)")
+        self.stdout.write(
+            f"الدفعات: {transport.calls} | أكبر دفعة: {transport.max_batch} | كفاءة التعبئة: {efficiency:.1%}"
+        )
+        if stats['success'] is not None:
+            self.stdout.write(f"نجاح: {stats['success']} | فشل: {stats['failure']} | رموز ميتة: {stats['dead']}")
+        if stats['deactivated'] is not None:
+            self.stdout.write(f"أجهزة تم إلغاء تفعيلها: {stats['deactivated']}")
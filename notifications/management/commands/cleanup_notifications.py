@@ -3,6 +3,7 @@ from django.utils import timezone
 from django.conf import settings
 from notifications.services import NotificationService
 from notifications.models import Notification, FCMDevice
+from notifications import retention
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +25,12 @@ class Command(BaseCommand):
             default=90,
             help='عدد الأيام لحذف الأجهزة غير النشطة (افتراضي: 90)'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='عدد الصفوف المحذوفة في كل دفعة (افتراضي: NOTIFICATIONS_CONFIG[RETENTION_CHUNK_SIZE])'
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -39,22 +46,21 @@ class Command(BaseCommand):
             self.style.SUCCESS(f'بدء تنظيف الإشعارات (dry_run={dry_run})')
         )
 
-        # تنظيف الإشعارات القديمة المقروءة
-        cutoff_date = timezone.now() - timezone.timedelta(days=days)
-        old_notifications = Notification.objects.filter(
-            created_at__lt=cutoff_date,
-            is_read=True
-        )
+        # تنظيف الإشعارات القديمة المقروءة (على دفعات عبر الفهرس بدلاً من DELETE واحد)
+        cutoff_date = retention.get_cutoff(days)
         
-        old_count = old_notifications.count()
-        self.stdout.write(f'الإشعارات المقروءة القديمة: {old_count}')
-        
-        if not dry_run and old_count > 0:
-            deleted_count = old_notifications.delete()[0]
+        if dry_run:
+            old_count = retention.expired_read_notifications(cutoff_date).count()
+            self.stdout.write(f'الإشعارات المقروءة القديمة: {old_count}')
+        else:
+            deleted_count = retention.purge_read_notifications(cutoff_date, options['chunk_size'])
+            deleted_messages = retention.purge_orphan_messages(cutoff_date, options['chunk_size'])
             self.stdout.write(
-                self.style.SUCCESS(f'تم حذف {deleted_count} إشعار قديم')
+                self.style.SUCCESS(
+                    f'تم حذف {deleted_count} إشعار قديم و {deleted_messages} رسالة جماعية بدون مستلمين'
+                )
             )
-            logger.info(f"Deleted {deleted_count} old read notifications")
+            logger.info(f"Deleted {deleted_count} old read notifications, {deleted_messages} messages")
 
         # تنظيف الأجهزة غير النشطة
         inactive_cutoff = timezone.now() - timezone.timedelta(days=inactive_days)
@@ -73,7 +73,7 @@ class Command(BaseCommand):
                 return
             
             user_ids = [user.id for user in users]
-            notifications = NotificationService.send_notification_to_users(
+            count = NotificationService.send_notification_to_users(
                 user_ids=user_ids,
                 title=title,
                 body=body,
@@ -83,7 +83,7 @@ class Command(BaseCommand):
             )
             
             self.stdout.write(
-                self.style.SUCCESS(f'تم إرسال {len(notifications)} إشعار لـ {len(users)} مستخدم')
+                self.style.SUCCESS(f'تم إرسال {count} إشعار لـ {len(users)} مستخدم')
             )
             
         elif options['user_email']:
@@ -24,6 +24,64 @@ class NotificationPriority(models.TextChoices):
     URGENT = 'urgent', _('عاجلة')
 
 
+class NotificationMessage(models.Model):
+    """
+    محتوى إشعار جماعي يُخزن مرة واحدة؛ كل مستلم له صف Notification خفيف
+    (message + حالة القراءة) بدون تكرار العنوان والمحتوى والبيانات.
+    """
+    title = models.CharField(
+        max_length=255,
+        verbose_name=_('العنوان')
+    )
+    body = models.TextField(
+        verbose_name=_('المحتوى')
+    )
+    type = models.CharField(
+        max_length=20,
+        choices=NotificationType.choices,
+        default=NotificationType.SYSTEM,
+        verbose_name=_('النوع')
+    )
+    priority = models.CharField(
+        max_length=10,
+        choices=NotificationPriority.choices,
+        default=NotificationPriority.NORMAL,
+        verbose_name=_('الأولوية')
+    )
+    data = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('البيانات الإضافية')
+    )
+    image_url = models.URLField(
+        blank=True,
+        null=True,
+        verbose_name=_('رابط الصورة')
+    )
+    related_id = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_('معرف العنصر المرتبط')
+    )
+    recipients_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('عدد المستلمين')
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name=_('تاريخ الإنشاء')
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _('رسالة جماعية')
+        verbose_name_plural = _('الرسائل الجماعية')
+
+    def __str__(self):
+        return f"{self.title} ({self.recipients_count})"
+
+
 class Notification(models.Model):
     """نموذج الإشعارات"""
     user = models.ForeignKey(
@@ -32,11 +90,22 @@ class Notification(models.Model):
         related_name='notifications',
         verbose_name=_('المستخدم')
     )
+    message = models.ForeignKey(
+        NotificationMessage,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='deliveries',
+        verbose_name=_('الرسالة الجماعية'),
+        help_text=_('للإشعارات الجماعية: المحتوى في الرسالة والصف يحمل حالة القراءة فقط')
+    )
     title = models.CharField(
         max_length=255, 
+        blank=True,
         verbose_name=_('العنوان')
     )
     body = models.TextField(
+        blank=True,
         verbose_name=_('المحتوى')
     )
     type = models.CharField(
@@ -90,10 +159,17 @@ class Notification(models.Model):
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['user', 'is_read']),
             models.Index(fields=['type']),
+            # حذف الاحتفاظ على دفعات (notifications/retention.py)
+            models.Index(fields=['is_read', 'created_at']),
         ]
         
     def __str__(self):
-        return f"{self.title} - {self.user.email}"
+        return f"{self.content.title} - {self.user.email}"
+    
+    @property
+    def content(self):
+        """مصدر العنوان والمحتوى والبيانات: الرسالة الجماعية أو الصف نفسه"""
+        return self.message if self.message_id else self
     
     def mark_as_read(self):
         """تعليم الإشعار كمقروء"""
@@ -0,0 +1,107 @@
+"""
+حذف الإشعارات القديمة على دفعات (retention)
+
+بدلاً من DELETE واحد واسع يقفل الجدول طويلاً:
+- تُقرأ معرفات دفعة ثابتة الحجم عبر الفهرس (is_read, created_at)، ثم تُحذف بـ
+  DELETE ... WHERE id IN (...) في معاملة قصيرة مستقلة، مع توقف اختياري بين الدفعات.
+- الرسائل الجماعية (NotificationMessage) تُحذف بعد حذف آخر صف استلام مرتبط بها.
+- ملخصات المستخدمين المتأثرين تُحذف لكل دفعة (notifications/summary.py).
+
+الإعدادات:
+    NOTIFICATIONS_CONFIG = {
+        'RETENTION_CHUNK_SIZE': 5000,
+        'RETENTION_PAUSE_MS': 50,
+    }
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import summary
+from .models import Notification, NotificationMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_CHUNK_SIZE = 5000
+DEFAULT_RETENTION_PAUSE_MS = 50
+
+
+def _get_config(name, default):
+    return getattr(settings, 'NOTIFICATIONS_CONFIG', {}).get(name, default)
+
+
+def get_chunk_size():
+    return int(_get_config('RETENTION_CHUNK_SIZE', DEFAULT_RETENTION_CHUNK_SIZE))
+
+
+def get_pause():
+    return float(_get_config('RETENTION_PAUSE_MS', DEFAULT_RETENTION_PAUSE_MS)) / 1000
+
+
+def get_cutoff(days):
+    return timezone.now() - timezone.timedelta(days=days)
+
+
+def expired_read_notifications(cutoff):
+    """الإشعارات المقروءة الأقدم من cutoff (تطابق الفهرس is_read, created_at)"""
+    return Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+
+
+def orphan_messages(cutoff):
+    """رسائل جماعية قديمة لم يعد لها أي صف استلام"""
+    return NotificationMessage.objects.filter(created_at__lt=cutoff, deliveries__isnull=True)
+
+
+def purge_read_notifications(cutoff, chunk_size=None, pause=None):
+    """حذف الإشعارات المقروءة القديمة على دفعات. ترجع عدد الصفوف المحذوفة."""
+    chunk_size = chunk_size or get_chunk_size()
+    pause = get_pause() if pause is None else pause
+    queryset = expired_read_notifications(cutoff).order_by('created_at')
+    deleted = 0
+    while True:
+        rows = list(queryset.values_list('id', 'user_id')[:chunk_size])
+        if not rows:
+            break
+        ids = [pk for pk, _ in rows]
+        deleted += Notification.objects.filter(id__in=ids).delete()[0]
+        summary.invalidate({user_id for _, user_id in rows})
+        if len(rows) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def purge_orphan_messages(cutoff, chunk_size=None, pause=None):
+    """حذف الرسائل الجماعية التي حُذفت جميع صفوف استلامها. ترجع عدد الرسائل المحذوفة."""
+    chunk_size = chunk_size or get_chunk_size()
+    pause = get_pause() if pause is None else pause
+    deleted = 0
+    while True:
+        ids = list(orphan_messages(cutoff).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        deleted += NotificationMessage.objects.filter(id__in=ids, deliveries__isnull=True).delete()[0]
+        if len(ids) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def purge(days=30, chunk_size=None, pause=None):
+    """
+    تطبيق سياسة الاحتفاظ: الإشعارات المقروءة الأقدم من days يوماً، ثم الرسائل
+    الجماعية التي لم يبق لها مستلمون. ترجع (notifications, messages).
+    """
+    cutoff = get_cutoff(days)
+    started = time.monotonic()
+    notifications = purge_read_notifications(cutoff, chunk_size, pause)
+    messages = purge_orphan_messages(cutoff, chunk_size, pause)
+    logger.info(
+        f"Retention purge ({days}d): {notifications} notifications, {messages} messages "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+    return notifications, messages
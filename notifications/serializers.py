@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.utils import timezone
-from .models import Notification, FCMDevice, NotificationTemplate
+from .models import Notification, FCMDevice, NotificationTemplate, NotificationType, NotificationPriority
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -18,6 +18,17 @@ class NotificationSerializer(serializers.ModelSerializer):
         """تخصيص عرض البيانات"""
         data = super().to_representation(instance)
         
+        # الإشعارات الجماعية: المحتوى مخزن مرة واحدة في الرسالة
+        if instance.message_id:
+            message = instance.message
+            data.update({
+                'title': message.title,
+                'body': message.body,
+                'data': message.data,
+                'image_url': message.image_url,
+                'related_id': message.related_id,
+            })
+        
         # إضافة تسميات النوع والأولوية
         data['type_display'] = instance.get_type_display()
         data['priority_display'] = instance.get_priority_display()
@@ -69,24 +80,29 @@ class NotificationCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """إنشاء إشعارات متعددة"""
         users = validated_data.pop('users', [])
-        notifications = []
         
         if users:
-            # إرسال لمستخدمين محددين
-            for user_id in users:
-                notification_data = validated_data.copy()
-                notification_data['user_id'] = user_id
-                notifications.append(Notification(**notification_data))
-        else:
-            # إرسال للمستخدم الحالي فقط
-            validated_data['user'] = self.context['request'].user
-            notifications.append(Notification(**validated_data))
+            # إرسال لمستخدمين محددين: المحتوى مرة واحدة + صف استلام لكل مستخدم
+            from . import audience
+            message = audience.build_message(
+                validated_data.get('title', ''),
+                validated_data.get('body', ''),
+                validated_data.get('type', NotificationType.SYSTEM),
+                validated_data.get('priority', NotificationPriority.NORMAL),
+                validated_data.get('data'),
+                validated_data.get('image_url'),
+                validated_data.get('related_id')
+            )
+            message.save()
+            created_notifications = audience.create_deliveries_chunk(users, message)
+            audience.finish_message(message, len(created_notifications))
             
-        # إنشاء الإشعارات بشكل مجمع
-        created_notifications = Notification.objects.bulk_create(notifications)
+            # إرجاع أول إشعار (للتوافق مع API)
+            return created_notifications[0] if created_notifications else None
         
-        # إرجاع أول إشعار (للتوافق مع API)
-        return created_notifications[0] if created_notifications else None
+        # إرسال للمستخدم الحالي فقط
+        validated_data['user'] = self.context['request'].user
+        return Notification.objects.create(**validated_data)
 
 
 class NotificationStatsSerializer(serializers.Serializer):
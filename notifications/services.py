@@ -1,11 +1,13 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Q, QuerySet
 from django.utils import timezone
-from .models import Notification, FCMDevice, NotificationTemplate, NotificationType, NotificationPriority
+from .models import Notification, NotificationType, NotificationPriority
 from .email_service import EmailNotificationService
+from . import audience, fcm_fanout, retention, summary, templating
+from .fcm_transport import get_transport
 import logging
-import json
 
 # إعداد Firebase Admin
 try:
@@ -21,6 +23,11 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+def _fcm_ready():
+    """Firebase مهيأ، أو طبقة النقل بديل محلي لا يحتاج شبكة"""
+    return FIREBASE_AVAILABLE or get_transport().is_fake
+
+
 class NotificationService:
     """خدمة إدارة الإشعارات"""
     
@@ -79,33 +86,56 @@ class NotificationService:
         related_id=None,
         send_fcm=True
     ):
-        """إرسال إشعار لعدة مستخدمين"""
-        
-        users = User.objects.filter(id__in=user_ids)
-        notifications = []
-        
-        for user in users:
-            notifications.append(Notification(
-                user=user,
-                title=title,
-                body=body,
-                type=notification_type,
-                priority=priority,
-                data=data or {},
-                image_url=image_url,
-                related_id=related_id
-            ))
-        
-        # إنشاء الإشعارات بشكل مجمع
-        created_notifications = Notification.objects.bulk_create(notifications)
-        
-        # إرسال FCM للمستخدمين
-        if send_fcm:
-            for user in users:
-                NotificationService._send_fcm_to_user(user, title, body, data, image_url)
-        
-        logger.info(f"Notification sent to {len(users)} users: {title}")
-        return created_notifications
+        """
+        إرسال إشعار لعدة مستخدمين
+        user_ids: قائمة معرفات، أو QuerySet مستخدمين (يُقرأ على دفعات keyset)
+        ترجع عدد الإشعارات المنشأة في الحالتين (الصفوف لعدة مستلمين صفوف استلام
+        والمحتوى في NotificationMessage، فلا تُرجع)
+        """
+        if isinstance(user_ids, QuerySet):
+            # جمهور كبير: إنشاء على دفعات وجدولة FCM لكل دفعة
+            count = audience.send_to_audience(
+                user_ids, title, body, notification_type, priority,
+                data, image_url, related_id, send_fcm
+            )
+            logger.info(f"Notification sent to {count} users: {title}")
+            return count
+        
+        push = send_fcm and is_fcm_enabled()
+        count = 0
+        # عدة مستلمين: المحتوى يُخزن مرة واحدة وكل مستلم له صف استلام خفيف
+        message = None
+        shared = len(user_ids) > 1
+        for chunk in audience.iter_list_chunks(user_ids):
+            # التحقق من وجود المعرفات فقط (بدون تحميل كائنات المستخدمين)
+            existing_ids = list(
+                User.objects.filter(id__in=chunk).values_list('id', flat=True).iterator()
+            )
+            if not existing_ids:
+                continue
+            
+            # إنشاء الإشعارات بشكل مجمع
+            if shared:
+                if message is None:
+                    message = audience.build_message(
+                        title, body, notification_type, priority, data, image_url, related_id
+                    )
+                    message.save()
+                count += len(audience.create_deliveries_chunk(existing_ids, message))
+            else:
+                count += len(audience.create_notifications_chunk(
+                    existing_ids, title, body, notification_type, priority,
+                    data, image_url, related_id
+                ))
+            
+            # إرسال FCM للدفعة (استعلام رموز واحد + multicast متوازي)
+            if push:
+                NotificationService._send_fcm_broadcast(existing_ids, title, body, data, image_url)
+        
+        if message is not None:
+            audience.finish_message(message, count)
+        logger.info(f"Notification sent to {count} users: {title}")
+        return count
     
     @staticmethod
     def send_broadcast_notification(
@@ -126,120 +156,163 @@ class NotificationService:
         if user_filter:
             users_query = users_query.filter(user_filter)
         
-        users = list(users_query)
-        notifications = []
-        
-        for user in users:
-            notifications.append(Notification(
-                user=user,
-                title=title,
-                body=body,
-                type=notification_type,
-                priority=priority,
-                data=data or {},
-                image_url=image_url
-            ))
-        
-        # إنشاء الإشعارات بشكل مجمع
-        created_notifications = Notification.objects.bulk_create(notifications, batch_size=1000)
-        
-        # إرسال FCM
-        if send_fcm and users:
-            NotificationService._send_fcm_broadcast(users, title, body, data, image_url)
+        # إنشاء الإشعارات على دفعات وجدولة FCM لكل دفعة
+        count = audience.send_to_audience(
+            users_query,
+            title=title,
+            body=body,
+            notification_type=notification_type,
+            priority=priority,
+            data=data,
+            image_url=image_url,
+            send_fcm=send_fcm
+        )
         
-        logger.info(f"Broadcast notification sent to {len(users)} users: {title}")
-        return created_notifications
+        logger.info(f"Broadcast notification sent to {count} users: {title}")
+        return count
     
+    # ===== الواجهة غير المتزامنة (consumers و ASGI views) =====
+    # ORM غير متزامن و FCM عبر fcm_fanout.asend_*؛ بدون async_to_sync أو database_sync_to_async
+
+    @staticmethod
+    async def asend_to_user(
+        user,
+        title,
+        body,
+        notification_type=NotificationType.SYSTEM,
+        priority=NotificationPriority.NORMAL,
+        data=None,
+        image_url=None,
+        related_id=None,
+        send_fcm=True,
+        send_email=False
+    ):
+        """نسخة async من send_notification_to_user"""
+        notification = await Notification.objects.acreate(
+            user_id=user.pk,
+            title=title,
+            body=body,
+            type=notification_type,
+            priority=priority,
+            data=data or {},
+            image_url=image_url,
+            related_id=related_id
+        )
+
+        if send_fcm and is_fcm_enabled() and _fcm_ready():
+            try:
+                await fcm_fanout.asend_to_users([user.pk], title, body, data, image_url)
+            except Exception as e:
+                logger.error(f'Error sending FCM notification: {e}')
+
+        if send_email or priority in [NotificationPriority.HIGH, NotificationPriority.URGENT]:
+            # البريد يوضع في طابور الإرسال (notifications/email_queue.py) بدون انتظار SMTP
+            EmailNotificationService.send_notification_email(
+                user=user,
+                subject=title,
+                message=body,
+                priority=priority
+            )
+
+        logger.info(f"Notification sent to user {user.pk}: {title}")
+        return notification
+
+    @staticmethod
+    async def asend_to_users(
+        user_ids,
+        title,
+        body,
+        notification_type=NotificationType.SYSTEM,
+        priority=NotificationPriority.NORMAL,
+        data=None,
+        image_url=None,
+        related_id=None,
+        send_fcm=True
+    ):
+        """
+        نسخة async من send_notification_to_users (ترجع عدد الإشعارات المنشأة)
+        """
+        push = send_fcm and is_fcm_enabled() and _fcm_ready()
+        is_queryset = isinstance(user_ids, QuerySet)
+        total = 0
+        message = None
+        shared = is_queryset or len(user_ids) > 1
+
+        async def process(chunk):
+            nonlocal message
+            if not shared:
+                created = await audience.acreate_notifications_chunk(
+                    chunk, title, body, notification_type, priority, data, image_url, related_id
+                )
+            else:
+                if message is None:
+                    message = audience.build_message(
+                        title, body, notification_type, priority, data, image_url, related_id
+                    )
+                    await message.asave()
+                created = await audience.acreate_deliveries_chunk(chunk, message)
+            if push:
+                try:
+                    await fcm_fanout.asend_to_users(chunk, title, body, data, image_url)
+                except Exception as e:
+                    logger.error(f'Error sending FCM notification: {e}')
+            return created
+
+        if is_queryset:
+            async for chunk in audience.aiter_id_chunks(user_ids):
+                total += len(await process(chunk))
+        else:
+            for chunk in audience.iter_list_chunks(user_ids):
+                existing_ids = [
+                    pk async for pk in User.objects.filter(id__in=chunk).values_list('id', flat=True)
+                ]
+                if existing_ids:
+                    total += len(await process(existing_ids))
+
+        if message is not None:
+            await sync_to_async(audience.finish_message)(message, total)
+        logger.info(f"Notification sent to {total} users: {title}")
+        return total
+
     @staticmethod
     def _send_fcm_to_user(user, title, body, data=None, image_url=None):
         """إرسال إشعار FCM لمستخدم واحد"""
-        if not FIREBASE_AVAILABLE:
+        if not _fcm_ready():
             logger.warning("Firebase Admin SDK not available")
             return
             
-        devices = FCMDevice.objects.filter(user=user, is_active=True)
-        if not devices.exists():
+        tokens = fcm_fanout.resolve_tokens([user.id])
+        if not tokens:
             logger.info(f"No active FCM devices for user {user.email}")
             return
             
-        tokens = [device.registration_token for device in devices]
         NotificationService._send_fcm_notification(tokens, title, body, data, image_url)
     
     @staticmethod
     def _send_fcm_broadcast(users, title, body, data=None, image_url=None):
-        """إرسال إشعار FCM لعدة مستخدمين"""
-        if not FIREBASE_AVAILABLE:
+        """
+        إرسال إشعار FCM لعدة مستخدمين
+        users: مستخدمون أو معرفاتهم أو QuerySet من المعرفات
+        """
+        if not _fcm_ready():
             logger.warning("Firebase Admin SDK not available")
             return
             
-        # جمع جميع الرموز النشطة
-        user_ids = [user.id for user in users]
-        devices = FCMDevice.objects.filter(user_id__in=user_ids, is_active=True)
-        tokens = [device.registration_token for device in devices]
-        
-        if tokens:
-            # تقسيم الرموز إلى مجموعات (FCM يدعم حتى 1000 رمز في المرة الواحدة)
-            batch_size = 1000
-            for i in range(0, len(tokens), batch_size):
-                batch_tokens = tokens[i:i + batch_size]
-                NotificationService._send_fcm_notification(batch_tokens, title, body, data, image_url)
+        if isinstance(users, (list, tuple, set)):
+            user_ids = [getattr(u, 'id', u) for u in users]
+        else:
+            user_ids = users
+        return fcm_fanout.send_to_users(user_ids, title, body, data, image_url)
     
     @staticmethod
     def _send_fcm_notification(tokens, title, body, data=None, image_url=None):
-        """إرسال إشعار FCM"""
-        if not FIREBASE_AVAILABLE or not messaging:
+        """إرسال إشعار FCM (دفعات متوازية وإلغاء تفعيل الرموز الميتة)"""
+        if not _fcm_ready() or not messaging:
             logger.warning("Firebase messaging not available")
             return
             
         try:
-            # إعداد رسالة FCM
-            message = messaging.MulticastMessage(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body,
-                    image=image_url
-                ),
-                data={str(k): str(v) for k, v in (data or {}).items()},  # تحويل جميع القيم إلى strings
-                tokens=tokens,
-                android=messaging.AndroidConfig(
-                    notification=messaging.AndroidNotification(
-                        channel_id='high_importance_channel',
-                        priority='high',
-                        default_sound=True,
-                        default_vibrate_timings=True,
-                        default_light_settings=True
-                    )
-                ),
-                apns=messaging.APNSConfig(
-                    payload=messaging.APNSPayload(
-                        aps=messaging.Aps(
-                            alert=messaging.ApsAlert(title=title, body=body),
-                            sound='default',
-                            badge=1
-                        )
-                    )
-                )
-            )
-            
-            # إرسال الرسالة
-            response = messaging.send_multicast(message)
-            
-            logger.info(f'Successfully sent {response.success_count} FCM notifications')
-            
-            # معالجة الرموز الفاشلة
-            if response.failure_count > 0:
-                failed_tokens = []
-                for idx, resp in enumerate(response.responses):
-                    if not resp.success:
-                        failed_tokens.append(tokens[idx])
-                        logger.error(f'FCM error: {resp.exception}')
-                
-                # إلغاء تفعيل الرموز الفاشلة
-                if failed_tokens:
-                    FCMDevice.objects.filter(
-                        registration_token__in=failed_tokens
-                    ).update(is_active=False)
-                    
+            return fcm_fanout.send_to_tokens(list(tokens), title, body, data, image_url)
         except Exception as e:
             logger.error(f'Error sending FCM notification: {e}')
     
@@ -328,31 +401,31 @@ class NotificationService:
     
     @staticmethod
     def get_user_notification_stats(user):
-        """الحصول على إحصائيات إشعارات المستخدم"""
-        notifications = user.notifications.all()
+        """الحصول على إحصائيات إشعارات المستخدم (من الملخص المخزن - انظر notifications/summary.py)"""
+        fields = summary.get_summary(user.pk)
         
-        total_count = notifications.count()
-        unread_count = notifications.filter(is_read=False).count()
+        total_count = max(0, fields.get(summary.TOTAL, 0))
+        unread_count = max(0, fields.get(summary.UNREAD, 0))
         read_count = total_count - unread_count
         
         # إحصائيات حسب النوع
         by_type = {}
-        for choice in NotificationType.choices:
-            type_count = notifications.filter(type=choice[0]).count()
+        for value, label in NotificationType.choices:
+            type_count = fields.get(f't:{value}', 0)
             if type_count > 0:
-                by_type[choice[0]] = {
+                by_type[value] = {
                     'count': type_count,
-                    'label': choice[1]
+                    'label': label
                 }
         
         # إحصائيات حسب الأولوية
         by_priority = {}
-        for choice in NotificationPriority.choices:
-            priority_count = notifications.filter(priority=choice[0]).count()
+        for value, label in NotificationPriority.choices:
+            priority_count = fields.get(f'p:{value}', 0)
             if priority_count > 0:
-                by_priority[choice[0]] = {
+                by_priority[value] = {
                     'count': priority_count,
-                    'label': choice[1]
+                    'label': label
                 }
         
         return {
@@ -370,18 +443,15 @@ class NotificationService:
             is_read=True,
             read_at=timezone.now()
         )
+        summary.record_all_read(user.pk)
         
         logger.info(f"Marked {updated_count} notifications as read for user {user.email}")
         return updated_count
     
     @staticmethod
     def cleanup_old_notifications(days=30):
-        """حذف الإشعارات القديمة"""
-        cutoff_date = timezone.now() - timezone.timedelta(days=days)
-        deleted_count = Notification.objects.filter(
-            created_at__lt=cutoff_date,
-            is_read=True
-        ).delete()[0]
+        """حذف الإشعارات القديمة المقروءة على دفعات (انظر notifications/retention.py)"""
+        deleted_count, _ = retention.purge(days)
         
         logger.info(f"Cleaned up {deleted_count} old notifications")
         return deleted_count
@@ -404,13 +474,9 @@ class NotificationService:
             send_fcm: إرسال عبر FCM
             send_email: إرسال عبر البريد الإلكتروني
         """
-        # الحصول على القالب
-        try:
-            if isinstance(template_name_or_id, int):
-                template = NotificationTemplate.objects.get(id=template_name_or_id, is_active=True)
-            else:
-                template = NotificationTemplate.objects.get(name=template_name_or_id, is_active=True)
-        except NotificationTemplate.DoesNotExist:
+        # الحصول على القالب (محلل ومخزن - انظر notifications/templating.py)
+        template = templating.get_template(template_name_or_id)
+        if template is None:
             logger.error(f"Template not found: {template_name_or_id}")
             return []
         
@@ -423,61 +489,53 @@ class NotificationService:
         else:
             users = User.objects.filter(is_active=True)
         
-        # إنشاء الإشعارات
-        notifications = []
-        for user in users:
-            # استبدال المتغيرات الخاصة بالمستخدم
-            user_context = context.copy()
-            user_context.update({
-                'user_name': user.name or user.email,
-                'user_email': user.email,
-            })
+        push = send_fcm and is_fcm_enabled()
+        created_notifications = []
+        message = None
+        for chunk in audience.iter_row_chunks(users, ('name', 'email')):
+            rendered = templating.render_chunk(template, context, chunk)
+            chunk_ids = [user_id for user_id, _, _ in rendered]
+            emails = {user_id: email for user_id, _, email in chunk}
             
-            user_title = template.title_template.format(**user_context)
-            user_body = template.body_template.format(**user_context)
+            if not template.personalized:
+                # نفس العنوان والمحتوى للجميع: رسالة واحدة + صف استلام لكل مستخدم
+                _, title, body = rendered[0]
+                if message is None:
+                    message = audience.build_message(
+                        title, body, template.type, template.priority, context
+                    )
+                    message.save()
+                created_notifications.extend(audience.create_deliveries_chunk(chunk_ids, message))
+                if push:
+                    audience.enqueue_push_chunk(chunk_ids, title, body, context)
+            else:
+                notifications = Notification.objects.bulk_create([
+                    Notification(
+                        user_id=user_id,
+                        title=title,
+                        body=body,
+                        type=template.type,
+                        priority=template.priority,
+                        data=context
+                    )
+                    for user_id, title, body in rendered
+                ])
+                summary.record_created(chunk_ids, template.type, template.priority)
+                created_notifications.extend(notifications)
+                if push:
+                    audience.enqueue_personalized_push_chunk(rendered, context)
             
-            notifications.append(Notification(
-                user=user,
-                title=user_title,
-                body=user_body,
-                type=template.type,
-                priority=template.priority,
-                data=context
-            ))
-        
-        # حفظ الإشعارات
-        created_notifications = Notification.objects.bulk_create(notifications, batch_size=1000)
-        
-        # إرسال FCM
-        if send_fcm:
-            for user in users:
-                user_context = context.copy()
-                user_context.update({
-                    'user_name': user.name or user.email,
-                    'user_email': user.email,
-                })
-                user_title = template.title_template.format(**user_context)
-                user_body = template.body_template.format(**user_context)
-                
-                NotificationService._send_fcm_to_user(user, user_title, user_body, context)
-        
-        # إرسال بريد إلكتروني
-        if send_email:
-            for user in users:
-                user_context = context.copy()
-                user_context.update({
-                    'user_name': user.name or user.email,
-                    'user_email': user.email,
-                })
-                user_title = template.title_template.format(**user_context)
-                user_body = template.body_template.format(**user_context)
-                
-                EmailNotificationService.send_notification_email(
-                    user=user,
-                    subject=user_title,
-                    message=user_body,
-                    priority=template.priority
-                )
+            # إرسال بريد إلكتروني
+            if send_email:
+                for user_id, title, body in rendered:
+                    EmailNotificationService.send_notification_email(
+                        user=User(pk=user_id, email=emails[user_id]),
+                        subject=title,
+                        message=body,
+                        priority=template.priority
+                    )
         
+        if message is not None:
+            audience.finish_message(message, len(created_notifications))
         logger.info(f"Sent {len(created_notifications)} notifications using template '{template.name}'")
         return created_notifications
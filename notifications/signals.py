@@ -1,7 +1,9 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from .models import Notification, NotificationTemplate
 from .services import NotificationService
+from . import summary, templating
 import logging
 
 logger = logging.getLogger(__name__)
@@ -112,6 +114,23 @@ try:
 except ImportError:
     logger.warning("Pricing app not found, promotion notifications disabled")
 
+# ملخص الإشعارات (bulk_create يحدّث الملخص مباشرة في audience.py)
+@receiver(post_save, sender=Notification)
+def update_notification_summary(sender, instance, created, **kwargs):
+    """تحديث ملخص المستخدم عند إنشاء إشعار أو تعليمه كمقروء (mark_as_read)"""
+    if created:
+        summary.record_created([instance.user_id], instance.type, instance.priority, instance.is_read)
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and 'is_read' in update_fields and instance.is_read:
+        summary.record_read(instance.user_id)
+
+# قوالب الإشعارات: إهمال النسخ المخزنة بعد أي تعديل
+@receiver(post_save, sender=NotificationTemplate)
+@receiver(post_delete, sender=NotificationTemplate)
+def invalidate_notification_templates(sender, instance, **kwargs):
+    templating.invalidate_templates()
+
 # إشارات المستخدمين
 @receiver(post_save, sender=User)
 def send_welcome_notification(sender, instance, created, **kwargs):
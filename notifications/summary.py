@@ -0,0 +1,245 @@
+"""
+ملخص إشعارات المستخدم (شارة غير المقروء والإحصائيات) في الكاش
+
+لكل مستخدم hash واحد: total و unread وعدد كل نوع (t:<type>) وكل أولوية (p:<priority>).
+- القراءة: HGETALL واحد؛ عند غياب الملخص يُحسب باستعلام GROUP BY واحد ويُخزن.
+- الكتابة تزايدية: الإنشاء (فردي أو bulk_create لدفعة) والقراءة والحذف تعدّل
+  الحقول مباشرة، وفقط إذا كان الملخص موجوداً (لا يُنشأ ملخص جزئي).
+- العمليات الجماعية غير المحددة (حذف المقروء، تنظيف قديم، إجراءات الإدارة) تحذف
+  الملخص ليُعاد حسابه عند الطلب التالي.
+
+الإعداد:
+    NOTIFICATIONS_CONFIG = {'SUMMARY_TTL': 86400}
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUMMARY_TTL = 60 * 60 * 24
+
+SUMMARY_KEY = 'notif:summary:{user_id}'
+
+TOTAL = 'total'
+UNREAD = 'unread'
+
+
+def get_summary_ttl():
+    config = getattr(settings, 'NOTIFICATIONS_CONFIG', {})
+    return int(config.get('SUMMARY_TTL', DEFAULT_SUMMARY_TTL))
+
+
+def _key(user_id):
+    return SUMMARY_KEY.format(user_id=user_id)
+
+
+def _delta(notification_type, priority, is_read=False, sign=1):
+    """الحقول التي يغيرها إشعار واحد"""
+    delta = {TOTAL: sign, f't:{notification_type}': sign, f'p:{priority}': sign}
+    if not is_read:
+        delta[UNREAD] = sign
+    return delta
+
+
+class RedisSummaryStore:
+    """hash لكل مستخدم في Redis - كل عملية جماعية في pipeline واحد"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, user_id):
+        raw = self.client.hgetall(_key(user_id))
+        if not raw:
+            return None
+        return {
+            (k.decode() if isinstance(k, bytes) else k): int(v)
+            for k, v in raw.items()
+        }
+
+    def set(self, user_id, fields, ttl):
+        key = _key(user_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    def incr_many(self, user_ids, delta):
+        keys = [_key(user_id) for user_id in user_ids]
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(key)
+        existing = [key for key, exists in zip(keys, pipe.execute()) if exists]
+        if not existing:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key in existing:
+            for field, amount in delta.items():
+                pipe.hincrby(key, field, amount)
+        pipe.execute()
+
+    def set_field(self, user_id, field, value):
+        key = _key(user_id)
+        if self.client.exists(key):
+            self.client.hset(key, field, value)
+
+    def delete_many(self, user_ids):
+        if user_ids:
+            self.client.delete(*[_key(user_id) for user_id in user_ids])
+
+
+class CacheSummaryStore:
+    """
+    بديل عبر Django cache (قيمة dict) عند عدم استخدام django-redis - للتطوير والاختبار.
+    التحديث قراءة ثم كتابة، لذا ليس ذرياً بين العمليات.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        return cache.get(_key(user_id))
+
+    def set(self, user_id, fields, ttl):
+        cache.set(_key(user_id), dict(fields), ttl)
+
+    def incr_many(self, user_ids, delta):
+        keys = [_key(user_id) for user_id in user_ids]
+        ttl = get_summary_ttl()
+        with self._lock:
+            current = cache.get_many(keys)
+            for fields in current.values():
+                for field, amount in delta.items():
+                    fields[field] = fields.get(field, 0) + amount
+            if current:
+                cache.set_many(current, ttl)
+
+    def set_field(self, user_id, field, value):
+        with self._lock:
+            fields = cache.get(_key(user_id))
+            if fields is not None:
+                fields[field] = value
+                cache.set(_key(user_id), fields, get_summary_ttl())
+
+    def delete_many(self, user_ids):
+        cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_summary_store():
+    """اختيار مخزن الملخص حسب الـ cache المستخدم (Redis أو Django cache)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    from django_redis import get_redis_connection
+                    _store = RedisSummaryStore(get_redis_connection('default'))
+                except (ImportError, NotImplementedError):
+                    _store = CacheSummaryStore()
+    return _store
+
+
+# ===== الحساب من قاعدة البيانات =====
+
+def compute(user_id):
+    """حساب الملخص باستعلام GROUP BY واحد"""
+    from .models import Notification
+
+    fields = {TOTAL: 0, UNREAD: 0}
+    rows = (
+        Notification.objects.filter(user_id=user_id)
+        .order_by()
+        .values_list('type', 'priority', 'is_read')
+        .annotate(n=Count('id'))
+    )
+    for notification_type, priority, is_read, n in rows:
+        for field, amount in _delta(notification_type, priority, is_read, sign=n).items():
+            fields[field] = fields.get(field, 0) + amount
+    return fields
+
+
+def get_summary(user_id):
+    """حقول الملخص الخام من الكاش، أو بإعادة الحساب وتخزينها"""
+    store = get_summary_store()
+    try:
+        fields = store.get(user_id)
+        if fields is not None:
+            return fields
+    except Exception as e:
+        logger.warning(f'notification summary get failed for user {user_id}: {e}')
+
+    fields = compute(user_id)
+    try:
+        store.set(user_id, fields, get_summary_ttl())
+    except Exception as e:
+        logger.warning(f'notification summary set failed for user {user_id}: {e}')
+    return fields
+
+
+def get_unread_count(user_id):
+    return max(0, get_summary(user_id).get(UNREAD, 0))
+
+
+# ===== التحديث التزايدي =====
+
+def record_created(user_ids, notification_type, priority, is_read=False):
+    """إشعار واحد جديد لكل مستخدم في user_ids (بنفس النوع والأولوية)"""
+    if not user_ids:
+        return
+    try:
+        get_summary_store().incr_many(user_ids, _delta(notification_type, priority, is_read))
+    except Exception as e:
+        logger.warning(f'notification summary update failed for {len(user_ids)} users: {e}')
+        invalidate(user_ids)
+
+
+def record_read(user_id, count=1):
+    if count <= 0:
+        return
+    try:
+        get_summary_store().incr_many([user_id], {UNREAD: -count})
+    except Exception as e:
+        logger.warning(f'notification summary update failed for user {user_id}: {e}')
+        invalidate([user_id])
+
+
+def record_all_read(user_id):
+    try:
+        get_summary_store().set_field(user_id, UNREAD, 0)
+    except Exception as e:
+        logger.warning(f'notification summary update failed for user {user_id}: {e}')
+        invalidate([user_id])
+
+
+def record_deleted(notification):
+    """حذف إشعار واحد (بعد notification.delete())"""
+    try:
+        get_summary_store().incr_many(
+            [notification.user_id],
+            _delta(notification.type, notification.priority, notification.is_read, sign=-1)
+        )
+    except Exception as e:
+        logger.warning(f'notification summary update failed for user {notification.user_id}: {e}')
+        invalidate([notification.user_id])
+
+
+def invalidate(user_ids):
+    """حذف ملخصات المستخدمين ليُعاد حسابها"""
+    user_ids = list(user_ids)
+    try:
+        get_summary_store().delete_many(user_ids)
+    except Exception as e:
+        logger.warning(f'notification summary invalidation failed for {len(user_ids)} users: {e}')
+
+
+def affected_users(queryset):
+    """معرفات أصحاب إشعارات QuerySet (تُقرأ قبل update/delete جماعي ثم تُمرر إلى invalidate)"""
+    return list(queryset.order_by().values_list('user_id', flat=True).distinct())
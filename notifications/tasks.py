@@ -4,6 +4,7 @@ from celery import shared_task
 from django.contrib.auth import get_user_model
 from .services import NotificationService
 from .models import NotificationType, NotificationPriority
+from . import audience, email_queue, fcm_fanout
 from pricing.models import Promotion, Offer # استيراد النماذج من تطبيق التسعير
 
 import logging
@@ -13,23 +14,21 @@ User = get_user_model()
 
 
 @shared_task(bind=True, max_retries=3)
-def send_promotion_notification_task(self, promotion_id):
+def send_promotion_notification_task(self, promotion_id, progress=None):
     """
     مهمة خلفية لإرسال إشعارات الخصم الجديد.
     """
+    # تقدم الإرسال (الرسالة وآخر معرف) يُمرر لإعادة المحاولة
+    progress = {} if progress is None else progress
     try:
         promo = Promotion.objects.get(id=promotion_id)
         
         logger.info(f"Executing task for promotion: {promo.name}")
         
-        # جلب جميع المستخدمين النشطين (ليسوا staff أو vendors)
-        active_users_ids = list(User.objects.filter(
-            is_active=True,
-            is_staff=False,
-            is_vendor=False
-        ).values_list('id', flat=True))
+        # جمهور العملاء النشطين (ليسوا staff أو vendors) - يُقرأ على دفعات
+        customers = audience.customers_queryset()
         
-        if not active_users_ids:
+        if not customers.exists():
             logger.warning("No active users found to send promotion notifications.")
             return
 
@@ -49,44 +48,43 @@ def send_promotion_notification_task(self, promotion_id):
             'promotion_id': str(promo.id),
         }
 
-        NotificationService.send_notification_to_users(
-            user_ids=active_users_ids,
+        sent_count = audience.send_to_audience(
+            customers,
             title=title,
             body=body,
             notification_type=NotificationType.PROMOTION,
             priority=NotificationPriority.HIGH,
             related_id=promo.id,
             data=data,
-            send_fcm=True
+            send_fcm=True,
+            progress=progress
         )
         
-        logger.info(f"Promotion notification successfully sent to {len(active_users_ids)} users.")
+        logger.info(f"Promotion notification successfully sent to {sent_count} users.")
 
     except Promotion.DoesNotExist:
         logger.warning(f"Promotion with ID {promotion_id} does not exist. Task will not run.")
     except Exception as e:
         logger.error(f"Error in send_promotion_notification_task: {e}", exc_info=True)
-        # إعادة محاولة المهمة في حالة حدوث خطأ غير متوقع
-        raise self.retry(exc=e, countdown=60)
+        # الاستئناف بعد آخر دفعة ناجحة بدلاً من إعادة الإرسال للجميع
+        raise self.retry(exc=e, countdown=60, kwargs={'promotion_id': promotion_id, 'progress': progress})
 
 
 @shared_task(bind=True, max_retries=3)
-def send_offer_notification_task(self, offer_id):
+def send_offer_notification_task(self, offer_id, progress=None):
     """
     مهمة خلفية لإرسال إشعارات العرض الجديد.
     """
+    # تقدم الإرسال (الرسالة وآخر معرف) يُمرر لإعادة المحاولة
+    progress = {} if progress is None else progress
     try:
         offer = Offer.objects.get(id=offer_id)
 
         logger.info(f"Executing task for offer: {offer.name}")
 
-        active_users_ids = list(User.objects.filter(
-            is_active=True,
-            is_staff=False,
-            is_vendor=False
-        ).values_list('id', flat=True))
+        customers = audience.customers_queryset()
         
-        if not active_users_ids:
+        if not customers.exists():
             logger.warning("No active users found to send offer notifications.")
             return
 
@@ -106,21 +104,123 @@ def send_offer_notification_task(self, offer_id):
             'offer_id': str(offer.id),
         }
         
-        NotificationService.send_notification_to_users(
-            user_ids=active_users_ids,
+        sent_count = audience.send_to_audience(
+            customers,
             title=title,
             body=body,
             notification_type=NotificationType.PROMOTION,
             priority=NotificationPriority.HIGH,
             related_id=offer.id,
             data=data,
-            send_fcm=True
+            send_fcm=True,
+            progress=progress
         )
 
-        logger.info(f"Offer notification successfully sent to {len(active_users_ids)} users.")
+        logger.info(f"Offer notification successfully sent to {sent_count} users.")
 
     except Offer.DoesNotExist:
         logger.warning(f"Offer with ID {offer_id} does not exist. Task will not run.")
     except Exception as e:
         logger.error(f"Error in send_offer_notification_task: {e}", exc_info=True)
-        raise self.retry(exc=e, countdown=60)
\ No newline at end of file
+        # الاستئناف بعد آخر دفعة ناجحة بدلاً من إعادة الإرسال للجميع
+        raise self.retry(exc=e, countdown=60, kwargs={'offer_id': offer_id, 'progress': progress})
+
+
+@shared_task(bind=True, max_retries=3)
+def send_product_announcement_task(self, product_id, progress=None):
+    """
+    مهمة خلفية لإعلان منتج جديد لجميع العملاء (على دفعات).
+    """
+    from products.models import Product
+
+    # تقدم الإرسال (الرسالة وآخر معرف) يُمرر لإعادة المحاولة
+    progress = {} if progress is None else progress
+
+    try:
+        product = Product.objects.select_related('store', 'store__owner').get(id=product_id)
+        store = product.store
+
+        sent_count = audience.send_to_audience(
+            audience.customers_queryset(),
+            title=f'منتج جديد في {store.name}! 🎁',
+            body=f'{product.name} - متوفر الآن',
+            notification_type=NotificationType.PRODUCT,
+            priority=NotificationPriority.NORMAL,
+            related_id=product.id,
+            image_url=product.cover_image_url,
+            data={
+                'type': 'product',
+                'product_id': str(product.id),
+                'related_id': str(product.id),
+                'store_id': str(store.id),
+                'store_name': store.name
+            },
+            progress=progress
+        )
+
+        if sent_count:
+            # 📊 إشعار للبائع مع عدد المستخدمين
+            NotificationService.send_notification_to_user(
+                user=store.owner,
+                title='تم إضافة منتج جديد ✅',
+                body=f'تم نشر {product.name} لـ {sent_count} مستخدم',
+                notification_type=NotificationType.PRODUCT,
+                priority=NotificationPriority.NORMAL,
+                related_id=product.id
+            )
+
+    except Product.DoesNotExist:
+        logger.warning(f"Product with ID {product_id} does not exist. Task will not run.")
+    except Exception as e:
+        logger.error(f"Error in send_product_announcement_task: {e}", exc_info=True)
+        # الاستئناف بعد آخر دفعة ناجحة بدلاً من إعادة الإرسال للجميع
+        raise self.retry(exc=e, countdown=60, kwargs={'product_id': product_id, 'progress': progress})
+
+
+@shared_task
+def send_fcm_chunk_task(user_ids, title, body, data=None, image_url=None):
+    """
+    مهمة إرسال FCM لدفعة واحدة من الجمهور (تُجدول من notifications.audience).
+    """
+    result = fcm_fanout.send_to_users(user_ids, title, body, data, image_url)
+    return {
+        'tokens': result.token_count,
+        'success': result.success_count,
+        'failure': result.failure_count,
+        'deactivated': result.deactivated_count,
+    }
+
+
+@shared_task
+def send_fcm_personalized_chunk_task(rendered, data=None, image_url=None):
+    """
+    مهمة إرسال FCM مخصص لدفعة واحدة: rendered = [(user_id, title, body), ...].
+    """
+    result = fcm_fanout.send_personalized([tuple(row) for row in rendered], data, image_url)
+    return {
+        'tokens': result.token_count,
+        'success': result.success_count,
+        'failure': result.failure_count,
+        'deactivated': result.deactivated_count,
+    }
+
+
+@shared_task(bind=True)
+def send_emails_task(self, payloads):
+    """
+    مهمة إرسال دفعة بريد (تُجدول من notifications.email_queue) عبر اتصال SMTP
+    المشترك في عملية العامل. عند الفشل تُعاد المهمة بالرسائل التي لم تُرسل فقط
+    (countdown بـ backoff أسي) بدلاً من الانتظار داخل العامل.
+    """
+    try:
+        return email_queue.get_mailer().send_batch(payloads, retries=0)
+    except email_queue.EmailBatchError as e:
+        max_retries = email_queue.get_task_max_retries()
+        if self.request.retries >= max_retries:
+            logger.error(f"Dropped {len(e.unsent)} emails after {max_retries} retries: {[p['to'] for p in e.unsent]}")
+            return e.sent
+        raise self.retry(
+            args=[e.unsent],
+            countdown=email_queue.get_retry_delay(self.request.retries),
+            max_retries=max_retries,
+        )
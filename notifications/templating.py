@@ -0,0 +1,185 @@
+"""
+قوالب الإشعارات: تحليل مرة واحدة وكاش للقوالب المستخدمة
+
+- compile_template(): يحلل نص القالب ({user_name}, {order_id}, ...) مرة واحدة لكل
+  نص (lru_cache) إلى أجزاء جاهزة، فالعرض لكل مستلم مجرد join بدون إعادة تحليل.
+- get_template(): بيانات القالب النشط من الكاش (بالاسم أو المعرف) بدون استعلام
+  لكل إرسال؛ أي حفظ أو حذف لقالب يرفع رقم الجيل فتُهمل جميع النسخ المخزنة.
+- render_chunk(): عرض القالب لدفعة مستخدمين كاملة؛ إذا لم يستخدم القالب متغيرات
+  المستخدم يُعرض مرة واحدة للدفعة.
+"""
+import logging
+import string
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_CACHE_TTL = 60 * 60
+
+GENERATION_KEY = 'notif:templates:gen'
+TEMPLATE_KEY = 'notif:template:{generation}:{ref}'
+
+# متغيرات تُملأ من بيانات كل مستخدم
+USER_FIELDS = frozenset({'user_name', 'user_email'})
+
+_formatter = string.Formatter()
+
+
+def get_template_cache_ttl():
+    config = getattr(settings, 'NOTIFICATIONS_CONFIG', {})
+    return int(config.get('TEMPLATE_CACHE_TTL', DEFAULT_TEMPLATE_CACHE_TTL))
+
+
+class CompiledTemplate:
+    """نص قالب محلل مسبقاً؛ render(context) يطابق source.format(**context)"""
+
+    __slots__ = ('source', 'parts', 'fields')
+
+    def __init__(self, source):
+        self.source = source
+        self.parts = []
+        fields = set()
+        for literal, field, spec, conversion in _formatter.parse(source):
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if field.isidentifier() and not conversion and '{' not in (spec or ''):
+                # الحالة الشائعة: {name} أو {name:spec}
+                self.parts.append((field, spec or ''))
+            else:
+                # صيغ نادرة ({obj.attr}, {items[0]}, {x!r}, ...) تُترك لـ format_map
+                text = '{' + field + ('!' + conversion if conversion else '') + (':' + spec if spec else '') + '}'
+                self.parts.append((None, text))
+            fields.add(field.split('.', 1)[0].split('[', 1)[0])
+        self.fields = frozenset(fields)
+
+    def render(self, context):
+        out = []
+        for part in self.parts:
+            if isinstance(part, str):
+                out.append(part)
+            elif part[0] is None:
+                out.append(part[1].format_map(context))
+            else:
+                out.append(format(context[part[0]], part[1]))
+        return ''.join(out)
+
+
+@lru_cache(maxsize=512)
+def compile_template(source):
+    return CompiledTemplate(source)
+
+
+@dataclass(frozen=True)
+class TemplateSnapshot:
+    """بيانات قالب نشط مع نصوصه المحللة"""
+    id: int
+    name: str
+    type: str
+    priority: str
+    title: CompiledTemplate
+    body: CompiledTemplate
+
+    @property
+    def personalized(self):
+        """هل يعتمد العنوان أو المحتوى على بيانات المستخدم؟"""
+        return bool((self.title.fields | self.body.fields) & USER_FIELDS)
+
+
+# ===== كاش القوالب =====
+
+def _generation():
+    try:
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            # بداية جديدة (أو تم طرد المفتاح): قيمة مختلفة عن أي جيل سابق
+            cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+            generation = cache.get(GENERATION_KEY)
+        return generation
+    except Exception as e:
+        logger.warning(f'notification template generation read failed: {e}')
+        return None
+
+
+def invalidate_templates():
+    """رفع رقم الجيل بعد حفظ أو حذف أي قالب"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+    except Exception as e:
+        logger.warning(f'notification template invalidation failed: {e}')
+
+
+def _load(template_name_or_id):
+    from .models import NotificationTemplate
+
+    lookup = {'id': template_name_or_id} if isinstance(template_name_or_id, int) else {'name': template_name_or_id}
+    return (
+        NotificationTemplate.objects.filter(is_active=True, **lookup)
+        .values('id', 'name', 'type', 'priority', 'title_template', 'body_template')
+        .first()
+    )
+
+
+def get_template(template_name_or_id):
+    """القالب النشط بالاسم أو المعرف (TemplateSnapshot)، أو None"""
+    ref = f'id:{template_name_or_id}' if isinstance(template_name_or_id, int) else f'name:{template_name_or_id}'
+    generation = _generation()
+    key = TEMPLATE_KEY.format(generation=generation, ref=ref) if generation is not None else None
+
+    row = None
+    if key:
+        try:
+            row = cache.get(key)
+        except Exception as e:
+            logger.warning(f'notification template cache get failed for {ref}: {e}')
+    if row is None:
+        row = _load(template_name_or_id)
+        if row is None:
+            return None
+        if key:
+            try:
+                cache.set(key, row, get_template_cache_ttl())
+            except Exception as e:
+                logger.warning(f'notification template cache set failed for {ref}: {e}')
+
+    return TemplateSnapshot(
+        id=row['id'],
+        name=row['name'],
+        type=row['type'],
+        priority=row['priority'],
+        title=compile_template(row['title_template']),
+        body=compile_template(row['body_template']),
+    )
+
+
+# ===== العرض على دفعات =====
+
+def user_context(context, name, email):
+    """سياق مستخدم واحد (متغيرات القالب + بيانات المستخدم)"""
+    return {**context, 'user_name': name or email, 'user_email': email}
+
+
+def render_chunk(template, context, users):
+    """
+    عرض القالب لدفعة مستخدمين [(id, name, email), ...].
+    ترجع [(user_id, title, body), ...]؛ القالب غير المخصص يُعرض مرة واحدة للدفعة.
+    """
+    if not users:
+        return []
+    if not template.personalized:
+        title = template.title.render(context)
+        body = template.body.render(context)
+        return [(user_id, title, body) for user_id, _, _ in users]
+    rendered = []
+    for user_id, name, email in users:
+        ctx = user_context(context, name, email)
+        rendered.append((user_id, template.title.render(ctx), template.body.render(ctx)))
+    return rendered
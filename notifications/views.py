@@ -17,6 +17,7 @@ from .serializers import (
     NotificationStatsSerializer
 )
 from .services import NotificationService
+from . import summary
 
 
 class NotificationPagination(PageNumberPagination):
@@ -33,13 +34,13 @@ class NotificationListView(generics.ListAPIView):
     pagination_class = NotificationPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['type', 'priority', 'is_read']
-    search_fields = ['title', 'body']
+    search_fields = ['title', 'body', 'message__title', 'message__body']
     ordering_fields = ['created_at', 'priority']
     ordering = ['-created_at']
     
     def get_queryset(self):
         """الحصول على إشعارات المستخدم الحالي فقط"""
-        queryset = Notification.objects.filter(user=self.request.user)
+        queryset = Notification.objects.filter(user=self.request.user).select_related('message')
         
         # فلترة حسب حالة القراءة
         is_read = self.request.query_params.get('is_read')
@@ -65,7 +66,7 @@ class NotificationDetailView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        return Notification.objects.filter(user=self.request.user).select_related('message')
     
     def retrieve(self, request, *args, **kwargs):
         """تعليم الإشعار كمقروء عند عرضه"""
@@ -130,6 +131,7 @@ def delete_notification(request, notification_id):
             user=request.user
         )
         notification.delete()
+        summary.record_deleted(notification)
         
         return Response({
             'success': True,
@@ -148,6 +150,8 @@ def delete_all_read_notifications(request):
     """حذف جميع الإشعارات المقروءة"""
     try:
         deleted_count = request.user.notifications.filter(is_read=True).delete()[0]
+        if deleted_count:
+            summary.invalidate([request.user.pk])
         
         return Response({
             'success': True,
@@ -180,6 +184,22 @@ def notification_stats(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def unread_count(request):
+    """عدد الإشعارات غير المقروءة (شارة التطبيق) - قراءة واحدة من الملخص المخزن"""
+    try:
+        return Response({
+            'success': True,
+            'unread_count': summary.get_unread_count(request.user.pk)
+        })
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
 class FCMDeviceCreateView(generics.CreateAPIView):
     """تسجيل جهاز FCM جديد"""
     serializer_class = FCMDeviceSerializer
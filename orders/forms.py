@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from orders.models import Order, OrderItem
 from stores.models import Store
+from project import presence
 
 User = get_user_model()
 
@@ -94,6 +95,12 @@ class OrderForm(forms.ModelForm):
             self.fields['delivery_agent'].required = False
             self.fields['delivery_agent'].empty_label = "-- بدون مندوب حالياً --"
 
+            # تمييز المندوبين المتصلين حالياً (من خدمة الحضور بدون استعلامات إضافية)
+            online_ids = presence.online_user_ids(presence.DRIVERS)
+            self.fields['delivery_agent'].label_from_instance = (
+                lambda u: f"{u} 🟢" if u.pk in online_ids else str(u)
+            )
+
     def clean_grand_total(self):
         """التحقق من إجمالي المبلغ"""
         grand_total = self.cleaned_data.get('grand_total')
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import CartItem
 from stores.models import Store
+from core.serializers import prime_variant_images, variant_image_url
+from .serializers import cart_item_image_url
 
 
 class GroupedCartItemSerializer(serializers.ModelSerializer):
@@ -25,12 +27,10 @@ class GroupedCartItemSerializer(serializers.ModelSerializer):
     def get_image_url(self, obj):
         try:
             request = self.context.get('request')
-            if obj.variant.cover_image_url:
-                url = obj.variant.cover_image_url
-            elif obj.variant.product.cover_image_url:
-                url = obj.variant.product.cover_image_url
-            else:
+            url = cart_item_image_url(obj)
+            if not url:
                 return None
+            url = variant_image_url(self, url, 'thumb')
             
             # إذا كان URL نسبي، حوله لمطلق
             if request and url and not url.startswith('http'):
@@ -52,6 +52,11 @@ class GroupedCartByStoreSerializer(serializers.Serializer):
     def to_representation(self, instance):
         # instance is a dict with store info and items
         request = self.context.get('request')
+
+        # صور السلة كلها (كل المتاجر) في قراءة واحدة قبل أول مجموعة
+        groups = self.root.instance if isinstance(self.root, serializers.ListSerializer) else [instance]
+        items = (item for group in groups for item in group['items'])
+        prime_variant_images(self, 'cart_items', items, cart_item_image_url)
         
         # معالجة URLs النسبية للصور
         logo = instance['logo']
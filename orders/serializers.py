@@ -1,6 +1,12 @@
 from rest_framework import serializers
 from .models import CartItem, Order, OrderItem
 from products.models import ProductVariant
+from core.serializers import variant_image_url
+
+
+def cart_item_image_url(item):
+    """صورة عنصر السلة: صورة الـ variant أو صورة المنتج"""
+    return item.variant.cover_image_url or item.variant.product.cover_image_url
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -49,12 +55,12 @@ class CartItemSerializer(serializers.ModelSerializer):
         """إرجاع URL صالح لصورة المنتج في السلة"""
         try:
             request = self.context.get('request')
-            # استخدم صورة الـ variant أو صورة المنتج
-            if obj.variant.cover_image_url:
-                return request.build_absolute_uri(obj.variant.cover_image_url) if request else obj.variant.cover_image_url
-            elif obj.variant.product.cover_image_url:
-                return request.build_absolute_uri(obj.variant.product.cover_image_url) if request else obj.variant.product.cover_image_url
-            return None
+            # استخدم صورة الـ variant أو صورة المنتج (النسخة المصغرة)
+            url = cart_item_image_url(obj)
+            if not url:
+                return None
+            url = variant_image_url(self, url, 'thumb', url_of=cart_item_image_url)
+            return request.build_absolute_uri(url) if request else url
         except Exception:
             return None
 
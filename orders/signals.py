@@ -275,6 +275,8 @@ from project.websocket_utils import notify_new_order, notify_order_status_change
 
 # ===== إضافة WebSocket للموصل - بداية التعديل =====
 from project.driver_notifications_service import notify_new_order_available
+from project import order_access
+from django.db import transaction
 # ===== إضافة WebSocket للموصل - نهاية التعديل =====
 
 
@@ -491,3 +493,24 @@ def order_deleted(sender, instance, **kwargs):
     stats = get_dashboard_stats()
     notify_stats_update(stats)
 
+
+
+# ===== كاش صلاحيات متابعة الطلب (OrderTrackingConsumer) =====
+ORDER_ACCESS_FIELDS = {'user', 'store', 'delivery_agent'}
+
+
+@receiver(post_save, sender=Order)
+def refresh_order_access_cache(sender, instance, created, update_fields=None, **kwargs):
+    """
+    تحديث أطراف الطلب في الكاش مباشرة (بدون استعلام) بعد نجاح المعاملة، حتى لا
+    يبقى موصل معين في معاملة تراجعت مخولاً بالمتابعة والنشر
+    """
+    if update_fields and not ORDER_ACCESS_FIELDS.intersection(update_fields):
+        return
+    parties = (instance.pk, instance.user_id, instance.store_id, instance.delivery_agent_id)
+    transaction.on_commit(lambda: order_access.cache_order_parties(*parties))
+
+
+@receiver(post_delete, sender=Order)
+def drop_order_access_cache(sender, instance, **kwargs):
+    order_access.invalidate_order(instance.pk)
@@ -103,9 +103,11 @@ from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.exceptions import ValidationError, PermissionDenied  # ✅ الاستثناءات الصحيحة
 
-from pricing.utils import get_and_validate_store, parse_aware_datetime
+from pricing.utils import get_and_validate_store, parse_aware_datetime, validate_store_id
 from products.models import Product
 from stores.models import Store
+from stores.vendor_context import get_owned_store_ids, scope_to_owned
+from project.ratelimit import RateLimitThrottle
 from .models import Promotion, Coupon, Offer
 from .serializers import PromotionSerializer, CouponSerializer, OfferSerializer
 from .permissions import IsVendor, IsObjectOwner  # ✅ استيراد الصلاحيات من ملف منفصل
@@ -113,6 +115,9 @@ from .mixins import ApprovalMixin  # ✅ استيراد الـ Mixin من ملف
 
 logger = logging.getLogger(__name__)
 
+# إجراءات البائع على عرض/كوبون قائم: الـ queryset مقصور على متاجره
+OWNER_ACTIONS = ('update', 'partial_update', 'destroy', 'toggle_status')
+
 # ======================================================================
 #                           ViewSets
 # ======================================================================
@@ -137,6 +142,9 @@ class PromotionViewSet(ApprovalMixin, viewsets.ModelViewSet):
         
         # إذا كان المستخدم بائع ويعدل عروضه، إرجاع الكل
         if self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'toggle_status']:
+            if self.action in OWNER_ACTIONS:
+                # تعديل/حذف: عروض متاجر البائع فقط (من سياق البائع المخزن)
+                return scope_to_owned(queryset, self.request.user)
             return queryset
         
         # للقراءة العامة: العروض النشطة والمعتمدة فقط
@@ -188,6 +196,9 @@ class PromotionViewSet(ApprovalMixin, viewsets.ModelViewSet):
 class CouponViewSet(ApprovalMixin, viewsets.ModelViewSet):
     """ViewSet للكوبونات مع الحماية عبر IsObjectOwner"""
     serializer_class = CouponSerializer
+    # منع تخمين الأكواد: validate فقط (project/ratelimit.py)
+    throttle_classes = [RateLimitThrottle]
+    ratelimit_scopes = {'validate': ['coupon_validate']}
     
     def get_queryset(self):
         """
@@ -198,6 +209,9 @@ class CouponViewSet(ApprovalMixin, viewsets.ModelViewSet):
         
         # إذا كان المستخدم بائع ويعدل كوبوناته، إرجاع الكل
         if self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'toggle_status']:
+            if self.action in OWNER_ACTIONS:
+                # تعديل/حذف: كوبونات متاجر البائع فقط (من سياق البائع المخزن)
+                return scope_to_owned(queryset, self.request.user)
             return queryset
         
         # للقراءة والتحقق: الكوبونات النشطة والمعتمدة فقط
@@ -289,6 +303,9 @@ class OfferViewSet(ApprovalMixin, viewsets.ModelViewSet):
         
         # إذا كان المستخدم بائع ويعدل عروضه، إرجاع الكل
         if self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'toggle_status']:
+            if self.action in OWNER_ACTIONS:
+                # تعديل/حذف: عروض متاجر البائع فقط (من سياق البائع المخزن)
+                return scope_to_owned(queryset, self.request.user)
             return queryset
         
         # للقراءة العامة: العروض النشطة والمعتمدة فقط
@@ -338,6 +355,8 @@ class OfferViewSet(ApprovalMixin, viewsets.ModelViewSet):
 class CalculateCartView(APIView):
     """حساب إجمالي السلة الكامل مع الخصومات والعروض"""
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    ratelimit_scopes = ['cart_calculate']
     
     def post(self, request):
         items = request.data.get('items', [])
@@ -399,12 +418,10 @@ class MyPromotionsView(APIView):
     
     def get(self, request):
         try:
-            from stores.models import Store
-
-            # 1. Get ALL stores owned by the user
-            user_stores = Store.objects.filter(owner=request.user)
+            # 1. Get ALL stores owned by the user (سياق البائع المخزن)
+            user_stores = get_owned_store_ids(request.user)
             
-            if not user_stores.exists():
+            if not user_stores:
                 return Response(
                     {'error': 'لا يوجد متاجر مرتبطة بهذا المستخدم'},
                     status=status.HTTP_404_NOT_FOUND
@@ -438,13 +455,13 @@ class MyCouponsView(APIView):
             
             if store_id:
                 # إذا تم تمرير store_id، التحقق من الملكية
-                store = get_and_validate_store(request, store_id)
+                store_id = validate_store_id(request, store_id)
                 coupons = Coupon.objects.filter(
-                    stores=store
+                    stores=store_id
                 ).prefetch_related('stores').order_by('-created_at')
             else:
                 # إذا لم يتم تمرير store_id، إرجاع كوبونات جميع متاجر المستخدم
-                user_stores = Store.objects.filter(owner=request.user)
+                user_stores = get_owned_store_ids(request.user)
                 coupons = Coupon.objects.filter(
                     stores__in=user_stores
                 ).prefetch_related('stores').order_by('-created_at').distinct()
@@ -474,13 +491,13 @@ class MyOffersView(APIView):
             
             if store_id:
                 # إذا تم تمرير store_id، التحقق من الملكية
-                store = get_and_validate_store(request, store_id)
-                offers = Offer.objects.filter(stores=store).select_related('required_coupon').prefetch_related(
+                store_id = validate_store_id(request, store_id)
+                offers = Offer.objects.filter(stores=store_id).select_related('required_coupon').prefetch_related(
                     'stores', 'categories', 'products', 'variants'
                 ).order_by('-created_at')
             else:
                 # إذا لم يتم تمرير store_id، إرجاع عروض جميع متاجر المستخدم
-                user_stores = Store.objects.filter(owner=request.user)
+                user_stores = get_owned_store_ids(request.user)
                 offers = Offer.objects.filter(
                     stores__in=user_stores
                 ).select_related('required_coupon').prefetch_related(
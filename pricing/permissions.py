@@ -5,7 +5,7 @@ Custom Permissions for Pricing Application
 """
 
 from rest_framework.permissions import BasePermission
-from stores.models import Store
+from stores.vendor_context import get_owned_store_ids
 
 
 class IsVendor(BasePermission):
@@ -22,8 +22,8 @@ class IsVendor(BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
         
-        # التحقق من أن المستخدم لديه متجر
-        return Store.objects.filter(owner=request.user).exists()
+        # التحقق من أن المستخدم لديه متجر (من سياق البائع المخزن، بدون استعلام)
+        return bool(get_owned_store_ids(request.user))
 
 
 class IsObjectOwner(BasePermission):
@@ -52,12 +52,13 @@ class IsObjectOwner(BasePermission):
             bool: True إذا كان المستخدم يملك الكائن
         """
         # الحصول على كل المتاجر التي يملكها المستخدم
-        user_stores = Store.objects.filter(owner=request.user)
+        user_store_ids = get_owned_store_ids(request.user)
         
         # التحقق مما إذا كان الكائن له حقل 'stores' (علاقة ManyToMany)
         if hasattr(obj, 'stores'):
             # التحقق مما إذا كان الكائن مرتبطاً بأي من متاجر المستخدم
-            return obj.stores.filter(id__in=user_stores).exists()
+            # (stores محملة مسبقاً عبر prefetch_related في الـ ViewSets)
+            return any(store.pk in user_store_ids for store in obj.stores.all())
         
         # إذا لم يكن للكائن حقل 'stores'، لا تسمح بالوصول كإجراء احترازي
         return False
@@ -2,6 +2,7 @@
 from datetime import datetime
 from django.utils import timezone
 from stores.models import Store
+from stores.vendor_context import owns_store
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -33,6 +34,26 @@ def parse_aware_datetime(date_string: str | None) -> datetime | None:
         # في حالة كان تنسيق التاريخ غير صالح
         return None
     
+def validate_store_id(request, store_id) -> int:
+    """
+    التحقق من store_id وملكيته من سياق البائع المخزن بدون تحميل المتجر.
+
+    Returns:
+        معرّف المتجر كرقم صحيح.
+
+    Raises:
+        ValidationError: إذا كان store_id مفقوداً
+        PermissionDenied: إذا كان المستخدم لا يملك المتجر
+    """
+    from rest_framework.exceptions import ValidationError, PermissionDenied
+
+    if not store_id:
+        raise ValidationError({'error': 'معرّف المتجر (store_id) مطلوب.'})
+    if not owns_store(request.user, store_id):
+        raise PermissionDenied({'error': 'المتجر المحدد غير صالح أو لا تملكه.'})
+    return int(store_id)
+
+
 def get_and_validate_store(request, store_id) -> Store | None:
     """
     التحقق من أن store_id موجود وأن المستخدم الحالي هو المالك.
@@ -51,8 +72,8 @@ def get_and_validate_store(request, store_id) -> Store | None:
     # استيراد الاستثناءات من DRF
     from rest_framework.exceptions import ValidationError, PermissionDenied
     
-    if not store_id:
-        raise ValidationError({'error': 'معرّف المتجر (store_id) مطلوب.'})
+    # رفض المتاجر التي لا يملكها المستخدم من سياق البائع بدون استعلام
+    validate_store_id(request, store_id)
 
     try:
         # استخدام .get() للبحث عن المتجر والتأكد من الملكية في خطوة واحدة
@@ -10,6 +10,8 @@ from .api_views import (
     ProductImageListCreateAPIView,
     ProductImageRetrieveUpdateDestroyAPIView,
     ProductSearchView,  # ✅ جديد
+    ProductAutocompleteView,
+    ProductCategoryTreeView,
     FeaturedProductsView,  # ✅ جديد
     BestSellingProductsView,  # ✅ جديد
 )
@@ -21,6 +23,7 @@ urlpatterns = [
     # Product URLs
     path('', ProductListCreateAPIView.as_view(), name='product-list-create'),
     path('search/', ProductSearchView.as_view(), name='product-search'),  # ✅ جديد
+    path('autocomplete/', ProductAutocompleteView.as_view(), name='product-autocomplete'),
     path('featured/', FeaturedProductsView.as_view(), name='product-featured'),  # ✅ جديد
     path('best-selling/', BestSellingProductsView.as_view(), name='product-best-selling'),  # ✅ جديد
     path('<int:pk>/', ProductRetrieveUpdateDestroyAPIView.as_view(), name='product-detail'),
@@ -35,5 +38,6 @@ urlpatterns = [
 
     # Category URLs
     path('categories/', ProductCategoryListCreateAPIView.as_view(), name='category-list-create'),
+    path('categories/tree/', ProductCategoryTreeView.as_view(), name='category-tree'),
     path('categories/<int:pk>/', ProductCategoryRetrieveUpdateDestroyAPIView.as_view(), name='category-detail'),
 ]
\ No newline at end of file
@@ -7,8 +7,11 @@
 
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from django.db.models import Q, Case, When, Value
+from rest_framework.views import APIView
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 
 from .models import Product, ProductCategory, ProductVariant, ProductImage
 from .serializers import (
@@ -19,6 +22,11 @@ from .serializers import (
     ProductImageSerializer
 )
 from stores.models import Store
+from core.pagination import KeysetCursorPagination
+from . import category_tree
+from . import facets as product_facets
+from . import ordering as product_ordering
+from . import search as product_search
 
 
 class ProductListCreateAPIView(generics.ListCreateAPIView):
@@ -28,6 +36,9 @@ class ProductListCreateAPIView(generics.ListCreateAPIView):
     POST /api/v1/products/
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # keyset cursor على حقول الترتيب عند طلب ?cursor= أو ?page_size= فقط؛
+    # بدونهما المصفوفة الكاملة كما يتوقعها Flutter
+    pagination_class = KeysetCursorPagination
     
     def get_queryset(self):
         # عرض المنتجات من المتاجر النشطة فقط
@@ -51,30 +62,56 @@ class ProductListCreateAPIView(generics.ListCreateAPIView):
         if category_id:
             queryset = queryset.filter(category_id=category_id)
 
-        # البحث
+        # فلترة حسب شريحة السعر والتقييم (نفس تعريف عدادات products/facets.py)
+        selected = product_facets.parse_selection(self.request.query_params)
+        if 'price' in selected:
+            low, high = product_facets.band_range(
+                min(max(selected['price'][0], 0), len(product_facets.get_price_bands()))
+            )
+            queryset = queryset.filter(min_price__gte=low)
+            if high is not None:
+                queryset = queryset.filter(min_price__lt=high)
+        if 'rating' in selected:
+            queryset = queryset.filter(average_rating__gte=selected['rating'][0])
+
+        # البحث عبر الفهرس المعكوس (products/search.py) مرتباً حسب الصلة
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | 
-                Q(description__icontains=search) |
-                Q(specifications__icontains=search)
-            )
+            queryset = product_search.search_products(queryset, search)
 
-        # ✅ الترتيب حسب sort-by (للتوافق مع Flutter)
-        sort_by = self.request.query_params.get('sort-by')
-        if sort_by == 'top-rated':
-            queryset = queryset.order_by('-average_rating', '-id')
-        elif sort_by == 'top-sale':
-            queryset = queryset.order_by('-selling_count', '-id')
+        # ✅ الترتيب حسب sort-by (للتوافق مع Flutter) أو ordering، من الترتيبات
+        # المسموحة فقط (products/ordering.py)؛ البحث بدون ترتيب: حسب الصلة
+        ordering = product_ordering.resolve_ordering(
+            self.request.query_params.get('sort-by'),
+            self.request.query_params.get('ordering'),
+        )
+        if ordering:
+            queryset = product_ordering.apply_ordering(queryset, ordering)
+        elif search:
+            queryset = queryset.order_by(*product_ordering.SEARCH_ORDERING)
         else:
-            # الترتيب الافتراضي أو المخصص
-            ordering = self.request.query_params.get('ordering')
-            if ordering:
-                queryset = queryset.order_by(ordering)
-            else:
-                queryset = queryset.order_by('-id')  # الأحدث أولاً
+            queryset = product_ordering.apply_ordering(queryset, product_ordering.DEFAULT_ORDERING)
 
         return queryset
+
+    def list(self, request, *args, **kwargs):
+        """?facets=1: عدادات الفلاتر (المتجر، الفئة، السعر، التقييم) مع النتائج"""
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') not in ('1', 'true'):
+            return response
+
+        base_ids = None
+        search = request.query_params.get('search')
+        if search:
+            listable = Product.objects.filter(store__status=Store.StoreStatus.ACTIVE, is_active=True)
+            # كل المطابقات (بدون حد) حتى تشمل العدادات نتائج البحث كاملة
+            base_ids = product_search.matching_ids(listable, search)
+        counts = product_facets.facet_counts(product_facets.parse_selection(request.query_params), base_ids)
+
+        if isinstance(response.data, list):
+            response.data = {'results': response.data}
+        response.data['facets'] = product_facets.describe(counts)
+        return response
     
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -150,6 +187,32 @@ class ProductCategoryListCreateAPIView(generics.ListCreateAPIView):
             serializer.save()
 
 
+class ProductCategoryTreeView(APIView):
+    """
+    Category tree of a store (one cached query per store, ETag revalidation)
+    GET /api/v1/products/categories/tree/?store={store_id}
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            store_id = int(request.query_params.get('store'))
+        except (TypeError, ValueError):
+            return Response({'error': 'store is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        tree, etag = category_tree.get_store_tree(store_id)
+        etag = quote_etag(etag)
+        # If-None-Match مطابق: 304 بدون جسم
+        not_modified = get_conditional_response(request._request, etag=etag)
+        if not_modified is not None:
+            response = not_modified
+        else:
+            response = Response({'store': store_id, 'results': tree})
+        response['ETag'] = etag
+        patch_cache_control(response, max_age=0, must_revalidate=True)
+        return response
+
+
 class ProductCategoryRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a product category
@@ -266,13 +329,7 @@ class ProductSearchView(generics.ListAPIView):
         
         queryset = Product.objects.all()
         
-        if search_term:
-            queryset = queryset.filter(
-                Q(name__icontains=search_term) | 
-                Q(description__icontains=search_term) |
-                Q(specifications__icontains=search_term)
-            )
-        else:
+        if not search_term:
             return Product.objects.none()
         
         if store_id:
@@ -289,15 +346,8 @@ class ProductSearchView(generics.ListAPIView):
             except (ValueError, TypeError):
                 pass
         
-        queryset = queryset.annotate(
-            relevance=Case(
-                When(name__icontains=search_term, then=Value(1)),
-                When(description__icontains=search_term, then=Value(2)),
-                default=Value(3),
-            )
-        ).order_by('relevance', '-id')
-        
-        return queryset
+        # الفهرس المعكوس مع الترتيب حسب الصلة (products/search.py)
+        return product_search.search_products(queryset, search_term)
     
     def list(self, request, *args, **kwargs):
         """✅ Override to add search metadata to response (من Two)"""
@@ -334,6 +384,21 @@ class ProductSearchView(generics.ListAPIView):
                 'category_filter': request.query_params.get('category'),
             }
         })
+class ProductAutocompleteView(APIView):
+    """
+    Autocomplete suggestions for the search box (in-memory trie, no DB query)
+    GET /api/v1/products/autocomplete/?q={prefix}
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        return Response({
+            'query': query,
+            'suggestions': product_search.autocomplete(query),
+        })
+
+
 # ✅ إضافة جديدة: المنتجات المميزة (محدَّث)
 class FeaturedProductsView(generics.ListAPIView):
     """
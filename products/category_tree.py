@@ -0,0 +1,105 @@
+"""
+شجرة فئات المتجر من نطاقات MPTT باستعلام واحد ومخزنة في الكاش
+
+- كل فئات المتجر تُقرأ مرتبة بـ (tree_id, lft) فيأتي الأب دائماً قبل أبنائه،
+  وتُبنى الشجرة المتداخلة في الذاكرة بمرور واحد.
+- الكاش لكل متجر (catalog:tree:<store_id>) مع ETag من محتوى الشجرة، ويُبطل من
+  products/signals.py عند حفظ أو حذف أي فئة في المتجر.
+
+    CATALOG_CONFIG = {'CATEGORY_TREE_TTL': 3600}
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY_TREE_TTL = 60 * 60
+
+TREE_KEY = 'catalog:tree:{store_id}'
+
+
+def get_category_tree_ttl():
+    config = getattr(settings, 'CATALOG_CONFIG', {})
+    return int(config.get('CATEGORY_TREE_TTL', DEFAULT_CATEGORY_TREE_TTL))
+
+
+def _key(store_id):
+    return TREE_KEY.format(store_id=store_id)
+
+
+def build_tree(store_id):
+    """
+    الفئات الجذرية للمتجر، كل عقدة بنفس شكل ProductCategorySerializer:
+    {'id', 'store', 'name', 'parent', 'children', 'level'}
+    """
+    from .models import ProductCategory
+
+    rows = (
+        ProductCategory.objects.filter(store_id=store_id)
+        .order_by('tree_id', 'lft')
+        .values('id', 'store_id', 'name', 'parent_id', 'level')
+    )
+    nodes, roots = {}, []
+    for row in rows:
+        node = {
+            'id': row['id'],
+            'store': row['store_id'],
+            'name': row['name'],
+            'parent': row['parent_id'],
+            'children': [],
+            'level': row['level'],
+        }
+        nodes[row['id']] = node
+        parent = nodes.get(row['parent_id'])
+        (parent['children'] if parent else roots).append(node)
+    return roots
+
+
+def _etag(tree):
+    payload = json.dumps(tree, ensure_ascii=False, sort_keys=True).encode()
+    return hashlib.sha1(payload).hexdigest()[:20]
+
+
+def get_store_tree(store_id):
+    """(الشجرة، etag) من الكاش، أو من قاعدة البيانات عند الغياب"""
+    try:
+        cached = cache.get(_key(store_id))
+        if cached is not None:
+            return cached
+    except Exception as e:
+        logger.warning(f'category tree cache get failed for store {store_id}: {e}')
+
+    tree = build_tree(store_id)
+    result = (tree, _etag(tree))
+    try:
+        cache.set(_key(store_id), result, get_category_tree_ttl())
+    except Exception as e:
+        logger.warning(f'category tree cache set failed for store {store_id}: {e}')
+    return result
+
+
+def children_map(store_id):
+    """{category_id: [child nodes]} لكل فئات المتجر (من الشجرة المخزنة)"""
+    tree, _ = get_store_tree(store_id)
+    result, stack = {}, list(tree)
+    while stack:
+        node = stack.pop()
+        result[node['id']] = node['children']
+        stack.extend(node['children'])
+    return result
+
+
+def invalidate_store_tree(store_id):
+    """حذف شجرة المتجر بعد نجاح المعاملة"""
+    def _delete():
+        try:
+            cache.delete(_key(store_id))
+        except Exception as e:
+            logger.warning(f'category tree invalidation failed for store {store_id}: {e}')
+
+    transaction.on_commit(_delete)
@@ -0,0 +1,527 @@
+"""
+عدادات الفلاتر (facets) لقائمة المنتجات من مجموعات معرفات في الذاكرة
+
+لكل منتج قابل للعرض (نشط في متجر نشط) سجل صغير: (store, category,
+platform_category, price_band, rating). السجلات مقسمة على shards في الكاش
+(facets:shard:<n>) ولكل shard رقم إصدار في facets:versions.
+
+- كل عملية تبني منها مجموعة معرفات لكل قيمة (store=5 -> {ids}) وتعيد تحميل
+  الـ shards التي تغير إصدارها فقط (يُفحص كل REFRESH_INTERVAL ثانية).
+- تغييرات المنتج/السعر/حالة المتجر تحدّث سجلات المنتجات المعنية فقط عبر
+  signals (products/signals.py) بعد نجاح المعاملة، خارج مسار الطلب: thread
+  خلفي يجمع المعرفات المعلقة (أو Celery حسب UPDATE_QUEUE). إذا كان القفل مشغولاً
+  تُعاد المحاولة لاحقاً بدون حذف الفهرس.
+- البناء الكامل (فهرس غير موجود أو shard أُخرج من الكاش) يجري في نفس العامل
+  الخلفي تحت قفل الفهرس، فلا يضيع تحديث يصل أثناءه (ينتظر القفل ثم يُطبّق على
+  البناء الجديد). حتى ينتهي تُخدم القراءات من الفهرس السابق أو بعدادات فارغة.
+- العدادات لكل بُعد تُحسب بتقاطع مجموعات الفلاتر المختارة في الأبعاد الأخرى،
+  فيبقى بإمكان الواجهة عرض البدائل داخل البُعد المختار.
+
+    FACETS_CONFIG = {
+        'PRICE_BANDS': [50, 100, 250, 500, 1000],
+        'SHARDS': 64,
+        'REFRESH_INTERVAL': 30,
+        'LIMIT': 50,
+        'UPDATE_QUEUE': 'thread',  # أو 'celery' أو 'sync'
+        'UPDATE_RETRY_DELAY': 1,
+    }
+"""
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRICE_BANDS = [50, 100, 250, 500, 1000]
+DEFAULT_SHARDS = 64
+DEFAULT_REFRESH_INTERVAL = 30
+DEFAULT_LIMIT = 50
+DEFAULT_UPDATE_QUEUE = 'thread'
+DEFAULT_UPDATE_RETRY_DELAY = 1
+
+# ترتيب القيم في سجل المنتج
+DIMENSIONS = ('store', 'category', 'platform_category', 'price', 'rating')
+RATING_BUCKETS = (4, 3, 2, 1)
+# عدد القيم الذي تُحسب دونه العدادات بتقاطع المجموعات بدلاً من المرور على المنتجات
+SMALL_DIMENSION = 16
+
+SHARD_KEY = 'facets:shard:{shard}'
+VERSIONS_KEY = 'facets:versions'
+LOCK_KEY = 'facets:lock'
+LOCK_TIMEOUT = 30
+# البناء الكامل يمر على كل المنتجات: مهلة أطول للقفل
+REBUILD_LOCK_TIMEOUT = 600
+
+
+def _get_config(name, default):
+    return getattr(settings, 'FACETS_CONFIG', {}).get(name, default)
+
+
+def get_price_bands():
+    return list(_get_config('PRICE_BANDS', DEFAULT_PRICE_BANDS))
+
+
+def get_shard_count():
+    return int(_get_config('SHARDS', DEFAULT_SHARDS))
+
+
+def price_band(price, bands=None):
+    """رقم شريحة السعر (0 = أقل من الحد الأول)، أو None للمنتج بدون سعر"""
+    if price is None:
+        return None
+    bands = get_price_bands() if bands is None else bands
+    for index, bound in enumerate(bands):
+        if price < bound:
+            return index
+    return len(bands)
+
+
+def band_range(band, bands=None):
+    """(min, max) لشريحة السعر؛ max = None للشريحة الأخيرة"""
+    bands = get_price_bands() if bands is None else bands
+    low = bands[band - 1] if band > 0 else 0
+    high = bands[band] if band < len(bands) else None
+    return low, high
+
+
+def rating_bucket(rating):
+    """الجزء الصحيح من التقييم (0-4، والـ 5 ضمن 4)"""
+    return min(int(math.floor(rating or 0)), 4)
+
+
+# ===== بناء السجلات =====
+
+def _listable_rows(product_ids=None):
+    from stores.models import Store
+    from .models import Product
+
+    queryset = Product.objects.filter(is_active=True, store__status=Store.StoreStatus.ACTIVE)
+    if product_ids is not None:
+        queryset = queryset.filter(pk__in=product_ids)
+    return queryset.values_list(
+        'id', 'store_id', 'category_id', 'store__platform_category_id', 'min_price', 'average_rating'
+    )
+
+
+def _doc(row, bands):
+    _, store_id, category_id, platform_category_id, min_price, rating = row
+    return (store_id, category_id, platform_category_id, price_band(min_price, bands), rating_bucket(rating))
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def _acquire_lock(timeout=LOCK_TIMEOUT):
+    for _ in range(40):
+        if cache.add(LOCK_KEY, 1, timeout):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _is_complete():
+    """الإصدارات وكل الـ shards موجودة في الكاش"""
+    versions = cache.get(VERSIONS_KEY)
+    if versions is None:
+        return False
+    keys = [SHARD_KEY.format(shard=shard) for shard in versions]
+    return len(cache.get_many(keys)) == len(keys)
+
+
+def rebuild(force=False):
+    """
+    إعادة بناء كل السجلات من قاعدة البيانات (استعلام واحد) وتخزينها تحت قفل
+    الفهرس. لا شيء إذا كان الفهرس مكتملاً (إلا مع force).
+    ترجع False إذا كان القفل مشغولاً (على المستدعي إعادة المحاولة).
+    """
+    if not _acquire_lock(REBUILD_LOCK_TIMEOUT):
+        return False
+    try:
+        if not force and _is_complete():
+            return True
+        shards, bands = get_shard_count(), get_price_bands()
+        data = {shard: {} for shard in range(shards)}
+        for row in _listable_rows().iterator(chunk_size=2000):
+            data[row[0] % shards][row[0]] = _doc(row, bands)
+        cache.set_many({SHARD_KEY.format(shard=shard): docs for shard, docs in data.items()}, None)
+        cache.set(VERSIONS_KEY, {shard: _new_version() for shard in data}, None)
+    except Exception as e:
+        logger.warning(f'facet index rebuild failed: {e}')
+    finally:
+        cache.delete(LOCK_KEY)
+    return True
+
+
+def update_products(product_ids):
+    """
+    تحديث سجلات منتجات محددة (إضافة/تعديل/إزالة) في الـ shards المعنية فقط.
+    ترجع False إذا كان القفل مشغولاً أو الفهرس غير مكتمل (يُطلب بناؤه)، وعلى
+    المستدعي إعادة المحاولة: التحديث لا يُهمل لأن البناء قد يكون قرأ قيماً أقدم.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return True
+    shards, bands = get_shard_count(), get_price_bands()
+    if not _acquire_lock():
+        return False
+    missing = False
+    try:
+        versions = cache.get(VERSIONS_KEY)
+        touched = {product_id % shards for product_id in product_ids}
+        keys = {shard: SHARD_KEY.format(shard=shard) for shard in touched}
+        stored = cache.get_many(list(keys.values())) if versions is not None else {}
+        if versions is None or len(stored) != len(keys):
+            # لم يُبنَ بعد أو shard أُخرج من الكاش
+            missing = True
+            return False
+        rows = {row[0]: _doc(row, bands) for row in _listable_rows(product_ids)}
+        for product_id in product_ids:
+            docs = stored[keys[product_id % shards]]
+            if product_id in rows:
+                docs[product_id] = rows[product_id]
+            else:
+                docs.pop(product_id, None)
+        for shard in touched:
+            versions[shard] = _new_version()
+        cache.set_many(stored, None)
+        cache.set(VERSIONS_KEY, versions, None)
+    except Exception as e:
+        logger.warning(f'facet index update failed for {len(product_ids)} products: {e}')
+    finally:
+        cache.delete(LOCK_KEY)
+        if missing:
+            request_rebuild()
+    return True
+
+
+def get_update_retry_delay():
+    return float(_get_config('UPDATE_RETRY_DELAY', DEFAULT_UPDATE_RETRY_DELAY))
+
+
+class _UpdateWorker:
+    """
+    thread خلفي واحد لكل عملية: يبني الفهرس عند الطلب ويجمع المعرفات المعلقة
+    ويحدّثها دفعة واحدة (البناء أولاً)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = set()
+        self._rebuild = False
+        self._thread = None
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='facets-update', daemon=True)
+            self._thread.start()
+
+    def submit(self, product_ids):
+        with self._lock:
+            self._pending.update(product_ids)
+            self._start()
+        self._wakeup.set()
+
+    def request_rebuild(self):
+        with self._lock:
+            self._rebuild = True
+            self._start()
+        self._wakeup.set()
+
+    def _take(self):
+        with self._lock:
+            product_ids, self._pending = self._pending, set()
+            needs_rebuild, self._rebuild = self._rebuild, False
+        return needs_rebuild, product_ids
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            needs_rebuild, product_ids = self._take()
+            done = True
+            try:
+                if needs_rebuild and not rebuild():
+                    self.request_rebuild()
+                    done = False
+                if done and product_ids and not update_products(product_ids):
+                    done = False
+            except Exception as e:
+                logger.warning(f'facet index update failed for {len(product_ids)} products: {e}')
+            finally:
+                close_old_connections()
+            if not done:
+                # القفل مشغول أو الفهرس قيد البناء: إعادة المعرفات إلى الطابور والمحاولة بعد مهلة
+                self.submit(product_ids)
+                time.sleep(get_update_retry_delay())
+
+
+_worker = _UpdateWorker()
+
+
+def request_rebuild():
+    """بناء الفهرس كاملاً خارج مسار الطلب (UPDATE_QUEUE؛ 'sync' يبني مباشرة)"""
+    mode = _get_config('UPDATE_QUEUE', DEFAULT_UPDATE_QUEUE)
+    if mode == 'sync':
+        if not rebuild():
+            _worker.request_rebuild()
+        return
+    if mode == 'celery':
+        from .tasks import rebuild_facets_task
+        try:
+            rebuild_facets_task.delay()
+            return
+        except Exception as e:
+            logger.warning(f'Could not enqueue facet rebuild to Celery ({e}); using local thread')
+    _worker.request_rebuild()
+
+
+def enqueue_update(product_ids):
+    """تحديث سجلات المنتجات خارج مسار الطلب (UPDATE_QUEUE)"""
+    product_ids = list(product_ids)
+    mode = _get_config('UPDATE_QUEUE', DEFAULT_UPDATE_QUEUE)
+    if mode == 'sync':
+        # الفهرس غير المكتمل يُبنى مباشرة في هذا الوضع ثم تُعاد المحاولة مرة
+        if not update_products(product_ids) and not update_products(product_ids):
+            logger.warning(f'facet index lock busy, {len(product_ids)} products left for the worker')
+            _worker.submit(product_ids)
+        return
+    if mode == 'celery':
+        from .tasks import update_facets_task
+        try:
+            update_facets_task.delay(product_ids)
+            return
+        except Exception as e:
+            logger.warning(f'Could not enqueue facet update to Celery ({e}); using local thread')
+    _worker.submit(product_ids)
+
+
+def schedule_update(product_ids):
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: enqueue_update(product_ids))
+
+
+# ===== الفهرس في الذاكرة =====
+
+class FacetIndex:
+    """
+    السجلات لكل shard ومجموعة معرفات لكل (بُعد، قيمة). لا يُعدّل بعد نشره:
+    التحديث ينشئ نسخة تشارك المجموعات غير المتأثرة (copy-on-write)، فالقراءة
+    من threads أخرى لا تحتاج قفلاً.
+    """
+
+    def __init__(self, previous=None):
+        self.shards = dict(previous.shards) if previous else {}
+        self.versions = dict(previous.versions) if previous else {}
+        self.sets = {dim: dict(previous.sets[dim]) if previous else {} for dim in DIMENSIONS}
+        self._copied = set()
+        self._ids = None
+
+    def _writable(self, dim, value):
+        key = (dim, value)
+        ids = self.sets[dim].get(value)
+        if ids is None:
+            ids = self.sets[dim][value] = set()
+        elif key not in self._copied:
+            ids = self.sets[dim][value] = set(ids)
+        self._copied.add(key)
+        return ids
+
+    def apply_shard(self, shard, docs, version):
+        for product_id, values in self.shards.get(shard, {}).items():
+            for dim, value in zip(DIMENSIONS, values):
+                if value in self.sets[dim]:
+                    ids = self._writable(dim, value)
+                    ids.discard(product_id)
+                    if not ids:
+                        del self.sets[dim][value]
+        for product_id, values in docs.items():
+            for dim, value in zip(DIMENSIONS, values):
+                if value is not None:
+                    self._writable(dim, value).add(product_id)
+        self.shards[shard] = docs
+        self.versions[shard] = version
+
+    def ids(self):
+        """كل المنتجات القابلة للعرض"""
+        if self._ids is None:
+            self._ids = frozenset(product_id for docs in self.shards.values() for product_id in docs)
+        return self._ids
+
+    def doc(self, product_id, shards):
+        return self.shards.get(product_id % shards, {}).get(product_id)
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _read_changes(index):
+    """(الإصدارات، الـ shards المتغيرة، محتواها)؛ الإصدارات None إذا لم يكتمل الفهرس"""
+    versions = cache.get(VERSIONS_KEY)
+    if versions is None:
+        return None, {}, {}
+    changed = {shard: version for shard, version in versions.items() if index.versions.get(shard) != version}
+    stored = cache.get_many([SHARD_KEY.format(shard=shard) for shard in changed])
+    if len(stored) != len(changed):
+        return None, {}, {}
+    return versions, changed, stored
+
+
+def get_index():
+    """
+    فهرس العملية؛ يحمّل الـ shards التي تغيّر إصدارها فقط. إذا لم يكتمل الفهرس
+    في الكاش يُطلب بناؤه في الخلفية ويُرجع الفهرس السابق (أو فهرس فارغ).
+    """
+    global _index, _index_checked_at
+    now = time.monotonic()
+    interval = float(_get_config('REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL))
+    if _index is not None and now - _index_checked_at < interval:
+        return _index
+
+    with _index_lock:
+        if _index is not None and now - _index_checked_at < interval:
+            return _index
+        index = FacetIndex(_index)
+        try:
+            versions, changed, stored = _read_changes(index)
+            if versions is None:
+                request_rebuild()
+                # وضع 'sync' يبني مباشرة
+                versions, changed, stored = _read_changes(index)
+        except Exception as e:
+            logger.warning(f'facet index load failed: {e}')
+            versions = None
+        if versions is None:
+            if _index is None:
+                return FacetIndex()
+            _index_checked_at = now
+            return _index
+        if changed or _index is None:
+            for shard, version in changed.items():
+                index.apply_shard(shard, stored[SHARD_KEY.format(shard=shard)], version)
+            _index = index
+        _index_checked_at = now
+    return _index
+
+
+# ===== العدادات =====
+
+# معامل الطلب لكل بُعد في قائمة المنتجات
+FACET_PARAMS = {
+    'store': 'store_id',
+    'category': 'category_id',
+    'platform_category': 'platform_category',
+    'price': 'price_band',
+    'rating': 'min_rating',
+}
+
+
+def parse_selection(params):
+    """{dim: [value]} من معاملات الطلب (القيم غير الصالحة تُتجاهل)"""
+    selected = {}
+    for dim, param in FACET_PARAMS.items():
+        try:
+            selected[dim] = [int(params[param])]
+        except (KeyError, TypeError, ValueError):
+            continue
+    if 'rating' in selected:
+        selected['rating'] = [min(max(selected['rating'][0], 0), 4)]
+    return selected
+
+
+def _selected_ids(index, dim, values):
+    """اتحاد مجموعات القيم المختارة في بُعد واحد"""
+    if dim == 'rating':
+        # min_rating = N: كل الشرائح من N فما فوق
+        values = [bucket for bucket in range(values[0], 5)]
+    result = set()
+    for value in values:
+        result |= index.sets[dim].get(value, set())
+    return result
+
+
+def facet_counts(selected, base_ids=None):
+    """
+    عدادات كل بُعد للقائمة الحالية.
+
+    selected: {dim: [values]} للفلاتر المختارة (rating: [min_rating]).
+    base_ids: تقييد إضافي (نتائج البحث مثلاً)، None = كل المنتجات القابلة للعرض.
+    ترجع {dim: Counter(value -> count)}.
+    """
+    index = get_index()
+    base = index.ids() if base_ids is None else set(base_ids)
+    selections = {dim: _selected_ids(index, dim, values) for dim, values in selected.items() if values}
+    shards = get_shard_count()
+
+    counts = {}
+    for position, dim in enumerate(DIMENSIONS):
+        scope = base
+        for other, ids in selections.items():
+            if other != dim:
+                scope = scope & ids
+        if scope is index.ids():
+            # بدون فلاتر: حجم كل مجموعة مباشرة
+            counter = Counter({value: len(ids) for value, ids in index.sets[dim].items()})
+        elif len(index.sets[dim]) <= SMALL_DIMENSION:
+            # أبعاد بقيم قليلة (السعر، التقييم): تقاطع المجموعات
+            counter = Counter({value: len(scope & ids) for value, ids in index.sets[dim].items()})
+        else:
+            counter = Counter()
+            for product_id in scope:
+                values = index.doc(product_id, shards)
+                if values is not None and values[position] is not None:
+                    counter[values[position]] += 1
+        counts[dim] = +counter
+    return counts
+
+
+def describe(counts):
+    """شكل الاستجابة: قوائم مرتبة مع أسماء المتاجر والفئات"""
+    from stores.models import PlatformCategory, Store
+    from .models import ProductCategory
+
+    limit = int(_get_config('LIMIT', DEFAULT_LIMIT))
+    bands = get_price_bands()
+    named = {
+        'store': Store,
+        'category': ProductCategory,
+        'platform_category': PlatformCategory,
+    }
+
+    facets = {}
+    for dim, model in named.items():
+        top = counts[dim].most_common(limit)
+        names = dict(model.objects.filter(pk__in=[value for value, _ in top]).values_list('pk', 'name'))
+        facets[dim] = [
+            {'value': value, 'name': names.get(value, ''), 'count': count}
+            for value, count in top
+        ]
+
+    facets['price'] = []
+    for band in range(len(bands) + 1):
+        if counts['price'][band]:
+            low, high = band_range(band, bands)
+            facets['price'].append({
+                'value': band,
+                'label': f'{low}-{high}' if high is not None else f'{low}+',
+                'min': low,
+                'max': high,
+                'count': counts['price'][band],
+            })
+
+    # التقييم تراكمي: "4 فأعلى"، "3 فأعلى"...
+    facets['rating'] = [
+        {'value': bucket, 'label': f'{bucket}+', 'count': sum(counts['rating'][b] for b in range(bucket, 5))}
+        for bucket in RATING_BUCKETS
+    ]
+    return facets
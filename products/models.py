@@ -36,10 +36,31 @@ class Product(models.Model):
     average_rating = models.FloatField(default=0.0)
     review_count = models.PositiveIntegerField(default=0)
     selling_count = models.PositiveIntegerField(default=0)
-    
+    # أقل سعر بين النسخ - يُحدّث من products/signals.py (للترتيب والفلترة بالفهرس)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        # فهرس مركب لكل ترتيب في products/ordering.py (keyset pagination)
+        indexes = [
+            models.Index(fields=['-average_rating', '-id']),
+            models.Index(fields=['-selling_count', '-id']),
+            models.Index(fields=['min_price', 'id']),
+        ]
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def refresh_min_price(cls, product_ids=None):
+        """إعادة حساب min_price من النسخ (استعلام update واحد)"""
+        lowest = (
+            ProductVariant.objects.filter(product=models.OuterRef('pk'))
+            .order_by('price')
+            .values('price')[:1]
+        )
+        queryset = cls.objects.all() if product_ids is None else cls.objects.filter(pk__in=product_ids)
+        return queryset.update(min_price=models.Subquery(lowest))
+
     # NEW: Properties للخصومات النشطة
     @property
     def active_promotions(self):
@@ -117,3 +138,22 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"Image for {self.product.name}"
 
+
+
+class ProductSearchTerm(models.Model):
+    """
+    فهرس البحث المعكوس: كلمة مطبّعة -> منتج مع وزنها (الاسم أعلى من الوصف).
+    يُحدّث من products/signals.py ويُستعلم عنه في products/search.py.
+    """
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('product', 'term')
+        indexes = [
+            models.Index(fields=['term', 'product']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id} ({self.weight})"
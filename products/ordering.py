@@ -0,0 +1,51 @@
+"""
+الترتيبات المسموحة لقائمة المنتجات
+
+كل ترتيب مدعوم بفهرس مركب في Product.Meta.indexes وينتهي بـ id حتى يكون
+الموضع فريداً لـ KeysetCursorPagination (core/pagination.py). أي قيمة أخرى
+في ?ordering= تُتجاهل بدلاً من تمريرها إلى order_by.
+"""
+
+DEFAULT_ORDERING = 'newest'
+
+PRODUCT_ORDERINGS = {
+    'newest': ('-id',),
+    'top-rated': ('-average_rating', '-id'),
+    'top-sale': ('-selling_count', '-id'),
+    'price': ('min_price', 'id'),
+    'price-desc': ('-min_price', '-id'),
+}
+
+# قيم ?ordering= القديمة (أسماء حقول) -> مفتاح الترتيب
+LEGACY_ORDERINGS = {
+    '-id': 'newest',
+    '-created_at': 'newest',
+    '-average_rating': 'top-rated',
+    '-selling_count': 'top-sale',
+    'price': 'price',
+    'min_price': 'price',
+    '-price': 'price-desc',
+    '-min_price': 'price-desc',
+}
+
+# ترتيب نتائج البحث حسب الصلة (search_score من products/search.py)
+SEARCH_ORDERING = ('-search_score', '-id')
+
+
+def resolve_ordering(*values):
+    """أول قيمة معروفة من المعاملات المعطاة (sort-by ثم ordering)، أو None"""
+    for value in values:
+        if not value:
+            continue
+        key = value if value in PRODUCT_ORDERINGS else LEGACY_ORDERINGS.get(value)
+        if key:
+            return key
+    return None
+
+
+def apply_ordering(queryset, key):
+    fields = PRODUCT_ORDERINGS[key]
+    if 'min_price' in fields[0]:
+        # المنتجات بدون نسخ (بدون سعر) خارج ترتيب السعر
+        queryset = queryset.filter(min_price__isnull=False)
+    return queryset.order_by(*fields)
@@ -0,0 +1,372 @@
+"""
+البحث في المنتجات عبر فهرس معكوس (ProductSearchTerm) بدلاً من icontains
+
+- التطبيع: حذف التشكيل والتطويل، توحيد الألف (أ إ آ ٱ -> ا) والياء (ى -> ي)
+  والتاء المربوطة (ة -> ه) والهمزات على الواو/الياء، والأرقام العربية -> 0-9.
+- الفهرسة: كلمات الاسم والفئة والمواصفات والوصف بأوزان مختلفة، مع نسخة بدون
+  "ال" وحروف العطف/الجر الملتصقة بها (الهاتف، والهاتف، بالهاتف -> هاتف).
+- البحث: كل كلمة في الاستعلام يجب أن تطابق (مطابقة تامة أو بادئة)، والترتيب
+  حسب مجموع الأوزان. كل المطابقات بدون حد: التصفية subquery مجمّع على الفهرس
+  والصلة (search_score) subquery لكل منتج، فالترتيبات الأخرى والصفحات تشمل الكل.
+- الإكمال التلقائي: trie في الذاكرة من كلمات أسماء المنتجات النشطة، في كل عقدة
+  أفضل الاقتراحات محسوبة مسبقاً. يُعاد بناؤه في thread خلفي عند تغيّر رقم إصدار
+  في الكاش، والطلبات تستمر على الـ trie السابق حتى ينتهي (بدون استعلام).
+
+    SEARCH_CONFIG = {
+        'AUTOCOMPLETE_LIMIT': 10,
+        'TRIE_REFRESH_INTERVAL': 60,
+    }
+"""
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Max, OuterRef, Q, Subquery, Value, When
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTOCOMPLETE_LIMIT = 10
+DEFAULT_TRIE_REFRESH_INTERVAL = 60
+
+MAX_TERM_LENGTH = 64
+MAX_TERM_WEIGHT = 1000
+MIN_PREFIX_LENGTH = 2
+
+# وزن كل حقل في الترتيب
+FIELD_WEIGHTS = {
+    'name': 8,
+    'category': 4,
+    'specifications': 2,
+    'description': 1,
+}
+
+# مضاعف المطابقة التامة مقابل البادئة
+EXACT_MATCH_BOOST = 2
+
+TRIE_VERSION_KEY = 'search:trie:version'
+
+_DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_TOKEN_RE = re.compile(r'\w+')
+_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+})
+# "ال" والحروف الملتصقة بها (الأطول أولاً)
+_ARTICLE_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+
+
+def _get_config(name, default):
+    return getattr(settings, 'SEARCH_CONFIG', {}).get(name, default)
+
+
+# ===== التطبيع =====
+
+def normalize(text):
+    """نص مطبّع للفهرسة والبحث (حروف صغيرة، بدون تشكيل، حروف موحدة)"""
+    text = unicodedata.normalize('NFKC', str(text)).lower()
+    return _DIACRITICS_RE.sub('', text).translate(_FOLD)
+
+
+def stem(token):
+    """حذف "ال" وما يلتصق بها إذا بقي جذر من 3 أحرف على الأقل"""
+    for prefix in _ARTICLE_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            return token[len(prefix):]
+    return token
+
+
+def tokenize(text):
+    """كلمات النص المطبّعة (بدون الكلمات ذات الحرف الواحد عدا الأرقام)"""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in _TOKEN_RE.findall(normalize(text).replace('_', ' '))
+        if len(token) > 1 or token.isdigit()
+    ]
+
+
+# ===== الفهرسة =====
+
+def _flatten(value):
+    """قيم JSON (المواصفات) كنص واحد: المفاتيح والقيم"""
+    if isinstance(value, dict):
+        return ' '.join(f'{key} {_flatten(item)}' for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return ' '.join(_flatten(item) for item in value)
+    return '' if value is None else str(value)
+
+
+def product_terms(product, category_name=''):
+    """{term: weight} لمنتج واحد"""
+    fields = {
+        'name': product.name,
+        'category': category_name,
+        'specifications': _flatten(product.specifications),
+        'description': product.description,
+    }
+    terms = defaultdict(int)
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text or ''):
+            terms[token] += weight
+            root = stem(token)
+            if root != token:
+                terms[root] += weight
+    return {term: min(weight, MAX_TERM_WEIGHT) for term, weight in terms.items()}
+
+
+def index_products(product_ids, autocomplete=True):
+    """
+    إعادة فهرسة منتجات (حذف الكلمات القديمة ثم bulk_create).
+    autocomplete=False عندما لم يتغير ما يبني الـ trie (الاسم، التفعيل، المتجر).
+    """
+    from .models import Product, ProductSearchTerm
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    products = (
+        Product.objects.filter(pk__in=product_ids)
+        .select_related('category')
+        .only('id', 'name', 'description', 'specifications', 'category__name')
+    )
+    rows = [
+        ProductSearchTerm(product_id=product.pk, term=term, weight=weight)
+        for product in products
+        for term, weight in product_terms(product, product.category.name if product.category else '').items()
+    ]
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id__in=product_ids).delete()
+        ProductSearchTerm.objects.bulk_create(rows, batch_size=1000)
+    if autocomplete:
+        invalidate_autocomplete()
+    return len(rows)
+
+
+def schedule_index(product_ids, autocomplete=True):
+    """فهرسة بعد نجاح المعاملة (حتى لا تُفهرس بيانات تراجعت)"""
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: _safe_index(product_ids, autocomplete))
+
+
+def _safe_index(product_ids, autocomplete):
+    try:
+        index_products(product_ids, autocomplete)
+    except Exception as e:
+        logger.warning(f'search indexing failed for {len(product_ids)} products: {e}')
+
+
+# ===== البحث =====
+
+def _prefix_q(prefix):
+    # مدى بدلاً من LIKE حتى يُستخدم فهرس term في كل قواعد البيانات
+    return Q(term__gte=prefix, term__lt=prefix + '\uffff')
+
+
+def query_terms(query):
+    """كلمات الاستعلام بعد حذف "ال" (بدون تكرار، بنفس الترتيب)"""
+    return list(dict.fromkeys(stem(token) for token in tokenize(query)))
+
+
+def _scored_terms(query):
+    """
+    صفوف الفهرس مجمّعة لكل منتج مع مجموع الأوزان (score) للمنتجات التي تطابق
+    كل كلمات الاستعلام، أو None لاستعلام بدون كلمات. الكلمات الأقصر من
+    MIN_PREFIX_LENGTH تُطابق تماماً فقط.
+    """
+    from .models import ProductSearchTerm
+
+    terms = query_terms(query)
+    if not terms:
+        return None
+
+    matches, scores = Q(), {}
+    for i, term in enumerate(terms):
+        condition = _prefix_q(term) if len(term) >= MIN_PREFIX_LENGTH else Q(term=term)
+        matches |= condition
+        scores[f'_t{i}'] = Max(Case(
+            When(term=term, then=F('weight') * EXACT_MATCH_BOOST),
+            When(condition, then=F('weight')),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+    total = sum((F(name) for name in scores), Value(0))
+    return (
+        ProductSearchTerm.objects.filter(matches)
+        .values('product_id')
+        .annotate(**scores)
+        .filter(**{f'{name}__gt': 0 for name in scores})
+        .annotate(score=total)
+    )
+
+
+def matching_ids(queryset, query):
+    """معرفات كل المنتجات ضمن queryset التي تطابق الاستعلام (subquery بدون حد)"""
+    scored = _scored_terms(query)
+    if scored is None:
+        return queryset.none().values_list('pk', flat=True)
+    return scored.filter(product__in=queryset.values('pk')).values_list('product_id', flat=True)
+
+
+def search_products(queryset, query):
+    """
+    queryset مصفى بكل نتائج البحث مع search_score (الأعلى أولاً) ومرتب حسب
+    الصلة؛ الترتيبات الأخرى (السعر مثلاً) تُطبق على كل المطابقات
+    """
+    scored = _scored_terms(query)
+    if scored is None:
+        return queryset.none()
+    return queryset.filter(pk__in=scored.values('product_id')).annotate(
+        search_score=Subquery(scored.filter(product_id=OuterRef('pk')).values('score')[:1])
+    ).order_by('-search_score', '-id')
+
+
+# ===== الإكمال التلقائي =====
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = ()
+
+
+class AutocompleteTrie:
+    """
+    trie للكلمات المطبّعة؛ كل عقدة تحمل أفضل `limit` كلمات (بصيغتها الأصلية)
+    تحتها حسب عدد المنتجات، فالاستعلام بطول البادئة فقط.
+    """
+
+    def __init__(self, words, limit):
+        # words: {normalized: (count, display)}
+        self.root = _Node()
+        self.size = len(words)
+        ranked = sorted(words.items(), key=lambda item: (-item[1][0], item[0]))
+        for key, (_, display) in ranked:
+            node = self.root
+            self._offer(node, display, limit)
+            for char in key:
+                node = node.children.setdefault(char, _Node())
+                self._offer(node, display, limit)
+
+    @staticmethod
+    def _offer(node, display, limit):
+        # الإدراج بترتيب تنازلي حسب العدد، فالأوائل هم الأفضل
+        if len(node.top) < limit:
+            node.top += (display,)
+
+    def suggest(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return list(node.top)
+
+
+def build_trie():
+    """من كلمات أسماء المنتجات النشطة في المتاجر النشطة"""
+    from stores.models import Store
+    from .models import Product
+
+    limit = int(_get_config('AUTOCOMPLETE_LIMIT', DEFAULT_AUTOCOMPLETE_LIMIT))
+    counts = defaultdict(int)
+    displays = defaultdict(lambda: defaultdict(int))
+    names = Product.objects.filter(
+        is_active=True, store__status=Store.StoreStatus.ACTIVE
+    ).values_list('name', flat=True)
+    for name in names.iterator(chunk_size=2000):
+        for word in set(_TOKEN_RE.findall(str(name))):
+            key = normalize(word)
+            if len(key) < MIN_PREFIX_LENGTH:
+                continue
+            counts[key] += 1
+            displays[key][word] += 1
+    words = {
+        key: (count, max(displays[key].items(), key=lambda item: item[1])[0])
+        for key, count in counts.items()
+    }
+    return AutocompleteTrie(words, limit)
+
+
+def invalidate_autocomplete():
+    """رفع إصدار الـ trie: كل عملية تعيد بناءه في الخلفية عند الفحص التالي"""
+    try:
+        cache.set(TRIE_VERSION_KEY, time.time(), None)
+    except Exception as e:
+        logger.warning(f'autocomplete invalidation failed: {e}')
+
+
+def schedule_autocomplete_invalidation():
+    transaction.on_commit(invalidate_autocomplete)
+
+
+_trie = None
+_trie_version = None
+_trie_checked_at = 0.0
+_trie_building = False
+_trie_lock = threading.Lock()
+
+
+def _build_trie_in_background(version):
+    """بناء الـ trie (مسح كامل للأسماء) خارج مسار الطلب ثم استبداله"""
+    def run():
+        global _trie, _trie_version, _trie_building
+        try:
+            trie = build_trie()
+            with _trie_lock:
+                _trie, _trie_version = trie, version
+        except Exception as e:
+            logger.warning(f'autocomplete trie build failed: {e}')
+        finally:
+            _trie_building = False
+            close_old_connections()
+
+    threading.Thread(target=run, name='autocomplete-trie', daemon=True).start()
+
+
+def get_trie():
+    """
+    trie العملية الحالية. إذا تغيّر الإصدار (يُفحص كل TRIE_REFRESH_INTERVAL)
+    يُبنى الجديد في الخلفية ويُرجع السابق، أو trie فارغ قبل أول بناء.
+    """
+    global _trie_checked_at, _trie_building
+    now = time.monotonic()
+    interval = float(_get_config('TRIE_REFRESH_INTERVAL', DEFAULT_TRIE_REFRESH_INTERVAL))
+    if _trie is not None and now - _trie_checked_at < interval:
+        return _trie
+
+    with _trie_lock:
+        if _trie is not None and now - _trie_checked_at < interval:
+            return _trie
+        try:
+            version = cache.get(TRIE_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f'autocomplete version check failed: {e}')
+            version = _trie_version
+        if (_trie is None or version != _trie_version) and not _trie_building:
+            _trie_building = True
+            _build_trie_in_background(version)
+        _trie_checked_at = now
+        trie = _trie
+    return trie if trie is not None else AutocompleteTrie({}, 0)
+
+
+def autocomplete(query):
+    """اقتراحات تكمل آخر كلمة في الاستعلام (مع الكلمات السابقة كما كُتبت)"""
+    words = query.split()
+    if not words or query[-1].isspace():
+        return []
+    key = normalize(words[-1])
+    if len(key) < MIN_PREFIX_LENGTH:
+        return []
+    head = ' '.join(words[:-1])
+    return [f'{head} {word}' if head else word for word in get_trie().suggest(key)]
@@ -7,6 +7,8 @@
 from rest_framework import serializers
 from .models import ProductCategory, Product, ProductVariant, ProductImage
 from django.db.models import Avg  # ✅ للحساب الديناميكي
+from core.serializers import ImageVariantField
+from . import category_tree
 
 # ===================================================================
 #  Serializer للصور
@@ -171,6 +173,8 @@ class ProductListSerializer(serializers.ModelSerializer):
     store_name = serializers.CharField(source='store.name', read_only=True)
     store_id = serializers.IntegerField(source='store.id', read_only=True)
     min_price = serializers.SerializerMethodField()
+    # بطاقات القائمة: النسخة المتوسطة بدلاً من الأصل (حتى 5MB)
+    cover_image_url = ImageVariantField(size='medium')
     
     # ✅ حساب ديناميكي
     average_rating = serializers.SerializerMethodField()
@@ -375,10 +379,12 @@ class ProductCategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'store', 'name', 'parent', 'children', 'level']
     
     def get_children(self, obj):
-        """إرجاع الفئات الفرعية"""
-        if obj.get_children().exists():
-            return ProductCategorySerializer(obj.get_children(), many=True).data
-        return []
+        """إرجاع الفئات الفرعية من شجرة المتجر المخزنة (products/category_tree.py)"""
+        # خريطة لكل متجر مرة واحدة لكل استجابة بدلاً من استعلام لكل عقدة
+        maps = self.context.setdefault('_category_children', {})
+        if obj.store_id not in maps:
+            maps[obj.store_id] = category_tree.children_map(obj.store_id)
+        return maps[obj.store_id].get(obj.id, [])
     
     def get_level(self, obj):
         """إرجاع مستوى الفئة في الشجرة"""
@@ -2,12 +2,15 @@
 Django signals for sending notifications on product events
 استخدام تطبيق wishlist الموجود بدلاً من إنشاء نماذج جديدة
 """
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
-from .models import Product
+from stores.models import Store
+from .models import Product, ProductCategory, ProductVariant
+from . import category_tree, facets, search
 from notifications.services import NotificationService
 from notifications.models import NotificationType, NotificationPriority
 from decimal import Decimal
+from django.db import transaction
 
 
 @receiver(post_save, sender=Product)
@@ -157,46 +160,119 @@ def product_created_notification(sender, instance, created, **kwargs):
     """إرسال إشعار لجميع المستخدمين عند إضافة منتج جديد"""
     if created:
         product = instance
-        store = product.store
-        
-        # 📢 جلب جميع المستخدمين النشطين (بدون البائعين)
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
         
-        all_customers = User.objects.filter(
-            is_active=True,
-            is_vendor=False,  # استبعاد البائعين
-            is_staff=False    # استبعاد الموظفين
+        # 📢 الإعلان لجميع العملاء النشطين يتم في الخلفية على دفعات
+        # (notifications.audience) بعد نجاح الحفظ، بدلاً من تحميل كل المعرفات هنا
+        from notifications.audience import enqueue_or_run
+        from notifications.tasks import send_product_announcement_task
+
+        transaction.on_commit(
+            lambda: enqueue_or_run(send_product_announcement_task, product.id)
         )
-        
-        # ✅ إرسال الإشعار لجميع العملاء
-        if all_customers.exists():
-            user_ids = list(all_customers.values_list('id', flat=True))
-            
-            NotificationService.send_notification_to_users(
-                user_ids=user_ids,
-                title=f'منتج جديد في {store.name}! 🎁',
-                body=f'{product.name} - متوفر الآن',
-                notification_type=NotificationType.PRODUCT,
-                priority=NotificationPriority.NORMAL,
-                related_id=product.id,
-                image_url=product.cover_image_url,
-                data={
-                    'type': 'product',
-                    'product_id': str(product.id),
-                    'related_id': str(product.id),
-                    'store_id': str(store.id),
-                    'store_name': store.name
-                }
-            )
-            
-            # 📊 إشعار للبائع مع عدد المستخدمين
-            num_users = all_customers.count()
-            NotificationService.send_notification_to_user(
-                user=store.owner,
-                title='تم إضافة منتج جديد ✅',
-                body=f'تم نشر {product.name} لـ {num_users} مستخدم',
-                notification_type=NotificationType.PRODUCT,
-                priority=NotificationPriority.NORMAL,
-                related_id=product.id
-            )
\ No newline at end of file
+
+
+# حقول المنتج الداخلة في فهرس البحث (products/search.py)
+SEARCH_INDEXED_FIELDS = {'name', 'description', 'specifications', 'category', 'category_id'}
+# حقول يُبنى منها trie الإكمال التلقائي (أسماء المنتجات النشطة في المتاجر النشطة)
+AUTOCOMPLETE_FIELDS = ('name', 'is_active', 'store_id')
+
+
+@receiver(post_init, sender=Product)
+def remember_autocomplete_fields(sender, instance, **kwargs):
+    """قيم حقول الـ trie عند التحميل (الحقول المؤجلة تُعتبر متغيرة)"""
+    instance._loaded_autocomplete = tuple(instance.__dict__.get(name) for name in AUTOCOMPLETE_FIELDS)
+
+
+def _autocomplete_changed(instance, created, update_fields):
+    if created:
+        return True
+    if update_fields is not None:
+        return bool({'name', 'is_active', 'store', 'store_id'} & set(update_fields))
+    current = tuple(getattr(instance, name) for name in AUTOCOMPLETE_FIELDS)
+    return getattr(instance, '_loaded_autocomplete', None) != current
+
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, created, update_fields=None, **kwargs):
+    """تحديث فهرس البحث بعد الحفظ (تحديثات العدادات لا تمس الفهرس)"""
+    autocomplete = _autocomplete_changed(instance, created, update_fields)
+    instance._loaded_autocomplete = tuple(getattr(instance, name) for name in AUTOCOMPLETE_FIELDS)
+    if update_fields is not None and not (set(update_fields) & SEARCH_INDEXED_FIELDS):
+        if autocomplete:
+            # المنتجات المعطلة تخرج من اقتراحات الإكمال التلقائي
+            search.schedule_autocomplete_invalidation()
+        return
+    search.schedule_index([instance.pk], autocomplete=autocomplete)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_autocomplete(sender, instance, **kwargs):
+    """كلمات الفهرس تُحذف مع المنتج (CASCADE)؛ الـ trie يُعاد بناؤه"""
+    search.schedule_autocomplete_invalidation()
+
+
+@receiver(post_init, sender=Store)
+def remember_store_status(sender, instance, **kwargs):
+    instance._loaded_search_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Store)
+def refresh_autocomplete_on_store_status(sender, instance, created, update_fields=None, **kwargs):
+    """الـ trie يضم منتجات المتاجر النشطة فقط"""
+    previous = getattr(instance, '_loaded_search_status', None)
+    instance._loaded_search_status = instance.status
+    if created or previous == instance.status:
+        return
+    if not instance.products.exists():
+        return
+    search.schedule_autocomplete_invalidation()
+
+
+@receiver(post_save, sender=ProductCategory)
+def reindex_category_products(sender, instance, created, update_fields=None, **kwargs):
+    """اسم الفئة جزء من فهرس منتجاتها"""
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    product_ids = list(instance.products.values_list('pk', flat=True))
+    if product_ids:
+        # اسم الفئة لا يدخل في الـ trie
+        search.schedule_index(product_ids, autocomplete=False)
+
+
+# حقول تغيّر سجل المنتج في عدادات الفلاتر (products/facets.py)
+FACET_FIELDS = {'store', 'store_id', 'category', 'category_id', 'is_active', 'average_rating'}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_product_facets(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not (set(update_fields) & FACET_FIELDS):
+        return
+    facets.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def update_variant_min_price(sender, instance, update_fields=None, **kwargs):
+    """Product.min_price (ترتيب السعر) وشريحة السعر في العدادات من أقل سعر بين النسخ"""
+    if update_fields is not None and 'price' not in update_fields:
+        return
+    Product.refresh_min_price([instance.product_id])
+    facets.schedule_update([instance.product_id])
+
+
+@receiver(post_save, sender=Store)
+def update_store_products_facets(sender, instance, created, update_fields=None, **kwargs):
+    """حالة المتجر وتصنيفه يحددان ظهور منتجاته وبُعد platform_category"""
+    if created or (update_fields is not None and not ({'status', 'platform_category'} & set(update_fields))):
+        return
+    product_ids = list(instance.products.values_list('pk', flat=True))
+    if product_ids:
+        facets.schedule_update(product_ids)
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_category_tree(sender, instance, **kwargs):
+    """شجرة فئات المتجر المخزنة (products/category_tree.py)"""
+    category_tree.invalidate_store_tree(instance.store_id)
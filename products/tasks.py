@@ -0,0 +1,28 @@
+from celery import shared_task
+
+from . import facets
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=10)
+def update_facets_task(self, product_ids):
+    """
+    مهمة تحديث سجلات عدادات الفلاتر لمنتجات (تُجدول من products.facets.enqueue_update)
+    """
+    if not facets.update_products(product_ids):
+        # قفل الفهرس مشغول: إعادة المحاولة بدلاً من حذف الفهرس
+        raise self.retry(countdown=facets.get_update_retry_delay())
+    return len(product_ids)
+
+
+@shared_task(bind=True, max_retries=10)
+def rebuild_facets_task(self):
+    """
+    مهمة بناء عدادات الفلاتر كاملة (تُجدول من products.facets.request_rebuild)
+    """
+    if not facets.rebuild():
+        # تحديث أو بناء آخر يحمل القفل
+        raise self.retry(countdown=facets.get_update_retry_delay())
+    return True
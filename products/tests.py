@@ -1,3 +1,114 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from stores.models import Store
+
+from . import facets
+from .models import Product, ProductVariant
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# بريد الإشعارات داخل الاختبار (locmem outbox) بدلاً من وسيط Celery
+SYNC_EMAIL = {**settings.NOTIFICATIONS_CONFIG, 'EMAIL_QUEUE': 'sync'}
+# تحديث العدادات وبناء الفهرس داخل الاختبار (بدون thread أو Celery)
+SYNC_FACETS = {**settings.FACETS_CONFIG, 'UPDATE_QUEUE': 'sync', 'REFRESH_INTERVAL': 0}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, FACETS_CONFIG=SYNC_FACETS, NOTIFICATIONS_CONFIG=SYNC_EMAIL)
+class ProductListResponseTests(TestCase):
+    """شكل استجابة قائمة المنتجات: مصفوفة كاملة ما لم تُطلب صفحة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(email='owner@example.com', password='Passw0rd!x')
+        store = Store.objects.create(owner=owner, name='Store', description='d', status=Store.StoreStatus.ACTIVE)
+        for i in range(5):
+            Product.objects.create(store=store, name=f'phone {i}', average_rating=i % 2)
+
+    def setUp(self):
+        cache.clear()
+        facets._index = None
+        self.client = APIClient()
+
+    def test_bare_array_without_cursor_or_page_size(self):
+        response = self.client.get('/api/v1/products/', {'sort-by': 'top-rated'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(len(response.json()), 5)
+
+    def test_page_size_returns_cursor_page(self):
+        data = self.client.get('/api/v1/products/', {'page_size': 2}).json()
+        self.assertEqual(set(data), {'next', 'previous', 'results'})
+        self.assertEqual(len(data['results']), 2)
+
+        ids = [item['id'] for item in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            ids.extend(item['id'] for item in data['results'])
+        self.assertEqual(ids, list(Product.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get('/api/v1/products/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, FACETS_CONFIG=SYNC_FACETS, NOTIFICATIONS_CONFIG=SYNC_EMAIL)
+class FacetCountsTests(TestCase):
+    """عدادات الفلاتر تتبع تغييرات السعر وحالة المتجر (products/facets.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(email='owner@example.com', password='Passw0rd!x')
+        cls.store = Store.objects.create(owner=owner, name='A', description='d', status=Store.StoreStatus.ACTIVE)
+        cls.other = Store.objects.create(owner=owner, name='B', description='d', status=Store.StoreStatus.ACTIVE)
+        cls.product = Product.objects.create(store=cls.store, name='cheap')
+        cls.variant = ProductVariant.objects.create(product=cls.product, price=Decimal('10'))
+        Product.objects.create(store=cls.store, name='no price')
+        Product.objects.create(store=cls.other, name='other')
+        Product.refresh_min_price()
+
+    def setUp(self):
+        cache.clear()
+        facets._index = None
+        facets.rebuild()
+
+    def _band(self, price):
+        return facets.price_band(Decimal(price))
+
+    def test_counts_from_rebuilt_index(self):
+        counts = facets.facet_counts({})
+        self.assertEqual(counts['store'], {self.store.pk: 2, self.other.pk: 1})
+        self.assertEqual(counts['price'], {self._band('10'): 1})
+
+    def test_variant_price_change_moves_price_band(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.price = Decimal('600')
+            self.variant.save()
+
+        counts = facets.facet_counts({})
+        self.assertEqual(counts['price'], {self._band('600'): 1})
+
+    def test_store_status_change_removes_its_products(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.status = Store.StoreStatus.SUSPENDED
+            self.other.save()
+
+        counts = facets.facet_counts({})
+        self.assertEqual(counts['store'], {self.store.pk: 2})
+        self.assertNotIn(self.other.products.get().pk, facets.get_index().ids())
+
+    def test_selection_in_other_dimension_scopes_counts(self):
+        counts = facets.facet_counts({'store': [self.other.pk]})
+        # البُعد المختار يبقى بكل بدائله، والأبعاد الأخرى ضمن المتجر المختار
+        self.assertEqual(counts['store'], {self.store.pk: 2, self.other.pk: 1})
+        self.assertEqual(counts['price'], {})
+
+    def test_update_waits_for_missing_index(self):
+        cache.delete(facets.VERSIONS_KEY)
+        # الفهرس غير مكتمل: التحديث لا يُهمل بل يُطلب البناء (مباشرة في وضع sync)
+        self.assertFalse(facets.update_products([self.product.pk]))
+        self.assertTrue(facets.update_products([self.product.pk]))
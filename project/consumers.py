@@ -2,10 +2,17 @@
 WebSocket consumers for real-time dashboard updates
 """
 import json
+import logging
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 
+from . import order_access, presence, ws_auth_cache
+from .location_stream import LocationEncoder, LocationPoint, OrderLocationStage
+from .realtime_log import incr, log_event
+
 
 class DashboardConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -26,13 +33,17 @@ class DashboardConsumer(AsyncWebsocketConsumer):
             
             await self.accept()
             
+            # تسجيل الحضور (بدون كتابة في قاعدة البيانات)
+            await presence.aheartbeat(presence.DASHBOARD, user.id, self.channel_name)
+            log_event('ws.dashboard.connect', user_id=user.id)
+            
             # إرسال رسالة ترحيب
             await self.send(text_data=json.dumps({
                 'type': 'connection_established',
                 'message': 'متصل بنجاح مع لوحة التحكم'
             }))
         except Exception as e:
-            print(f'Error in WebSocket connect: {e}')
+            log_event('ws.dashboard.error', logging.ERROR, stage='connect', error=str(e))
             await self.close(code=4000)
 
     async def disconnect(self, close_code):
@@ -43,8 +54,10 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                     self.dashboard_group_name,
                     self.channel_name
                 )
+                await presence.aleave(presence.DASHBOARD, self.scope["user"].id, self.channel_name)
+                log_event('ws.dashboard.disconnect', user_id=self.scope["user"].id, code=close_code)
         except Exception as e:
-            print(f'Error in WebSocket disconnect: {e}')
+            log_event('ws.dashboard.error', logging.ERROR, stage='disconnect', error=str(e))
 
     # استقبال رسائل من WebSocket
     async def receive(self, text_data):
@@ -53,14 +66,16 @@ class DashboardConsumer(AsyncWebsocketConsumer):
             message_type = text_data_json.get('type', '')
             
             if message_type == 'ping':
+                incr('ws.dashboard.ping')
+                await presence.aheartbeat(presence.DASHBOARD, self.scope["user"].id, self.channel_name)
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
                     'timestamp': text_data_json.get('timestamp')
                 }))
         except json.JSONDecodeError as e:
-            print(f'Invalid JSON received: {e}')
+            log_event('ws.dashboard.invalid_json', logging.WARNING, error=str(e))
         except Exception as e:
-            print(f'Error in WebSocket receive: {e}')
+            log_event('ws.dashboard.error', logging.ERROR, stage='receive', error=str(e))
 
     # استقبال رسائل من المجموعة
     async def new_order(self, event):
@@ -71,8 +86,9 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                 'order': event.get('order', {}),
                 'message': event.get('message', 'طلب جديد')
             }))
+            incr('ws.dashboard.messages_out')
         except Exception as e:
-            print(f'Error sending new_order: {e}')
+            log_event('ws.dashboard.error', logging.ERROR, stage='send', message_type='new_order', error=str(e))
 
     async def order_status_changed(self, event):
         """إرسال إشعار تغيير حالة الطلب"""
@@ -82,8 +98,9 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                 'order': event.get('order', {}),
                 'message': event.get('message', 'تم تحديث الطلب')
             }))
+            incr('ws.dashboard.messages_out')
         except Exception as e:
-            print(f'Error sending order_status_changed: {e}')
+            log_event('ws.dashboard.error', logging.ERROR, stage='send', message_type='order_status_changed', error=str(e))
 
     async def stats_update(self, event):
         """إرسال تحديث الإحصائيات"""
@@ -92,8 +109,9 @@ class DashboardConsumer(AsyncWebsocketConsumer):
                 'type': 'stats_update',
                 'stats': event.get('stats', {})
             }))
+            incr('ws.dashboard.messages_out')
         except Exception as e:
-            print(f'Error sending stats_update: {e}')
+            log_event('ws.dashboard.error', logging.ERROR, stage='send', message_type='stats_update', error=str(e))
 
 # //
 
@@ -107,29 +125,60 @@ class OrderTrackingConsumer(AsyncWebsocketConsumer):
 
         # Extract order_id from route kwargs
         try:
-            order_id = self.scope["url_route"]["kwargs"]["order_id"]
-            self.order_group_name = f"order_{order_id}"
+            order_id = int(self.scope["url_route"]["kwargs"]["order_id"])
         except Exception:
             await self.close(code=4000)
             return
 
+        # العميل، صاحب المتجر، الموصل المعين، أو الموظفون فقط (من الكاش غالباً)
+        try:
+            parties = await self.get_order_parties(order_id)
+        except Exception as e:
+            log_event('ws.order.error', logging.ERROR, stage='access', order_id=order_id, error=str(e))
+            await self.close(code=4000)
+            return
+        if not order_access.can_track_order(user, parties):
+            log_event('ws.order.denied', logging.WARNING, user_id=user.id, order_id=order_id)
+            await self.close(code=4003)
+            return
+
+        self.order_id = order_id
+        self.order_group_name = f"order_{order_id}"
+
+        # صيغة البث المطلوبة: ?format=json (افتراضي) | delta | binary
+        # ?replay=N عدد آخر المواقع المعادة عند الانضمام (افتراضي 1، 0 للتعطيل)
+        query_params = parse_qs(self.scope.get("query_string", b"").decode())
+        self.location_encoder = LocationEncoder(query_params.get("format", ["json"])[0])
+        try:
+            replay = int(query_params.get("replay", ["1"])[0])
+        except ValueError:
+            replay = 1
+        replay = max(0, min(replay, order_access.get_replay_size()))
+        # مرحلة تنظيم بث الموقع لكل الطلب (للناشر فقط؛ تُنشأ عند أول تحديث)
+        self.location_stage = None
+
         try:
             await self.channel_layer.group_add(self.order_group_name, self.channel_name)
             await self.accept()
             await self.send(text_data=json.dumps({
                 "type": "connection_established",
                 "message": f"joined order {order_id}",
+                "format": self.location_encoder.format,
             }))
+            await self.replay_recent_locations(replay)
+            log_event('ws.order.connect', user_id=user.id, order_id=order_id,
+                      format=self.location_encoder.format)
         except Exception as e:
-            print(f"Error in OrderTrackingConsumer.connect: {e}")
+            log_event('ws.order.error', logging.ERROR, stage='connect', order_id=order_id, error=str(e))
             await self.close(code=4000)
 
     async def disconnect(self, close_code):
         try:
             if hasattr(self, "order_group_name"):
                 await self.channel_layer.group_discard(self.order_group_name, self.channel_name)
+                log_event('ws.order.disconnect', order_id=self.order_id, code=close_code)
         except Exception as e:
-            print(f"Error in OrderTrackingConsumer.disconnect: {e}")
+            log_event('ws.order.error', logging.ERROR, stage='disconnect', error=str(e))
 
     async def receive(self, text_data):
         """Handle incoming messages from client (e.g., driver location updates)."""
@@ -142,40 +191,61 @@ class OrderTrackingConsumer(AsyncWebsocketConsumer):
                 await self.send(text_data=json.dumps({"type": "pong", "timestamp": data.get("timestamp")}))
                 return
 
-            # Only delivery or staff can publish location updates
+            # Only the assigned driver or staff can publish location updates
             if msg_type == "location_update":
-                if not (getattr(user, "is_delivery", False) or getattr(user, "is_staff", False)):
+                point = LocationPoint.from_client(getattr(user, "id", None), data)
+                if point is None:
+                    await self.send(text_data=json.dumps({
+                        "type": "error",
+                        "message": "invalid_location"
+                    }))
+                    return
+
+                # تحديد المعدل وتجاهل الحركة الأقل من الحد قبل المرور بـ channel layer
+                if self.location_stage is None:
+                    self.location_stage = OrderLocationStage(self.order_id)
+                if not await self.location_stage.aoffer(point):
+                    incr('ws.order.location_dropped')
+                    return
+
+                # إعادة التحقق لكل نقطة مقبولة (تغيير الموصل المعين أثناء الاتصال)
+                parties = await self.get_order_parties(self.order_id)
+                if not order_access.can_publish_location(user, parties):
                     await self.send(text_data=json.dumps({
                         "type": "error",
                         "message": "not_authorized_to_publish_location"
                     }))
                     return
 
-                payload = {
-                    "event": "location_update",
-                    "driver_id": getattr(user, "id", None),
-                    "lat": data.get("lat"),
-                    "lng": data.get("lng"),
-                    "speed": data.get("speed"),
-                    "heading": data.get("heading"),
-                    "ts": data.get("ts"),
-                }
-                await self.channel_layer.group_send(
-                    self.order_group_name,
-                    {"type": "location_update", **payload}
-                )
+                event = point.to_event()
+                await self.channel_layer.group_send(self.order_group_name, event)
+                log_event('ws.order.location', order_id=self.order_id, driver_id=point.driver_id)
+                await order_access.apush_location(self.order_id, event)
                 return
         except json.JSONDecodeError as e:
-            print(f"Invalid JSON in OrderTrackingConsumer.receive: {e}")
+            log_event('ws.order.invalid_json', logging.WARNING, error=str(e))
         except Exception as e:
-            print(f"Error in OrderTrackingConsumer.receive: {e}")
+            log_event('ws.order.error', logging.ERROR, stage='receive', error=str(e))
 
     async def location_update(self, event):
         """Fan-out location update to all connected clients for the order."""
         try:
-            await self.send(text_data=json.dumps(event))
+            text_data, bytes_data = self.location_encoder.encode(LocationPoint.from_event(event))
+            await self.send(text_data=text_data, bytes_data=bytes_data)
+            incr('ws.order.frames_out')
+            incr('ws.order.bytes_out', len(text_data or bytes_data))
         except Exception as e:
-            print(f"Error sending location_update: {e}")
+            log_event('ws.order.error', logging.ERROR, stage='send', message_type='location_update', error=str(e))
+
+    async def replay_recent_locations(self, limit):
+        """إرسال آخر مواقع الموصل المعروفة للمشترك الجديد"""
+        for event in await order_access.arecent_locations(self.order_id, limit):
+            text_data, bytes_data = self.location_encoder.encode(LocationPoint.from_event(event), replay=True)
+            await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    @database_sync_to_async
+    def get_order_parties(self, order_id):
+        return order_access.get_order_parties(order_id)
 
 
 # ===== إضافة WebSocket للموصل - بداية التعديل =====
@@ -188,22 +258,17 @@ class DriverConsumer(AsyncWebsocketConsumer):
         """اتصال الموصل بالـ WebSocket"""
         user = self.scope.get("user")
         
-        print(f"DriverConsumer connect attempt - User: {user}")
-        
         # التحقق من المصادقة والتأكد أن المستخدم موصل
         if not user or user.is_anonymous:
-            print("WebSocket connection rejected: User not authenticated")
+            log_event('ws.driver.rejected', logging.WARNING, reason='unauthenticated')
             await self.close(code=4001)  # Unauthorized
             return
             
-        print(f"User authenticated: {user.email} (ID: {user.id})")
-        
         # التحقق من أن المستخدم موصل معتمد
         is_driver = await self.check_driver_status(user)
-        print(f"Driver status check result: {is_driver}")
         
         if not is_driver:
-            print("WebSocket connection rejected: User is not an approved driver")
+            log_event('ws.driver.rejected', logging.WARNING, reason='not_driver', user_id=user.id)
             await self.close(code=4003)  # Forbidden - Not a driver
             return
         
@@ -233,11 +298,13 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 'driver_id': user.id
             }))
             
-            # تحديث حالة الموصل إلى متصل
-            await self.update_driver_online_status(user, True)
+            # تحديث حالة الموصل إلى متصل وتسجيل الحضور
+            self.driver_city = await self.update_driver_online_status(user, True)
+            await presence.aheartbeat(presence.DRIVERS, user.id, self.channel_name, self.driver_city)
+            log_event('ws.driver.connect', user_id=user.id, city=self.driver_city)
             
         except Exception as e:
-            print(f'Error in DriverConsumer connect: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='connect', user_id=user.id, error=str(e))
             await self.close(code=4000)
 
     async def disconnect(self, close_code):
@@ -259,11 +326,14 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 )
             
             # تحديث حالة الموصل إلى غير متصل
-            if user and not user.is_anonymous:
+            if user and not user.is_anonymous and hasattr(self, 'driver_group_name'):
+                await presence.aleave(presence.DRIVERS, user.id, self.channel_name,
+                                      getattr(self, 'driver_city', None))
                 await self.update_driver_online_status(user, False)
+                log_event('ws.driver.disconnect', user_id=user.id, code=close_code)
                 
         except Exception as e:
-            print(f'Error in DriverConsumer disconnect: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='disconnect', error=str(e))
 
     async def receive(self, text_data):
         """استقبال رسائل من الموصل"""
@@ -272,8 +342,10 @@ class DriverConsumer(AsyncWebsocketConsumer):
             message_type = data.get('type', '')
             
             if message_type == 'ping':
-                print("Received ping from driver")
-                # رد على ping للتأكد من الاتصال
+                log_event('ws.driver.ping', user_id=self.scope['user'].id)
+                # تجديد الحضور (Redis فقط) ثم الرد على ping
+                await presence.aheartbeat(presence.DRIVERS, self.scope['user'].id,
+                                          self.channel_name, getattr(self, 'driver_city', None))
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
                     'timestamp': data.get('timestamp')
@@ -284,6 +356,7 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 latitude = data.get('latitude')
                 longitude = data.get('longitude')
                 if latitude and longitude:
+                    log_event('ws.driver.location', user_id=self.scope['user'].id)
                     await self.update_driver_location(
                         self.scope['user'], 
                         latitude, 
@@ -299,9 +372,9 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 )
                 
         except json.JSONDecodeError as e:
-            print(f'Invalid JSON received in DriverConsumer: {e}')
+            log_event('ws.driver.invalid_json', logging.WARNING, error=str(e))
         except Exception as e:
-            print(f'Error in DriverConsumer receive: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='receive', error=str(e))
 
     # رسائل الطلبات
     async def new_order_available(self, event):
@@ -312,8 +385,9 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 'order': event.get('order', {}),
                 'message': event.get('message', 'طلب جديد متاح للقبول!')
             }))
+            incr('ws.driver.messages_out')
         except Exception as e:
-            print(f'Error sending new_order_available: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='send', message_type='new_order_available', error=str(e))
 
     async def order_assigned(self, event):
         """إشعار بتعيين طلب للموصل"""
@@ -323,8 +397,9 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 'order': event.get('order', {}),
                 'message': event.get('message', 'تم تعيين طلب جديد لك!')
             }))
+            incr('ws.driver.messages_out')
         except Exception as e:
-            print(f'Error sending order_assigned: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='send', message_type='order_assigned', error=str(e))
 
     async def order_cancelled(self, event):
         """إشعار بإلغاء طلب"""
@@ -334,8 +409,9 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 'order_id': event.get('order_id'),
                 'message': event.get('message', 'تم إلغاء الطلب')
             }))
+            incr('ws.driver.messages_out')
         except Exception as e:
-            print(f'Error sending order_cancelled: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='send', message_type='order_cancelled', error=str(e))
 
     async def driver_notification(self, event):
         """إشعار عام للموصل"""
@@ -346,60 +422,80 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 'message': event.get('message', ''),
                 'data': event.get('data', {})
             }))
+            incr('ws.driver.messages_out')
         except Exception as e:
-            print(f'Error sending driver_notification: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='send', message_type='driver_notification', error=str(e))
+
+    async def notifications_count(self, event):
+        """
+        تحديث عداد الإشعارات: قيم مطلقة (unread_count/total_count) لموصل محدد،
+        أو زيادة (unread_delta/total_delta) عند إشعار جميع الموصلين
+        """
+        payload = {'type': 'notifications_count'}
+        for field in ('unread_count', 'total_count', 'unread_delta', 'total_delta'):
+            if field in event:
+                payload[field] = event[field]
+        try:
+            await self.send(text_data=json.dumps(payload))
+            incr('ws.driver.messages_out')
+        except Exception as e:
+            log_event('ws.driver.error', logging.ERROR, stage='send', message_type='notifications_count', error=str(e))
 
     # دوال مساعدة
     @database_sync_to_async
     def check_driver_status(self, user):
-        """التحقق من أن المستخدم موصل معتمد"""
+        """التحقق من أن المستخدم موصل معتمد (مع كاش قصير العمر لإعادة الاتصال)"""
+        cached = ws_auth_cache.get_driver_eligibility(user.id)
+        if cached is not None:
+            return cached
+
+        is_driver = self._resolve_driver_status(user)
+        if is_driver is not None:
+            ws_auth_cache.set_driver_eligibility(user.id, is_driver)
+            return is_driver
+        # للاختبار: السماح بالاتصال في حالة الخطأ (بدون تخزين النتيجة)
+        return True
+
+    def _resolve_driver_status(self, user):
+        """حساب أهلية الموصل من قاعدة البيانات، أو None عند حدوث خطأ"""
         try:
-            print(f"Checking driver status for user {user.id}")
-            print(f"user.is_delivery: {getattr(user, 'is_delivery', False)}")
-            
             # التحقق الأساسي من أن المستخدم موصل
             if not getattr(user, 'is_delivery', False):
-                print("User is not marked as delivery driver")
                 return False
             
             # التحقق من وجود ملف الموصل
             if not hasattr(user, 'deliveryprofile'):
-                print("User has no delivery profile")
                 # للاختبار: السماح بالاتصال حتى لو لم يكن لديه ملف موصل مكتمل
                 return True
             
             profile = user.deliveryprofile
-            print(f"Delivery profile found - Status: {profile.verification_status}")
-            
             # التحقق من حالة التحقق
             if profile.verification_status != 'APPROVED':
-                print(f"Driver not approved - Status: {profile.verification_status}")
                 # للاختبار: السماح بالاتصال حتى لو لم يكن معتمد
                 return True
             
             # التحقق من عدم الإيقاف
             if getattr(profile, 'suspended', False):
-                print("Driver is suspended")
                 return False
             
-            print("Driver status check passed")
             return True
             
         except Exception as e:
-            print(f"Error in check_driver_status: {e}")
-            # للاختبار: السماح بالاتصال في حالة الخطأ
-            return True
+            log_event('ws.driver.error', logging.ERROR, stage='status_check', user_id=user.id, error=str(e))
+            return None
 
     @database_sync_to_async
     def update_driver_online_status(self, user, is_online):
-        """تحديث حالة الاتصال للموصل"""
+        """تحديث آخر ظهور للموصل (عند الاتصال والقطع فقط) وإرجاع مدينته للحضور"""
         try:
             from django.utils import timezone
             if hasattr(user, 'deliveryprofile'):
                 user.deliveryprofile.last_seen_at = timezone.now()
                 user.deliveryprofile.save(update_fields=['last_seen_at'])
+                return user.deliveryprofile.city
         except Exception as e:
-            print(f'Error updating driver online status: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='online_status', user_id=user.id, error=str(e))
+        return None
 
     @database_sync_to_async
     def update_driver_location(self, user, latitude, longitude) :
@@ -419,7 +515,7 @@ class DriverConsumer(AsyncWebsocketConsumer):
 
                  
         except Exception as e:
-            print(f'Error updating driver location: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='location', user_id=user.id, error=str(e))
 
     @database_sync_to_async
     def update_driver_availability(self, user, is_available):
@@ -429,7 +525,7 @@ class DriverConsumer(AsyncWebsocketConsumer):
                 user.deliveryprofile.is_available = is_available
                 user.deliveryprofile.save(update_fields=['is_available'])
         except Exception as e:
-            print(f'Error updating driver availability: {e}')
+            log_event('ws.driver.error', logging.ERROR, stage='availability', user_id=user.id, error=str(e))
 
   
 # ===== إضافة WebSocket للموصل - نهاية التعديل =====
@@ -109,12 +109,14 @@ from collections import OrderedDict
 from django.utils import timezone
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
+from django.http import JsonResponse
 from django.db.models import Count, Sum, Q
 from django.db.models.functions import TruncDate
 
 from orders.models import Order
 from products.models import Product
 from accounts.models import User
+from project import presence, realtime_log
 
 
 @staff_member_required
@@ -207,6 +209,7 @@ def dashboard_view(request):
             'so_in_delivery': so_in_delivery,
             'new_users_7d': new_users_7d,
         },
+        'presence': presence.get_presence_snapshot(),
         'orders_by_day_labels': list(orders_by_day.keys()),
         'orders_by_day_values': list(orders_by_day.values()),
         'top_products': list(top_products),
@@ -220,3 +223,15 @@ def dashboard_view(request):
     return render(request, 'dashboard/pages/dashboard/index.html', context)
 
 
+@staff_member_required
+def presence_api_view(request):
+    """عدد الموصلين ولوحات التحكم المتصلة حالياً (من Redis بدون استعلامات)"""
+    return JsonResponse(presence.get_presence_snapshot())
+
+
+@staff_member_required
+def realtime_metrics_api_view(request):
+    """عدادات طبقة WebSocket لهذه العملية (اتصالات، رسائل، أخطاء، بايتات) مع الحضور الحالي"""
+    metrics = realtime_log.get_metrics()
+    metrics['presence'] = presence.get_presence_snapshot()
+    return JsonResponse(metrics)
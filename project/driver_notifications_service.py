@@ -9,6 +9,9 @@ import logging
 # ===== إضافة حفظ الإشعارات - بداية التعديل =====
 from driver.models_notifications import DriverNotification
 # ===== إضافة حفظ الإشعارات - نهاية التعديل =====
+from driver import notification_inbox
+
+from .realtime_log import log_event
 
 logger = logging.getLogger(__name__)
 channel_layer = get_channel_layer()
@@ -26,7 +29,7 @@ class DriverNotificationService:
     def send_to_driver(self, driver_id, message_type, data):
         """إرسال إشعار لموصل محدد"""
         if not self.channel_layer:
-            print("Channel layer not configured")
+            log_event('ws.driver_service.no_layer', logging.WARNING)
             return False
             
         group_name = f'driver_{driver_id}'
@@ -39,15 +42,17 @@ class DriverNotificationService:
                     **data
                 }
             )
+            log_event('ws.driver_service.send', message_type=message_type, driver_id=driver_id)
             return True
         except Exception as e:
-            print(f"Error sending notification to driver {driver_id}: {e}")
+            log_event('ws.driver_service.error', logging.ERROR, message_type=message_type,
+                      driver_id=driver_id, error=str(e))
             return False
     
     def send_to_all_drivers(self, message_type, data):
         """إرسال إشعار لجميع الموصلين المتصلين"""
         if not self.channel_layer:
-            print("Channel layer not configured")
+            log_event('ws.driver_service.no_layer', logging.WARNING)
             return False
             
         try:
@@ -58,9 +63,11 @@ class DriverNotificationService:
                     **data
                 }
             )
+            log_event('ws.driver_service.broadcast', message_type=message_type)
             return True
         except Exception as e:
-            print(f"Error sending notification to all drivers: {e}")
+            log_event('ws.driver_service.error', logging.ERROR, message_type=message_type,
+                      group='all_drivers', error=str(e))
             return False
     
     def notify_new_order_available(self, order):
@@ -71,23 +78,23 @@ class DriverNotificationService:
         # ===== إضافة حفظ الإشعارات - بداية التعديل =====
         # حفظ الإشعار في قاعدة البيانات للموصلين المتاحين
         try:
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            
-            available_drivers = User.objects.filter(
-                is_delivery=True,
-                is_active=True
+            driver_ids = list(
+                User.objects.filter(is_delivery=True, is_active=True).values_list('id', flat=True)
             )
-            
-            for driver in available_drivers:
-                DriverNotification.objects.create(
-                    driver=driver,
+            DriverNotification.objects.bulk_create([
+                DriverNotification(
+                    driver_id=driver_id,
                     title='طلب جديد متاح',
                     message=message,
                     notification_type='new_order',
                     priority='high',
                     data=order_data
                 )
+                for driver_id in driver_ids
+            ])
+            # bulk_create لا يرسل post_save: إبطال العدادات ودفع الزيادة لجميع المتصلين
+            notification_inbox.invalidate_many(driver_ids)
+            notification_inbox.push_broadcast_delta()
         except Exception as e:
             logger.error(f'خطأ في حفظ إشعار الطلب الجديد: {e}')
         # ===== إضافة حفظ الإشعارات - نهاية التعديل =====
@@ -166,6 +173,130 @@ class DriverNotificationService:
             }
         )
     
+    # ===== الواجهة غير المتزامنة =====
+    # للاستدعاء من consumers و ASGI views: group_send يُنتظر مباشرة والـ ORM غير متزامن،
+    # بدون async_to_sync ولا database_sync_to_async
+
+    async def asend_to_driver(self, driver_id, message_type, data):
+        """نسخة async من send_to_driver"""
+        if not self.channel_layer:
+            log_event('ws.driver_service.no_layer', logging.WARNING)
+            return False
+        try:
+            await self.channel_layer.group_send(f'driver_{driver_id}', {'type': message_type, **data})
+            log_event('ws.driver_service.send', message_type=message_type, driver_id=driver_id)
+            return True
+        except Exception as e:
+            log_event('ws.driver_service.error', logging.ERROR, message_type=message_type,
+                      driver_id=driver_id, error=str(e))
+            return False
+
+    async def asend_to_all_drivers(self, message_type, data):
+        """نسخة async من send_to_all_drivers"""
+        if not self.channel_layer:
+            log_event('ws.driver_service.no_layer', logging.WARNING)
+            return False
+        try:
+            await self.channel_layer.group_send('all_drivers', {'type': message_type, **data})
+            log_event('ws.driver_service.broadcast', message_type=message_type)
+            return True
+        except Exception as e:
+            log_event('ws.driver_service.error', logging.ERROR, message_type=message_type,
+                      group='all_drivers', error=str(e))
+            return False
+
+    async def anotify_new_order_available(self, order):
+        """نسخة async من notify_new_order_available"""
+        order_data = await self._aserialize_order(order)
+        message = f'طلب جديد متاح للقبول - الطلب #{order_data["id"]}'
+
+        try:
+            driver_ids = [
+                pk async for pk in
+                User.objects.filter(is_delivery=True, is_active=True).values_list('id', flat=True)
+            ]
+            await DriverNotification.objects.abulk_create([
+                DriverNotification(
+                    driver_id=driver_id,
+                    title='طلب جديد متاح',
+                    message=message,
+                    notification_type='new_order',
+                    priority='high',
+                    data=order_data
+                )
+                for driver_id in driver_ids
+            ])
+            await notification_inbox.ainvalidate_many(driver_ids)
+            await self.asend_to_all_drivers('notifications_count', {'unread_delta': 1, 'total_delta': 1})
+        except Exception as e:
+            logger.error(f'خطأ في حفظ إشعار الطلب الجديد: {e}')
+
+        return await self.asend_to_all_drivers('new_order_available', {
+            'order': order_data,
+            'message': message
+        })
+
+    async def anotify_order_assigned(self, order, driver_id):
+        """نسخة async من notify_order_assigned (بمعرف الموصل)"""
+        order_data = await self._aserialize_order(order)
+        message = f'تم تعيين الطلب #{order_data["id"]} لك'
+
+        try:
+            await DriverNotification.objects.acreate(
+                driver_id=driver_id,
+                title='تم تعيين طلب جديد',
+                message=message,
+                notification_type='order_assigned',
+                priority='high',
+                data=order_data
+            )
+        except Exception as e:
+            logger.error(f'خطأ في حفظ إشعار تعيين الطلب: {e}')
+
+        return await self.asend_to_driver(driver_id, 'order_assigned', {
+            'order': order_data,
+            'message': message
+        })
+
+    async def anotify_order_cancelled(self, order_id, driver_id=None):
+        """نسخة async من notify_order_cancelled"""
+        data = {
+            'order_id': order_id,
+            'message': f'تم إلغاء الطلب #{order_id}'
+        }
+        if driver_id:
+            return await self.asend_to_driver(driver_id, 'order_cancelled', data)
+        return await self.asend_to_all_drivers('order_cancelled', data)
+
+    async def anotify_driver_general(self, driver_id, title, message, data=None):
+        """نسخة async من notify_driver_general"""
+        return await self.asend_to_driver(driver_id, 'driver_notification', {
+            'title': title,
+            'message': message,
+            'data': data or {}
+        })
+
+    async def anotify_all_drivers_general(self, title, message, data=None):
+        """نسخة async من notify_all_drivers_general"""
+        return await self.asend_to_all_drivers('driver_notification', {
+            'title': title,
+            'message': message,
+            'data': data or {}
+        })
+
+    async def _aserialize_order(self, order):
+        """تحميل الطلب مع المتجر والعميل والعناصر في ORM غير متزامن ثم التحويل بدون استعلامات"""
+        order_id = getattr(order, 'pk', order)
+        try:
+            order = await (
+                Order.objects.select_related('store', 'user')
+                .prefetch_related('items')
+                .aget(pk=order_id)
+            )
+        except Order.DoesNotExist:
+            return {'id': order_id, 'error': 'خطأ في تحميل بيانات الطلب'}
+        return self._serialize_order(order)
+
     def _serialize_order(self, order):
         """تحويل بيانات الطلب إلى JSON"""
         try:
@@ -217,7 +348,8 @@ class DriverNotificationService:
             return order_data
             
         except Exception as e:
-            print(f"Error serializing order {order.id}: {e}")
+            log_event('ws.driver_service.error', logging.ERROR, stage='serialize',
+                      order_id=order.id, error=str(e))
             return {
                 'id': order.id,
                 'error': 'خطأ في تحميل بيانات الطلب'
@@ -252,3 +384,24 @@ def notify_driver(driver_id, title, message, data=None):
 def notify_all_drivers(title, message, data=None):
     """دالة مساعدة لإرسال إشعار عام لجميع الموصلين"""
     return driver_notification_service.notify_all_drivers_general(title, message, data)
+
+
+# دوال مساعدة async (consumers و ASGI views)
+async def anotify_new_order_available(order):
+    return await driver_notification_service.anotify_new_order_available(order)
+
+
+async def anotify_order_assigned(order, driver_id):
+    return await driver_notification_service.anotify_order_assigned(order, driver_id)
+
+
+async def anotify_order_cancelled(order_id, driver_id=None):
+    return await driver_notification_service.anotify_order_cancelled(order_id, driver_id)
+
+
+async def anotify_driver(driver_id, title, message, data=None):
+    return await driver_notification_service.anotify_driver_general(driver_id, title, message, data)
+
+
+async def anotify_all_drivers(title, message, data=None):
+    return await driver_notification_service.anotify_all_drivers_general(title, message, data)
@@ -1,12 +1,19 @@
 """
 JWT Authentication Middleware for WebSocket connections
 """
+import logging
+
 import jwt
 from django.conf import settings
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from urllib.parse import parse_qs
 
+from accounts import tokens
+
+from . import ws_auth_cache
+from .realtime_log import log_event
+
 
 class JWTAuthMiddleware(BaseMiddleware):
     """
@@ -41,7 +48,7 @@ class JWTAuthMiddleware(BaseMiddleware):
                 return query_params['token'][0]
                 
         except Exception as e:
-            print(f'Error extracting token from scope: {e}')
+            log_event('ws.auth.error', logging.ERROR, stage='extract_token', error=str(e))
         
         return None
 
@@ -55,40 +62,55 @@ class JWTAuthMiddleware(BaseMiddleware):
             
             User = get_user_model()
             
-            # فك تشفير JWT token
-            payload = jwt.decode(
-                token, 
-                settings.SECRET_KEY, 
-                algorithms=['HS256']
-            )
+            # claims مخزنة مسبقاً لنفس الـ token (تم التحقق من توقيعها عند التخزين)
+            payload = ws_auth_cache.get_token_claims(token)
+            if payload is None:
+                # فك تشفير JWT token
+                payload = jwt.decode(
+                    token, 
+                    settings.SECRET_KEY, 
+                    algorithms=['HS256']
+                )
+                ws_auth_cache.set_token_claims(token, payload)
             
             # استخراج user_id من payload
             user_id = payload.get('user_id')
             if not user_id:
-                print('No user_id in JWT payload')
+                log_event('ws.auth.rejected', logging.WARNING, reason='no_user_id')
                 return AnonymousUser()
             
-            # البحث عن المستخدم في قاعدة البيانات
-            user = User.objects.get(id=user_id)
+            if tokens.has_claims(payload):
+                # token يحمل الصلاحيات: مقارنة رقم الإصدار فقط بدون تحميل المستخدم
+                # (الحقول الأخرى تُحمّل عند الوصول إليها، داخل كود sync فقط)
+                if tokens.get_token_version(user_id) != payload[tokens.VERSION_CLAIM]:
+                    log_event('ws.auth.rejected', logging.WARNING, reason='token_revoked', user_id=user_id)
+                    return AnonymousUser()
+                user = tokens.user_from_claims(payload)
+            else:
+                # البحث عن المستخدم في الكاش ثم في قاعدة البيانات
+                user = ws_auth_cache.get_cached_user(user_id)
+                if user is None:
+                    user = User.objects.get(id=user_id)
+                    ws_auth_cache.set_cached_user(user)
             
             # التحقق من أن المستخدم نشط
             if not user.is_active:
-                print(f'User {user_id} is not active')
+                log_event('ws.auth.rejected', logging.WARNING, reason='inactive', user_id=user_id)
                 return AnonymousUser()
             
-            print(f'JWT Authentication successful for user: {user.email} (ID: {user.id})')
+            log_event('ws.auth.ok', user_id=user.id)
             return user
             
         except jwt.ExpiredSignatureError:
-            print('JWT token has expired')
+            log_event('ws.auth.rejected', logging.WARNING, reason='expired')
             from django.contrib.auth.models import AnonymousUser
             return AnonymousUser()
         except jwt.InvalidTokenError as e:
-            print(f'Invalid JWT token: {e}')
+            log_event('ws.auth.rejected', logging.WARNING, reason='invalid_token', error=str(e))
             from django.contrib.auth.models import AnonymousUser
             return AnonymousUser()
         except Exception as e:
-            print(f'Error in JWT authentication: {e}')
+            log_event('ws.auth.error', logging.ERROR, stage='authenticate', error=str(e))
             from django.contrib.auth.models import AnonymousUser
             return AnonymousUser()
 
@@ -0,0 +1,290 @@
+"""
+مرحلة بث مواقع الموصل لكل طلب (OrderTrackingConsumer)
+
+- LocationStreamStage: على جهة الناشر (الموصل)؛ تحدد معدل الإرسال الأقصى وتُسقط
+  التحديثات التي لم يتحرك فيها الموصل مسافة كافية (مع إرسال دوري للإبقاء على البث).
+  OrderLocationStage: نفس القواعد بحالة مشتركة لكل طلب في الكاش، فاتصال ثانٍ
+  للموصل أو ناشر من الطاقم لا يضاعف المعدل.
+- LocationPoint: نقطة مضغوطة (إحداثيات صحيحة بدقة 1e-6) تُرسل داخل channel layer
+  بمفاتيح قصيرة بدلاً من كائن JSON كامل.
+- LocationEncoder: على جهة كل مشترك؛ يحول النقطة إلى الصيغة التي طلبها العميل:
+    json   (افتراضي) نفس الرسالة الكاملة السابقة
+    delta  JSON مختصر: keyframe ثم فروقات عن آخر نقطة أُرسلت لهذا العميل
+    binary إطار ثنائي ثابت الحجم (struct، 25 بايت)
+
+ts كما أرسله العميل يبقى في صيغة json دون تغيير. delta و binary تستخدمان ts_ms:
+epoch بالمللي ثانية من رقم أو نص ISO-8601، أو بدون وقت لأي قيمة أخرى.
+"""
+import json
+import logging
+import math
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+COORD_SCALE = 1_000_000  # 1e-6 درجة ≈ 11 سم
+EARTH_RADIUS_M = 6_371_000
+
+FORMAT_JSON = 'json'
+FORMAT_DELTA = 'delta'
+FORMAT_BINARY = 'binary'
+STREAM_FORMATS = (FORMAT_JSON, FORMAT_DELTA, FORMAT_BINARY)
+
+# kind(B) driver_id(I) lat(i) lng(i) speed*10(H) heading(H) ts_ms(q) = 25 بايت
+# ts_ms = 0 عندما لا يرسل الموصل وقتاً صالحاً
+BINARY_FRAME = struct.Struct('!BIiiHHq')
+TS_MS_MAX = 2 ** 63 - 1
+BINARY_KIND_LOCATION = 1
+BINARY_KIND_REPLAY = 2  # نقطة من ring buffer عند الانضمام
+NO_VALUE_U16 = 0xFFFF
+
+STAGE_KEY = 'ws:order:stage:{order_id}'
+
+DEFAULTS = {
+    'LOCATION_MAX_RATE_HZ': 1.0,
+    'LOCATION_MIN_DISTANCE_M': 5.0,
+    'LOCATION_KEEPALIVE_S': 15.0,
+    'LOCATION_KEYFRAME_INTERVAL': 20,
+}
+
+
+def get_stream_setting(name):
+    config = getattr(settings, 'REALTIME_CONFIG', {})
+    return config.get(name, DEFAULTS[name])
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_ts_ms(value):
+    """
+    ts كـ epoch بالمللي ثانية: رقم (أو نص رقمي) كما هو، أو نص ISO-8601
+    (بدون منطقة زمنية = UTC). None إذا لم يُرسل أو لأي قيمة أخرى.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    number = _to_float(value)
+    if number is None:
+        if not isinstance(value, str):
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        number = parsed.timestamp() * 1000
+    if not math.isfinite(number) or not 0 <= number <= TS_MS_MAX:
+        return None
+    return int(round(number))
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """المسافة بالمتر بين نقطتين"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+@dataclass
+class LocationPoint:
+    driver_id: int
+    lat_e6: int
+    lng_e6: int
+    speed: float = None
+    heading: float = None
+    ts: object = None  # كما أرسله العميل (صيغة json)
+    ts_ms: int = None  # epoch بالمللي ثانية (delta و binary)
+
+    @classmethod
+    def from_client(cls, driver_id, data):
+        """إنشاء نقطة من رسالة العميل، أو None إذا كانت الإحداثيات غير صالحة"""
+        lat, lng = _to_float(data.get('lat')), _to_float(data.get('lng'))
+        if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return None
+        ts = data.get('ts')
+        return cls(
+            driver_id=driver_id,
+            lat_e6=int(round(lat * COORD_SCALE)),
+            lng_e6=int(round(lng * COORD_SCALE)),
+            speed=_to_float(data.get('speed')),
+            heading=_to_float(data.get('heading')),
+            ts=ts,
+            ts_ms=_to_ts_ms(ts),
+        )
+
+    @property
+    def lat(self):
+        return self.lat_e6 / COORD_SCALE
+
+    @property
+    def lng(self):
+        return self.lng_e6 / COORD_SCALE
+
+    # ===== النقل داخل channel layer =====
+
+    def to_event(self):
+        """رسالة group_send مختصرة"""
+        return {
+            'type': 'location_update',
+            'd': self.driver_id,
+            'p': [self.lat_e6, self.lng_e6, self.speed, self.heading, self.ts, self.ts_ms],
+        }
+
+    @classmethod
+    def from_event(cls, event):
+        # أحداث ring buffer السابقة بدون ts_ms
+        lat_e6, lng_e6, speed, heading, ts, *rest = event['p']
+        ts_ms = rest[0] if rest else _to_ts_ms(ts)
+        return cls(event.get('d'), lat_e6, lng_e6, speed, heading, ts, ts_ms)
+
+
+class LocationStreamStage:
+    """
+    مرحلة تنظيم البث على جهة الناشر: تُرجع True إذا كان يجب نشر النقطة.
+    """
+
+    def __init__(self, max_rate_hz=None, min_distance_m=None, keepalive_s=None, clock=time.monotonic):
+        max_rate_hz = max_rate_hz if max_rate_hz is not None else get_stream_setting('LOCATION_MAX_RATE_HZ')
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz else 0.0
+        self.min_distance_m = min_distance_m if min_distance_m is not None else get_stream_setting('LOCATION_MIN_DISTANCE_M')
+        self.keepalive_s = keepalive_s if keepalive_s is not None else get_stream_setting('LOCATION_KEEPALIVE_S')
+        self.clock = clock
+        self.last_point = None
+        self.last_sent_at = None
+        self.accepted = 0
+        self.dropped = 0
+
+    def offer(self, point):
+        now = self.clock()
+        if self.last_point is not None:
+            elapsed = now - self.last_sent_at
+            if elapsed < self.min_interval:
+                self.dropped += 1
+                return False
+            moved = haversine_m(self.last_point.lat, self.last_point.lng, point.lat, point.lng)
+            if moved < self.min_distance_m and elapsed < self.keepalive_s:
+                self.dropped += 1
+                return False
+        self.last_point = point
+        self.last_sent_at = now
+        self.accepted += 1
+        return True
+
+
+class OrderLocationStage(LocationStreamStage):
+    """
+    LocationStreamStage لطلب واحد: آخر نقطة منشورة ووقتها في الكاش، فكل
+    الناشرين على الطلب (أكثر من اتصال) يتشاركون نفس الحد. الوقت من الساعة
+    الحقيقية لأن الحالة تُقرأ من عمليات مختلفة.
+    """
+
+    def __init__(self, order_id, **kwargs):
+        kwargs.setdefault('clock', time.time)
+        super().__init__(**kwargs)
+        self.key = STAGE_KEY.format(order_id=order_id)
+        self.state_ttl = max(int(math.ceil(self.keepalive_s)) * 2, 60)
+
+    async def aoffer(self, point):
+        """offer() على حالة الطلب المشتركة (حالة الاتصال فقط إذا تعذر الكاش)"""
+        try:
+            state = await cache.aget(self.key)
+        except Exception as e:
+            logger.warning(f'location stage read failed ({self.key}): {e}')
+            state = None
+        if state:
+            lat_e6, lng_e6, sent_at = state
+            self.last_point = LocationPoint(point.driver_id, lat_e6, lng_e6)
+            self.last_sent_at = sent_at
+        if not self.offer(point):
+            return False
+        try:
+            await cache.aset(self.key, (point.lat_e6, point.lng_e6, self.last_sent_at), self.state_ttl)
+        except Exception as e:
+            logger.warning(f'location stage write failed ({self.key}): {e}')
+        return True
+
+
+class LocationEncoder:
+    """
+    ترميز النقاط لمشترك واحد حسب الصيغة المطلوبة.
+    encode() ترجع (text_data, bytes_data) - أحدهما None.
+    """
+
+    def __init__(self, stream_format=FORMAT_JSON, keyframe_interval=None):
+        self.format = stream_format if stream_format in STREAM_FORMATS else FORMAT_JSON
+        self.keyframe_interval = keyframe_interval or get_stream_setting('LOCATION_KEYFRAME_INTERVAL')
+        self.last_point = None
+        self.since_keyframe = 0
+
+    def encode(self, point, replay=False):
+        """replay=True لنقاط معادة من ring buffer عند الانضمام"""
+        if self.format == FORMAT_BINARY:
+            return None, self._encode_binary(point, replay)
+        if self.format == FORMAT_DELTA:
+            return self._encode_delta(point, replay), None
+        return self._encode_json(point, replay), None
+
+    def _encode_json(self, point, replay):
+        # نفس شكل الرسالة قبل الضغط للعملاء الحاليين
+        message = {
+            'type': 'location_update',
+            'event': 'location_update',
+            'driver_id': point.driver_id,
+            'lat': point.lat,
+            'lng': point.lng,
+            'speed': point.speed,
+            'heading': point.heading,
+            'ts': point.ts,
+        }
+        if replay:
+            message['replay'] = True
+        return json.dumps(message)
+
+    def _encode_delta(self, point, replay):
+        last = self.last_point
+        keyframe = (
+            last is None
+            or last.driver_id != point.driver_id
+            or self.since_keyframe >= self.keyframe_interval
+        )
+        if keyframe:
+            frame = {'t': 'k', 'd': point.driver_id, 'a': point.lat_e6, 'o': point.lng_e6}
+            if point.speed is not None:
+                frame['s'] = point.speed
+            if point.heading is not None:
+                frame['h'] = point.heading
+            self.since_keyframe = 0
+        else:
+            frame = {'t': 'd', 'a': point.lat_e6 - last.lat_e6, 'o': point.lng_e6 - last.lng_e6}
+            if point.speed != last.speed:
+                frame['s'] = point.speed
+            if point.heading != last.heading:
+                frame['h'] = point.heading
+            self.since_keyframe += 1
+        if point.ts_ms is not None:
+            frame['ts'] = point.ts_ms
+        if replay:
+            frame['r'] = 1
+        self.last_point = point
+        return json.dumps(frame, separators=(',', ':'))
+
+    def _encode_binary(self, point, replay):
+        speed = NO_VALUE_U16 if point.speed is None else max(0, min(int(round(point.speed * 10)), NO_VALUE_U16 - 1))
+        heading = NO_VALUE_U16 if point.heading is None else int(round(point.heading)) % 360
+        ts = point.ts_ms or 0
+        return BINARY_FRAME.pack(
+            BINARY_KIND_REPLAY if replay else BINARY_KIND_LOCATION, point.driver_id or 0, point.lat_e6, point.lng_e6, speed, heading, ts
+        )
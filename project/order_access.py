@@ -0,0 +1,171 @@
+"""
+كاش صلاحيات متابعة الطلب عبر WebSocket وآخر مواقع الموصل لكل طلب
+
+- صلاحية الانضمام إلى order_{id}: العميل، صاحب المتجر، الموصل المعين، أو الموظفون.
+  تُخزن أطراف الطلب (customer_id, store_id, driver_id) ومالك المتجر في مفاتيح منفصلة
+  وتُقرأ معاً بـ get_many، ويتم تحديثها مباشرة من orders/signals.py و stores/signals.py
+  (write-through) بدون استعلام إضافي.
+- ring buffer صغير لآخر نقاط الموقع المنشورة لكل طلب، يُعاد إرساله للمشترك عند
+  الانضمام حتى لا ينتظر تحديث GPS التالي بعد إعادة الاتصال.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ORDER_ACCESS_TTL = 60 * 60
+DEFAULT_LOCATION_REPLAY_SIZE = 5
+DEFAULT_LOCATION_REPLAY_TTL = 60 * 30
+
+ORDER_KEY = 'ws:order:access:{order_id}'
+STORE_OWNER_KEY = 'ws:store:owner:{store_id}'
+TRACK_KEY = 'ws:order:track:{order_id}'
+
+# القيمة المخزنة لمتجر بدون مالك/طلب بدون متجر (None تعني غياب الكاش)
+NO_ID = 0
+
+
+def _get_config(name, default):
+    return getattr(settings, 'REALTIME_CONFIG', {}).get(name, default)
+
+
+def get_order_access_ttl():
+    return int(_get_config('ORDER_ACCESS_TTL', DEFAULT_ORDER_ACCESS_TTL))
+
+
+# ===== أطراف الطلب =====
+
+def cache_order_parties(order_id, customer_id, store_id, driver_id):
+    try:
+        cache.set(
+            ORDER_KEY.format(order_id=order_id),
+            (customer_id or NO_ID, store_id or NO_ID, driver_id or NO_ID),
+            get_order_access_ttl()
+        )
+    except Exception as e:
+        logger.warning(f'order access cache set failed for order {order_id}: {e}')
+
+
+def cache_store_owner(store_id, owner_id):
+    try:
+        cache.set(STORE_OWNER_KEY.format(store_id=store_id), owner_id or NO_ID, get_order_access_ttl())
+    except Exception as e:
+        logger.warning(f'order access cache set failed for store {store_id}: {e}')
+
+
+def invalidate_order(order_id):
+    try:
+        cache.delete_many([ORDER_KEY.format(order_id=order_id), TRACK_KEY.format(order_id=order_id)])
+    except Exception as e:
+        logger.warning(f'order access invalidation failed for order {order_id}: {e}')
+
+
+def invalidate_store(store_id):
+    try:
+        cache.delete(STORE_OWNER_KEY.format(store_id=store_id))
+    except Exception as e:
+        logger.warning(f'order access invalidation failed for store {store_id}: {e}')
+
+
+def _load_order_parties(order_id):
+    """قراءة أطراف الطلب من قاعدة البيانات (استعلام واحد مع مالك المتجر)"""
+    from orders.models import Order
+
+    row = (
+        Order.objects.filter(pk=order_id)
+        .values_list('user_id', 'store_id', 'delivery_agent_id', 'store__owner_id')
+        .first()
+    )
+    if row is None:
+        return None
+    customer_id, store_id, driver_id, owner_id = row
+    cache_order_parties(order_id, customer_id, store_id, driver_id)
+    if store_id:
+        cache_store_owner(store_id, owner_id)
+    return {
+        'customer_id': customer_id,
+        'store_id': store_id,
+        'driver_id': driver_id,
+        'owner_id': owner_id,
+    }
+
+
+def get_order_parties(order_id):
+    """
+    أطراف الطلب: dict فيه customer_id و store_id و driver_id و owner_id،
+    أو None إذا لم يكن الطلب موجوداً.
+    """
+    order_key = ORDER_KEY.format(order_id=order_id)
+    try:
+        parties = cache.get(order_key)
+        if parties is not None and parties[1]:
+            store_key = STORE_OWNER_KEY.format(store_id=parties[1])
+            owner_id = cache.get(store_key)
+            if owner_id is None:
+                parties = None
+        else:
+            owner_id = NO_ID
+    except Exception as e:
+        logger.warning(f'order access cache get failed for order {order_id}: {e}')
+        parties = None
+
+    if parties is None:
+        return _load_order_parties(order_id)
+
+    customer_id, store_id, driver_id = parties
+    return {
+        'customer_id': customer_id or None,
+        'store_id': store_id or None,
+        'driver_id': driver_id or None,
+        'owner_id': owner_id or None,
+    }
+
+
+def can_track_order(user, parties):
+    """هل يحق للمستخدم متابعة الطلب؟"""
+    if getattr(user, 'is_staff', False):
+        return True
+    if parties is None:
+        return False
+    return user.pk in (parties['customer_id'], parties['owner_id'], parties['driver_id'])
+
+
+def can_publish_location(user, parties):
+    """نشر الموقع: الموصل المعين على الطلب أو الموظفون فقط"""
+    if getattr(user, 'is_staff', False):
+        return True
+    return parties is not None and parties['driver_id'] == user.pk
+
+
+# ===== آخر مواقع الموصل =====
+
+def get_replay_size():
+    return int(_get_config('LOCATION_REPLAY_SIZE', DEFAULT_LOCATION_REPLAY_SIZE))
+
+
+async def apush_location(order_id, event):
+    """إضافة نقطة منشورة إلى ring buffer الطلب (الأحدث في النهاية)"""
+    size = get_replay_size()
+    if size <= 0:
+        return
+    key = TRACK_KEY.format(order_id=order_id)
+    try:
+        buffer = await cache.aget(key) or []
+        buffer.append(event)
+        await cache.aset(key, buffer[-size:], int(_get_config('LOCATION_REPLAY_TTL', DEFAULT_LOCATION_REPLAY_TTL)))
+    except Exception as e:
+        logger.warning(f'location replay buffer update failed for order {order_id}: {e}')
+
+
+async def arecent_locations(order_id, limit=1):
+    """آخر النقاط المنشورة للطلب (الأقدم أولاً)"""
+    if limit <= 0:
+        return []
+    try:
+        buffer = await cache.aget(TRACK_KEY.format(order_id=order_id)) or []
+    except Exception as e:
+        logger.warning(f'location replay buffer read failed for order {order_id}: {e}')
+        return []
+    return buffer[-limit:]
@@ -0,0 +1,258 @@
+"""
+خدمة الحضور (Presence) للموصلين ومستخدمي لوحة التحكم
+
+كل اتصال WebSocket يسجل نبضة (heartbeat) عند الاتصال ومع كل ping، وتنتهي
+صلاحية النبضة تلقائياً بعد PRESENCE_TTL ثانية. لا توجد أي كتابة في قاعدة
+البيانات لكل نبضة؛ التخزين في Redis (sorted sets بدرجة = وقت الانتهاء):
+
+- presence:<kind>:user:<id>: اتصالات المستخدم (اسم القناة)، فقطع اتصال واحد لا
+  يمر إلا على اتصالات نفس المستخدم.
+- presence:<kind>:all و presence:<kind>:city:<city>: معرفات المستخدمين، فالعدادات
+  عدد مستخدمين مختلفين وليس عدد الاتصالات (موصل بجهازين أو لوحة بعدة تبويبات).
+
+الاستخدام:
+    from project import presence
+    presence.count_online(presence.DRIVERS, city='إب')
+    presence.online_user_ids(presence.DRIVERS)
+    presence.online_counts_by_city(presence.DRIVERS)
+"""
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DRIVERS = 'drivers'
+DASHBOARD = 'dashboard'
+
+DEFAULT_PRESENCE_TTL = 90  # ثلاث نبضات من لوحة التحكم (كل 30 ثانية)
+
+ALL_KEY = 'presence:{kind}:all'
+CITY_KEY = 'presence:{kind}:city:{city}'
+CITIES_KEY = 'presence:{kind}:cities'
+USER_KEY = 'presence:{kind}:user:{user_id}'
+
+
+def get_presence_ttl():
+    config = getattr(settings, 'REALTIME_CONFIG', {})
+    return int(config.get('PRESENCE_TTL', DEFAULT_PRESENCE_TTL))
+
+
+def _user_id_from_member(member):
+    if isinstance(member, bytes):
+        member = member.decode()
+    try:
+        # الصيغة القديمة "<user_id>|<channel>" حتى تنتهي صلاحيتها
+        return int(str(member).split('|', 1)[0])
+    except (ValueError, IndexError):
+        return None
+
+
+# قطع اتصال: حذفه من اتصالات المستخدم، وإذا لم يبقَ له اتصال حي يُحذف من مجموعات
+# المستخدمين. KEYS: [user, all, city?]، ARGV: [channel, now, user_id]
+_LEAVE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 2, #KEYS do
+    redis.call('ZREM', KEYS[i], ARGV[3])
+end
+return 1
+"""
+
+
+class RedisPresenceStore:
+    """تخزين الحضور في Redis - كل عملية في round trip واحد (pipeline أو script)"""
+
+    def __init__(self, client):
+        self.client = client
+        self._leave = client.register_script(_LEAVE_SCRIPT)
+
+    def heartbeat(self, kind, user_id, channel_name, city=None, ttl=None):
+        ttl = ttl or get_presence_ttl()
+        expires_at = time.time() + ttl
+        all_key = ALL_KEY.format(kind=kind)
+        user_key = USER_KEY.format(kind=kind, user_id=user_id)
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(user_key, {channel_name: expires_at})
+        pipe.expire(user_key, ttl)
+        # آخر نبضة هي الأبعد انتهاءً بين اتصالات المستخدم
+        pipe.zadd(all_key, {user_id: expires_at})
+        pipe.expire(all_key, ttl * 2)
+        if city:
+            city_key = CITY_KEY.format(kind=kind, city=city)
+            pipe.zadd(city_key, {user_id: expires_at})
+            pipe.expire(city_key, ttl * 2)
+            pipe.sadd(CITIES_KEY.format(kind=kind), city)
+        pipe.execute()
+
+    def leave(self, kind, user_id, channel_name, city=None):
+        # المستخدم يبقى متصلاً ما دام له اتصال حي آخر (جهاز/تبويب ثانٍ)
+        keys = [USER_KEY.format(kind=kind, user_id=user_id), ALL_KEY.format(kind=kind)]
+        if city:
+            keys.append(CITY_KEY.format(kind=kind, city=city))
+        self._leave(keys=keys, args=[channel_name, time.time(), user_id])
+
+    def _live_members(self, key):
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(key, '-inf', now)
+        pipe.zrangebyscore(key, now, '+inf')
+        return pipe.execute()[1]
+
+    def count(self, kind, city=None):
+        key = CITY_KEY.format(kind=kind, city=city) if city else ALL_KEY.format(kind=kind)
+        return self.client.zcount(key, time.time(), '+inf')
+
+    def user_ids(self, kind, city=None):
+        key = CITY_KEY.format(kind=kind, city=city) if city else ALL_KEY.format(kind=kind)
+        ids = (_user_id_from_member(m) for m in self._live_members(key))
+        return {i for i in ids if i is not None}
+
+    def counts_by_city(self, kind):
+        cities = [c.decode() if isinstance(c, bytes) else c
+                  for c in self.client.smembers(CITIES_KEY.format(kind=kind))]
+        if not cities:
+            return {}
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        for city in cities:
+            pipe.zcount(CITY_KEY.format(kind=kind, city=city), now, '+inf')
+        counts = pipe.execute()
+        return {city: n for city, n in zip(cities, counts) if n}
+
+    def is_online(self, kind, user_id):
+        return bool(self.client.exists(USER_KEY.format(kind=kind, user_id=user_id)))
+
+
+class LocalPresenceStore:
+    """تخزين داخل العملية - للتطوير والاختبار عند عدم استخدام django-redis"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = {}  # (kind, member) -> (expires_at, user_id, city)
+
+    def _live(self, kind, city=None):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, v in self._members.items() if v[0] <= now]:
+                del self._members[key]
+            return [v for (k, _), v in self._members.items()
+                    if k == kind and (city is None or v[2] == city)]
+
+    def heartbeat(self, kind, user_id, channel_name, city=None, ttl=None):
+        ttl = ttl or get_presence_ttl()
+        with self._lock:
+            self._members[(kind, channel_name)] = (time.time() + ttl, user_id, city)
+
+    def leave(self, kind, user_id, channel_name, city=None):
+        with self._lock:
+            self._members.pop((kind, channel_name), None)
+
+    def count(self, kind, city=None):
+        return len(self.user_ids(kind, city))
+
+    def user_ids(self, kind, city=None):
+        return {v[1] for v in self._live(kind, city)}
+
+    def counts_by_city(self, kind):
+        users = {}
+        for _, user_id, city in self._live(kind):
+            if city:
+                users.setdefault(city, set()).add(user_id)
+        return {city: len(ids) for city, ids in users.items()}
+
+    def is_online(self, kind, user_id):
+        return user_id in self.user_ids(kind)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_presence_store():
+    """اختيار مخزن الحضور حسب الـ cache المستخدم (Redis أو داخل العملية)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    from django_redis import get_redis_connection
+                    _store = RedisPresenceStore(get_redis_connection('default'))
+                except (ImportError, NotImplementedError):
+                    _store = LocalPresenceStore()
+    return _store
+
+
+# ===== واجهة الاستخدام =====
+
+def heartbeat(kind, user_id, channel_name, city=None):
+    """تسجيل/تجديد حضور اتصال"""
+    try:
+        get_presence_store().heartbeat(kind, user_id, channel_name, city)
+    except Exception as e:
+        logger.warning(f'presence heartbeat failed ({kind}, user {user_id}): {e}')
+
+
+def leave(kind, user_id, channel_name, city=None):
+    """إزالة اتصال عند قطعه"""
+    try:
+        get_presence_store().leave(kind, user_id, channel_name, city)
+    except Exception as e:
+        logger.warning(f'presence leave failed ({kind}, user {user_id}): {e}')
+
+
+def count_online(kind, city=None):
+    """عدد المستخدمين المتصلين (اختيارياً في مدينة محددة)، وليس عدد الاتصالات"""
+    try:
+        return get_presence_store().count(kind, city)
+    except Exception as e:
+        logger.warning(f'presence count failed ({kind}): {e}')
+        return 0
+
+
+def online_user_ids(kind, city=None):
+    """معرفات المستخدمين المتصلين حالياً"""
+    try:
+        return get_presence_store().user_ids(kind, city)
+    except Exception as e:
+        logger.warning(f'presence user_ids failed ({kind}): {e}')
+        return set()
+
+
+def online_counts_by_city(kind):
+    """{city: count} للمستخدمين المتصلين"""
+    try:
+        return get_presence_store().counts_by_city(kind)
+    except Exception as e:
+        logger.warning(f'presence counts_by_city failed ({kind}): {e}')
+        return {}
+
+
+def is_online(kind, user_id):
+    try:
+        return get_presence_store().is_online(kind, user_id)
+    except Exception as e:
+        logger.warning(f'presence is_online failed ({kind}, user {user_id}): {e}')
+        return False
+
+
+def get_presence_snapshot():
+    """ملخص الحضور للوحة التحكم"""
+    return {
+        'online_drivers': count_online(DRIVERS),
+        'online_dashboards': count_online(DASHBOARD),
+        'drivers_by_city': online_counts_by_city(DRIVERS),
+    }
+
+
+# نسخ async للاستخدام داخل الـ consumers (Redis I/O خارج حلقة الأحداث)
+aheartbeat = sync_to_async(heartbeat, thread_sensitive=False)
+aleave = sync_to_async(leave, thread_sensitive=False)
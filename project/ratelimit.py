@@ -0,0 +1,254 @@
+"""
+محدد معدل الطلبات المشترك (token bucket بخوارزمية GCRA)
+
+لكل (نطاق، معرف) مفتاح واحد في Redis يحمل رقماً واحداً (وقت الوصول النظري)،
+فالذاكرة ثابتة لكل مفتاح مهما زاد عدد الطلبات. الفحص والتحديث سكربت Lua
+واحد (ذري، رحلة واحدة). المعدل 'N/period' يسمح بدفعة حتى N طلب ثم N لكل period.
+
+الاستخدام:
+    # DRF
+    throttle_classes = [RateLimitThrottle]
+    ratelimit_scopes = ['login_ip', 'login_email']   # أو {'validate': [...]} لـ ViewSet
+
+    # decorator
+    @ratelimit('driver_apply')
+    def post(self, request): ...
+
+الإعداد:
+    RATELIMIT_CONFIG = {
+        'FAIL_OPEN': True,  # عند تعطل Redis: السماح (True) أو الرفض (False)
+        'SCOPES': {
+            'login_ip': {'rate': '20/m', 'key': 'ip'},
+            'otp_verify_email': {'rate': '10/m', 'key': 'email', 'fail_open': False},
+        },
+    }
+مفاتيح التعريف: 'ip' أو 'user' أو 'user_or_ip' أو 'email' (حقل email في الطلب).
+"""
+import functools
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+RATE_KEY = 'rl:{scope}:{ident}'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# GCRA: ARGV = now_ms, interval_ms, burst, cost -> {allowed, retry_after_ms, remaining}
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval * cost
+local allow_at = new_tat - burst * interval
+if allow_at > now then
+    return {0, allow_at - now, 0}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, 0, math.floor((now - allow_at) / interval)}
+"""
+
+
+def _get_config():
+    return getattr(settings, 'RATELIMIT_CONFIG', {})
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60)؛ يقبل أيضاً '10/5m' (10 كل 5 دقائق)"""
+    count, period = rate.split('/')
+    multiplier = int(period[:-1]) if len(period) > 1 else 1
+    return int(count), multiplier * PERIODS[period[-1]]
+
+
+def get_scope(scope):
+    """إعداد النطاق: {'rate', 'key', 'fail_open'}، أو None إذا لم يُعرّف"""
+    value = _get_config().get('SCOPES', {}).get(scope)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = {'rate': value}
+    return {
+        'rate': value['rate'],
+        'key': value.get('key', 'user_or_ip'),
+        'fail_open': value.get('fail_open', _get_config().get('FAIL_OPEN', True)),
+    }
+
+
+def _gcra(tat, now, interval, burst, cost):
+    """نفس GCRA_SCRIPT في Python: (allowed, retry_after_ms, remaining, new_tat)"""
+    tat = max(tat if tat is not None else now, now)
+    new_tat = tat + interval * cost
+    allow_at = new_tat - burst * interval
+    if allow_at > now:
+        return False, allow_at - now, 0, None
+    return True, 0, int((now - allow_at) // interval), new_tat
+
+
+class RedisRateStore:
+    def __init__(self, client):
+        self.client = client
+        self._script = client.register_script(GCRA_SCRIPT)
+
+    def hit(self, key, now, interval, burst, cost):
+        allowed, retry_after, remaining = self._script(keys=[key], args=[now, interval, burst, cost])
+        return bool(allowed), int(retry_after), int(remaining)
+
+
+class CacheRateStore:
+    """
+    بديل عبر Django cache عند عدم استخدام django-redis - للتطوير والاختبار.
+    القفل داخل العملية فقط، لذا ليس ذرياً بين عدة عمليات.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def hit(self, key, now, interval, burst, cost):
+        with self._lock:
+            allowed, retry_after, remaining, new_tat = _gcra(cache.get(key), now, interval, burst, cost)
+            if allowed:
+                cache.set(key, new_tat, max(1, -(-(new_tat - now) // 1000)))
+            return allowed, retry_after, remaining
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_rate_store():
+    """اختيار مخزن العدادات حسب الـ cache المستخدم (Redis أو Django cache)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    from django_redis import get_redis_connection
+                    _store = RedisRateStore(get_redis_connection('default'))
+                except (ImportError, NotImplementedError):
+                    _store = CacheRateStore()
+    return _store
+
+
+# ===== التعريف =====
+
+def _client_ip(request):
+    return BaseThrottle().get_ident(request)
+
+
+def _request_email(request):
+    data = getattr(request, 'data', None)
+    if data is None:
+        data = request.POST
+    try:
+        email = data.get('email')
+    except AttributeError:
+        return None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def get_ident(request, kind):
+    """معرف العميل حسب نوع المفتاح، أو None (لا يُطبق الحد)"""
+    user = getattr(request, 'user', None)
+    authenticated = bool(user and user.is_authenticated)
+    if kind == 'user':
+        return f'u:{user.pk}' if authenticated else None
+    if kind == 'user_or_ip':
+        return f'u:{user.pk}' if authenticated else f'ip:{_client_ip(request)}'
+    if kind == 'email':
+        email = _request_email(request)
+        return f'e:{email}' if email else f'ip:{_client_ip(request)}'
+    return f'ip:{_client_ip(request)}'
+
+
+def _key(scope, ident):
+    # بصمة ثابتة الطول بدلاً من البريد أو IP كما هو
+    return RATE_KEY.format(scope=scope, ident=hashlib.sha1(ident.encode()).hexdigest()[:20])
+
+
+# ===== الفحص =====
+
+def hit(scope, ident, cost=1):
+    """
+    تسجيل طلب في النطاق. ترجع (allowed, retry_after_seconds, remaining).
+    النطاق غير المعرف في الإعدادات لا يُقيد.
+    """
+    config = get_scope(scope)
+    if config is None or ident is None:
+        return True, 0, None
+    count, period = parse_rate(config['rate'])
+    interval = period * 1000 / count
+    try:
+        allowed, retry_after_ms, remaining = get_rate_store().hit(
+            _key(scope, ident), int(time.time() * 1000), interval, count, cost
+        )
+    except Exception as e:
+        logger.warning(f"Rate limiter unavailable for {scope} (fail_open={config['fail_open']}): {e}")
+        return config['fail_open'], (0 if config['fail_open'] else period), None
+    return allowed, int(-(-retry_after_ms // 1000)), remaining
+
+
+def check_request(request, scopes):
+    """فحص عدة نطاقات لطلب واحد. ترجع (allowed, retry_after_seconds)"""
+    allowed_all, wait = True, 0
+    for scope in scopes:
+        config = get_scope(scope)
+        if config is None:
+            continue
+        allowed, retry_after, _ = hit(scope, get_ident(request, config['key']))
+        if not allowed:
+            allowed_all, wait = False, max(wait, retry_after)
+    return allowed_all, wait
+
+
+class RateLimitThrottle(BaseThrottle):
+    """
+    Throttle لـ DRF يستخدم نطاقات view.ratelimit_scopes (قائمة، أو dict حسب action
+    في ViewSet).
+    """
+
+    def allow_request(self, request, view):
+        scopes = getattr(view, 'ratelimit_scopes', ())
+        if isinstance(scopes, dict):
+            scopes = scopes.get(getattr(view, 'action', None), ())
+        allowed, self._wait = check_request(request, scopes)
+        if not allowed:
+            logger.info(f"Rate limited {view.__class__.__name__} {scopes} for {_client_ip(request)}")
+        return allowed
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+def ratelimit(*scopes):
+    """
+    decorator لدوال العرض أو methods (request أول وسيط أو الثاني بعد self):
+    يرجع 429 مع Retry-After عند تجاوز أي نطاق.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            request = args[0] if hasattr(args[0], 'META') else args[1]
+            allowed, wait = check_request(request, scopes)
+            if not allowed:
+                response = JsonResponse(
+                    {'detail': f'تم تجاوز عدد الطلبات المسموح، حاول بعد {wait} ثانية'},
+                    status=429,
+                    json_dumps_params={'ensure_ascii': False},
+                )
+                response['Retry-After'] = str(wait)
+                return response
+            return view_func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,170 @@
+"""
+سجل أحداث منظم لطبقة الوقت الحقيقي (WebSocket / channel layer)
+
+- log_event(): عداد لكل نوع حدث + سطر JSON منظم يخضع لنسبة عينة حسب نوع الحدث
+  (الأحداث بمستوى WARNING فأعلى تُسجل دائماً).
+- الكتابة الفعلية تتم في thread منفصل عبر QueueHandler/QueueListener، فلا يكتب
+  event loop إلى stdout/stderr بشكل متزامن.
+- العدادات تبقى في ذاكرة العملية وتُعرض عبر get_metrics() (dashboard/api/realtime-metrics/)
+  مع hostname/pid حتى يمكن تجميعها من عدة عمليات.
+
+نسب العينات من الإعدادات:
+    REALTIME_CONFIG = {
+        'LOG_SAMPLING': {'default': 1.0, 'ws.driver.ping': 0.01},
+    }
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+LOGGER_NAME = 'realtime'
+
+DEFAULT_LOG_SAMPLING = {
+    'default': 1.0,
+    'ws.dashboard.connect': 0.1,
+    'ws.dashboard.disconnect': 0.1,
+    'ws.dashboard.send': 0.05,
+    'ws.order.connect': 0.1,
+    'ws.order.disconnect': 0.1,
+    'ws.order.location': 0.01,
+    'ws.driver.connect': 0.1,
+    'ws.driver.disconnect': 0.1,
+    'ws.driver.ping': 0.01,
+    'ws.driver.location': 0.01,
+    'ws.auth.ok': 0.05,
+}
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+_started_at = time.time()
+
+_logger = None
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    """سطر JSON واحد لكل حدث"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'event': getattr(record, 'event', record.getMessage()),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        rate = getattr(record, 'sample_rate', 1.0)
+        if rate < 1.0:
+            entry['sample_rate'] = rate
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler الافتراضي ينسق الرسالة في thread المستدعي؛ هنا يتم تمرير السجل
+    كما هو ويتم التنسيق في thread المستمع.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # traceback لا يمكن تمريره بأمان بين threads - ينسق هنا (أخطاء فقط)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_rates = None
+
+
+def _sampling():
+    global _rates
+    if _rates is None:
+        rates = dict(DEFAULT_LOG_SAMPLING)
+        rates.update(getattr(settings, 'REALTIME_CONFIG', {}).get('LOG_SAMPLING', {}))
+        _rates = rates
+    return _rates
+
+
+def get_logger():
+    """logger الأحداث (يُجهز مرة واحدة مع QueueListener)"""
+    global _logger, _listener
+    if _logger is not None:
+        return _logger
+    with _setup_lock:
+        if _logger is None:
+            logger = logging.getLogger(LOGGER_NAME)
+            if not logger.handlers:
+                sink = logging.StreamHandler(sys.stderr)
+                sink.setFormatter(StructuredFormatter())
+                log_queue = queue.SimpleQueue()
+                _listener = logging.handlers.QueueListener(log_queue, sink, respect_handler_level=True)
+                _listener.start()
+                atexit.register(_listener.stop)
+                logger.addHandler(DeferredQueueHandler(log_queue))
+                logger.propagate = False
+                if logger.level == logging.NOTSET:
+                    logger.setLevel(logging.INFO)
+            _logger = logger
+    return _logger
+
+
+def incr(name, amount=1):
+    """زيادة عداد بدون تسجيل (مثل عدد البايتات المرسلة)"""
+    with _counters_lock:
+        _counters[name] += amount
+
+
+def log_event(event, level=logging.INFO, exc_info=None, **fields):
+    """
+    تسجيل حدث: يزيد العداد دائماً، ويكتب سطراً منظماً حسب نسبة العينة.
+    """
+    incr(event)
+    rate = 1.0
+    if level < logging.WARNING:
+        rates = _sampling()
+        rate = rates.get(event, rates['default'])
+        if rate <= 0 or (rate < 1.0 and random.random() >= rate):
+            return
+    logger = get_logger()
+    if logger.isEnabledFor(level):
+        logger.log(
+            level, event, exc_info=exc_info,
+            extra={'event': event, 'fields': fields, 'sample_rate': rate}
+        )
+
+
+def get_metrics():
+    """لقطة من عدادات هذه العملية"""
+    with _counters_lock:
+        counters = dict(_counters)
+    uptime = max(time.time() - _started_at, 1e-9)
+    return {
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'started_at': _started_at,
+        'uptime_s': round(uptime, 1),
+        'counters': counters,
+        'rates_per_s': {name: round(count / uptime, 3) for name, count in counters.items()},
+    }
+
+
+def reset_metrics():
+    global _started_at
+    with _counters_lock:
+        _counters.clear()
+        _started_at = time.time()
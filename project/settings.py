@@ -33,6 +33,7 @@ SECRET_KEY = 'django-insecure-t^$!9_wtj74wnms)jbhjp(ke_-uha_jcs$89xyd5skknlsndd3
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
+TESTING = sys.argv[1:2] == ['test']
 
 ALLOWED_HOSTS = ['192.168.0.163','127.0.0.1', 'localhost', '172.180.1.41', '172.180.1.57', '*']
 
@@ -157,7 +158,9 @@ INTERNAL_IPS = [
 ]
 DEBUG_TOOLBAR_CONFIG = {
     'INTERCEPT_REDIRECTS': False,
-    'SHOW_TOOLBAR_CALLBACK': lambda request: True,
+    # الشريط لا يُعرض أثناء manage.py test (مساراته غير مسجلة عندما DEBUG = False)
+    'SHOW_TOOLBAR_CALLBACK': lambda request: not TESTING,
+    'IS_RUNNING_TESTS': False,
 }
 
 
@@ -216,6 +219,40 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# رفع الصور (core/image_storage.py): تخزين حسب البصمة مع قراءة على أجزاء
+IMAGE_UPLOAD_CONFIG = {
+    'MEMORY_LIMIT': 256 * 1024,  # الرفع الأكبر يُكتب إلى ملف مؤقت بدلاً من الذاكرة
+    'CHUNK_SIZE': 64 * 1024,  # حجم الجزء عند حساب البصمة
+    # النسخ المشتقة WebP (core/image_variants.py): أقصى بُعد لكل نسخة
+    'VARIANTS': {'thumb': 240, 'medium': 720, 'large': 1600},
+    'VARIANT_QUALITY': 80,
+    'VARIANT_QUEUE': 'thread',  # 'thread' أو 'celery' أو 'sync'
+    'VARIANT_WORKERS': 2,  # عدد الصور التي تُعالج بالتوازي في thread المحلي
+    'VARIANT_CACHE_TTL': 86400,  # كاش حالة النسخ لكل صورة
+    'GC_MIN_AGE_S': 86400,  # gc_images لا يحذف ملفاً غير مستخدم أحدث من هذا (core/image_gc.py)
+}
+
+# بحث المنتجات (products/search.py): فهرس معكوس + trie للإكمال التلقائي
+SEARCH_CONFIG = {
+    'AUTOCOMPLETE_LIMIT': 10,
+    'TRIE_REFRESH_INTERVAL': 60,  # ثوانٍ بين فحص إصدار الـ trie في كل عملية
+}
+
+# عدادات فلاتر قائمة المنتجات (products/facets.py)
+FACETS_CONFIG = {
+    'PRICE_BANDS': [50, 100, 250, 500, 1000],  # حدود شرائح السعر
+    'SHARDS': 64,  # تقسيم سجلات المنتجات في الكاش (التحديث يعيد كتابة shard واحد)
+    'REFRESH_INTERVAL': 30,  # ثوانٍ بين فحص إصدارات الـ shards في كل عملية
+    'LIMIT': 50,  # أقصى عدد قيم لكل بُعد في الاستجابة
+    'UPDATE_QUEUE': 'thread',  # تحديث السجلات بعد الحفظ: 'thread' أو 'celery' أو 'sync'
+    'UPDATE_RETRY_DELAY': 1,  # ثوانٍ قبل إعادة المحاولة عندما يكون قفل الفهرس مشغولاً
+}
+
+# شجرة فئات المتجر المخزنة (products/category_tree.py)
+CATALOG_CONFIG = {
+    'CATEGORY_TREE_TTL': 3600,
+}
+
 # MIME type configuration for static files
 import mimetypes
 mimetypes.add_type("application/javascript", ".js", True)
@@ -231,7 +268,11 @@ AUTH_USER_MODEL = "accounts.User"
 
 
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# للتطوير/الاختبار: EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend
+# أو django.core.mail.backends.filebased.EmailBackend (الرسائل في EMAIL_FILE_PATH)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+EMAIL_TIMEOUT = 10
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -245,7 +286,8 @@ DEFAULT_FROM_EMAIL="ahmedalrshdysend@gmail.com"
 from django.utils.timezone import timedelta
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # For JWT-based auth
+        # JWT: المستخدم من claims الـ token بدون استعلام لكل طلب (accounts/tokens.py)
+        'accounts.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # For session-based auth
     ],
     'DEFAULT_PERMISSION_CLASSES': (
@@ -255,6 +297,30 @@ REST_FRAMEWORK = {
 
 }
 
+# محدد معدل الطلبات (project/ratelimit.py) - المعدل 'N/period' مع دفعة حتى N
+# key: 'ip' أو 'user' أو 'user_or_ip' أو 'email' (حقل email في الطلب)
+RATELIMIT_CONFIG = {
+    'FAIL_OPEN': True,  # عند تعطل Redis: السماح بالطلب (False: رفضه)
+    'SCOPES': {
+        'login_ip': {'rate': '20/m', 'key': 'ip'},
+        'login_email': {'rate': '10/m', 'key': 'email'},
+        'register_ip': {'rate': '20/h', 'key': 'ip'},
+        'otp_verify_email': {'rate': '10/m', 'key': 'email', 'fail_open': False},
+        'otp_verify_ip': {'rate': '30/m', 'key': 'ip'},
+        'otp_send_email': {'rate': '5/m', 'key': 'email'},
+        'otp_send_ip': {'rate': '20/m', 'key': 'ip'},
+        'password_check': {'rate': '10/m', 'key': 'user'},
+        'driver_apply': {'rate': '10/h', 'key': 'ip'},
+        'coupon_validate': {'rate': '30/m', 'key': 'user_or_ip'},
+        'cart_calculate': {'rate': '60/m', 'key': 'user_or_ip'},
+    },
+}
+
+# مصادقة JWT بالـ claims: كاش رقم إصدار الصلاحيات لكل مستخدم (يُبطل عند تغييرها)
+AUTH_CONFIG = {
+    'TOKEN_VERSION_CACHE_TTL': 3600,
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=30),  
     'REFRESH_TOKEN_LIFETIME': timedelta(days=60),
@@ -310,4 +376,43 @@ NOTIFICATIONS_CONFIG = {
     'ENABLE_SMS_NOTIFICATIONS': False,  # تفعيل إشعارات SMS
     'AUTO_DELETE_READ_NOTIFICATIONS_DAYS': 30,  # حذف الإشعارات المقروءة بعد 30 يوم
     'MAX_NOTIFICATIONS_PER_USER': 1000,  # الحد الأقصى للإشعارات لكل مستخدم
+    'FCM_BATCH_SIZE': 500,  # عدد الرموز في كل رسالة multicast (حد FCM الأقصى 500)
+    'FCM_MAX_WORKERS': 8,  # عدد الدفعات المرسلة بالتوازي
+    'AUDIENCE_CHUNK_SIZE': 1000,  # عدد المستخدمين في كل دفعة للإشعارات الجماعية
+    'FCM_TRANSPORT': 'firebase',  # 'fake' لبديل محلي بدون شبكة (اختبار الحمل)
+    'SUMMARY_TTL': 86400,  # ملخص إشعارات المستخدم (الشارة والإحصائيات) في الكاش
+    'RETENTION_CHUNK_SIZE': 5000,  # صفوف كل دفعة حذف في cleanup_notifications
+    'RETENTION_PAUSE_MS': 50,  # توقف بين دفعات الحذف
+    'TEMPLATE_CACHE_TTL': 3600,  # كاش قوالب الإشعارات (يُبطل عند حفظ أي قالب)
+    # طابور البريد (notifications/email_queue.py): 'celery' أو 'thread' أو 'sync'
+    # 'celery': كل دفعة مهمة واحدة محفوظة في الوسيط حتى يرسلها العامل (OTP لا يضيع عند إعادة التشغيل)
+    # 'thread': أسرع بدون وسيط، لكن الرسائل في ذاكرة العملية تضيع إذا توقفت أو انهارت
+    'EMAIL_QUEUE': 'celery',
+    'EMAIL_BATCH_SIZE': 50,  # رسائل كل دفعة على الاتصال المشترك
+    'EMAIL_BATCH_WAIT_MS': 200,  # انتظار اكتمال الدفعة
+    'EMAIL_MAX_RETRIES': 3,  # إعادة المحاولة مع backoff أسي
+    'EMAIL_RETRY_BACKOFF_S': 2,
+    'EMAIL_RETRY_MAX_DELAY_S': 300,  # أقصى انتظار بين محاولتين
+    'EMAIL_TASK_MAX_RETRIES': 8,  # محاولات مهمة Celery (بدون انتظار داخل العامل)
+    'EMAIL_IDLE_CLOSE_S': 60,  # إغلاق اتصال SMTP بعد هذه المدة بدون إرسال
+}
+
+# إعدادات الاتصال اللحظي (WebSocket)
+REALTIME_CONFIG = {
+    'AUTH_CACHE_TTL': 60,  # مدة كاش مصادقة JWT وأهلية الموصل بالثواني
+    'PRESENCE_TTL': 90,  # انتهاء حضور الاتصال إذا لم يصل ping خلال هذه المدة
+    # بث موقع الموصل لمتابعي الطلب (OrderTrackingConsumer)
+    'LOCATION_MAX_RATE_HZ': 1.0,  # أقصى عدد تحديثات في الثانية لكل ناشر
+    'LOCATION_MIN_DISTANCE_M': 5.0,  # تجاهل الحركة الأقل من هذه المسافة
+    'LOCATION_KEEPALIVE_S': 15.0,  # إرسال الموقع حتى بدون حركة بعد هذه المدة
+    'LOCATION_KEYFRAME_INTERVAL': 20,  # إطار كامل كل N إطار delta
+    'LOCATION_REPLAY_SIZE': 5,  # آخر المواقع المحفوظة لكل طلب لإعادتها عند الانضمام
+    'ORDER_ACCESS_TTL': 3600,  # كاش أطراف الطلب (يُحدث من signals الطلب والمتجر)
+    'DRIVER_INBOX_COUNTER_TTL': 600,  # عدادات إشعارات الموصل (driver/notification_inbox.py)
+    # نسبة العينة لأسطر سجل الأحداث حسب النوع (العدادات تُحسب دائماً) - انظر project/realtime_log.py
+    'LOG_SAMPLING': {
+        'default': 1.0,
+        'ws.driver.ping': 0.01,
+        'ws.order.location': 0.01,
+    },
 }
@@ -5,7 +5,7 @@ from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.shortcuts import redirect
 from .admin_views import metrics_view
-from .dashboard_views import dashboard_view
+from .dashboard_views import dashboard_view, presence_api_view, realtime_metrics_api_view
 from orders.dashboard_orders import orders_list_view, order_detail_view, order_create_view, order_edit_view, order_delete_view, order_status_change_view
 from orders.api_views import get_stores_api, get_products_by_store_api, get_product_variants_api
 from products.dashboard_products import products_list_view, product_detail_view, product_create_view, product_edit_view, product_delete_view
@@ -105,6 +105,8 @@ urlpatterns = [
     path('dashboard/api/stores/', get_stores_api, name='dashboard-api-stores'),
     path('dashboard/api/products-by-store/', get_products_by_store_api, name='dashboard-api-products-by-store'),
     path('dashboard/api/product-variants/', get_product_variants_api, name='dashboard-api-product-variants'),
+    path('dashboard/api/presence/', presence_api_view, name='dashboard-api-presence'),
+    path('dashboard/api/realtime-metrics/', realtime_metrics_api_view, name='dashboard-api-realtime-metrics'),
     
     # api
     path('api/v1/auth/', include('accounts.api_urls')),
@@ -6,6 +6,8 @@ from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import logging
 
+from .realtime_log import log_event
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,16 +18,6 @@ def send_dashboard_notification(message_type, data):
     try:
         channel_layer = get_channel_layer()
         if channel_layer:
-            # Debug logging to trace outgoing WS messages
-            try:
-                logger.info(f"WS->dashboard_updates type={message_type} payload_keys={list(data.keys())}")
-            except Exception:
-                pass
-            # Also print to stdout to ensure visibility without logging config
-            try:
-                print(f"WS->dashboard_updates type={message_type} keys={list(data.keys())}")
-            except Exception:
-                pass
             async_to_sync(channel_layer.group_send)(
                 'dashboard_updates',
                 {
@@ -33,8 +25,10 @@ def send_dashboard_notification(message_type, data):
                     **data  # Spread data directly instead of nesting
                 }
             )
+            # سطر منظم بعينة (ws.dashboard.send) + عداد لكل رسالة
+            log_event('ws.dashboard.send', message_type=message_type, keys=list(data.keys()))
     except Exception as e:
-        print(f'Error sending WebSocket notification: {e}')
+        log_event('ws.dashboard.error', logging.ERROR, stage='group_send', message_type=message_type, error=str(e))
 
 
 def notify_new_order(order):
@@ -57,7 +51,7 @@ def notify_new_order(order):
             'message': f'طلب جديد #{order.id}'
         })
     except Exception as e:
-        print(f'Error in notify_new_order: {e}')
+        log_event('ws.dashboard.error', logging.ERROR, stage='notify_new_order', error=str(e))
 
 
 def notify_order_status_change(order):
@@ -80,7 +74,7 @@ def notify_order_status_change(order):
             'message': f'تم تحديث حالة الطلب #{order.id}'
         })
     except Exception as e:
-        print(f'Error in notify_order_status_change: {e}')
+        log_event('ws.dashboard.error', logging.ERROR, stage='notify_order_status_change', error=str(e))
 
 
 def notify_stats_update(stats):
@@ -0,0 +1,108 @@
+"""
+كاش قصير العمر لمصادقة اتصالات WebSocket
+
+يخزن claims الخاصة بـ JWT بعد فك تشفيرها، ونسخة من المستخدم، ونتيجة
+فحص أهلية الموصل، حتى لا تضرب موجات إعادة الاتصال قاعدة البيانات بعد
+انقطاع الشبكة. يتم الإبطال من driver/signals.py عند تعديل User أو DeliveryProfile.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTH_CACHE_TTL = 60  # ثانية
+
+CLAIMS_KEY = 'ws:auth:claims:{digest}'
+USER_KEY = 'ws:auth:user:{user_id}'
+DRIVER_KEY = 'ws:auth:driver:{user_id}'
+
+
+def get_auth_cache_ttl():
+    """مدة صلاحية الكاش من REALTIME_CONFIG"""
+    config = getattr(settings, 'REALTIME_CONFIG', {})
+    return int(config.get('AUTH_CACHE_TTL', DEFAULT_AUTH_CACHE_TTL))
+
+
+def _token_digest(token):
+    # لا نخزن الـ token نفسه كمفتاح في Redis
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _safe_get(key):
+    try:
+        return cache.get(key)
+    except Exception as e:
+        logger.warning(f'ws auth cache get failed for {key}: {e}')
+        return None
+
+
+def _safe_set(key, value, timeout):
+    try:
+        cache.set(key, value, timeout)
+    except Exception as e:
+        logger.warning(f'ws auth cache set failed for {key}: {e}')
+
+
+# ===== JWT claims =====
+
+def get_token_claims(token):
+    """إرجاع claims المخزنة لهذا الـ token أو None"""
+    return _safe_get(CLAIMS_KEY.format(digest=_token_digest(token)))
+
+
+def set_token_claims(token, claims):
+    """تخزين claims بعد التحقق من التوقيع، بحيث لا يتجاوز الكاش انتهاء الـ token"""
+    ttl = get_auth_cache_ttl()
+    exp = claims.get('exp')
+    if exp:
+        ttl = min(ttl, int(exp - time.time()))
+    if ttl <= 0:
+        return
+    _safe_set(CLAIMS_KEY.format(digest=_token_digest(token)), claims, ttl)
+
+
+# ===== المستخدم =====
+
+def get_cached_user(user_id):
+    """إرجاع نسخة المستخدم المخزنة أو None"""
+    return _safe_get(USER_KEY.format(user_id=user_id))
+
+
+def set_cached_user(user):
+    _safe_set(USER_KEY.format(user_id=user.pk), user, get_auth_cache_ttl())
+
+
+# ===== أهلية الموصل =====
+
+def get_driver_eligibility(user_id):
+    """True/False إذا كانت النتيجة مخزنة، وإلا None"""
+    return _safe_get(DRIVER_KEY.format(user_id=user_id))
+
+
+def set_driver_eligibility(user_id, is_driver):
+    _safe_set(DRIVER_KEY.format(user_id=user_id), bool(is_driver), get_auth_cache_ttl())
+
+
+# ===== الإبطال =====
+
+def invalidate_user(user_id):
+    """حذف نسخة المستخدم ونتيجة أهلية الموصل"""
+    try:
+        cache.delete_many([
+            USER_KEY.format(user_id=user_id),
+            DRIVER_KEY.format(user_id=user_id),
+        ])
+    except Exception as e:
+        logger.warning(f'ws auth cache invalidation failed for user {user_id}: {e}')
+
+
+def invalidate_driver(user_id):
+    """حذف نتيجة أهلية الموصل فقط"""
+    try:
+        cache.delete(DRIVER_KEY.format(user_id=user_id))
+    except Exception as e:
+        logger.warning(f'ws auth cache invalidation failed for driver {user_id}: {e}')
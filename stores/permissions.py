@@ -29,4 +29,5 @@ class IsOwnerOrReadOnly(BasePermission):
         # هذه الدالة يتم استدعاؤها فقط للتفاصيل/التعديل/الحذف
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.owner == request.user
+        # مقارنة المعرف بدلاً من تحميل المالك
+        return obj.owner_id == request.user.pk
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Store, PlatformCategory
+from core.serializers import ImageVariantField
 
 # يستخدم هذا السيريالايزر لتحويل بيانات المتجر إلى JSON والعكس
 class PlatformCategorySerializer(serializers.ModelSerializer):
@@ -21,8 +22,9 @@ class StoreListSerializer(serializers.ModelSerializer):
     platform_category_name = serializers.CharField(source='platform_category.name', read_only=True)
     owner_name = serializers.CharField(source='owner.name', read_only=True)
     is_favorite = serializers.BooleanField(read_only=True, default=False)
-    logo_url = serializers.SerializerMethodField()
-    cover_image_url = serializers.SerializerMethodField()
+    # القائمة: نسخ مصغرة بدلاً من الأصل، بروابط مطلقة
+    logo_url = ImageVariantField(size='thumb', absolute=True)
+    cover_image_url = ImageVariantField(size='medium', absolute=True)
     
     # ✅ الإحصائيات من Model (محدثة بـ Signals)
     # product_count, average_rating, review_count, favorites_count
@@ -34,24 +36,6 @@ class StoreListSerializer(serializers.ModelSerializer):
     can_sell = serializers.ReadOnlyField()
     is_open_now = serializers.ReadOnlyField()
     
-    def get_logo_url(self, obj):
-        """إرجاع URL صالح للشعار مع الـ base URL الحالي"""
-        if obj.logo_url and obj.logo_url.strip():
-            request = self.context.get('request')
-            if request and not obj.logo_url.startswith('http'):
-                return request.build_absolute_uri(obj.logo_url)
-            return obj.logo_url
-        return None
-    
-    def get_cover_image_url(self, obj):
-        """إرجاع URL صالح لصورة الغلاف مع الـ base URL الحالي"""
-        if obj.cover_image_url and obj.cover_image_url.strip():
-            request = self.context.get('request')
-            if request and not obj.cover_image_url.startswith('http'):
-                return request.build_absolute_uri(obj.cover_image_url)
-            return obj.cover_image_url
-        return None
-    
     class Meta:
         model = Store
         fields = [
@@ -1,12 +1,15 @@
 """
 Django signals for sending notifications on store events
 """
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
+from django.db import transaction
 from django.db.models import Avg, Count
 from .models import Store
 from notifications.services import NotificationService
 from notifications.models import NotificationType, NotificationPriority
+from project import order_access
+from . import vendor_context
 
 
 @receiver(post_save, sender=Store)
@@ -196,3 +199,38 @@ def update_store_favorites_count(sender, instance, **kwargs):
             store.save(update_fields=['favorites_count'])
     except Exception:
         pass
+
+
+@receiver(post_save, sender=Store)
+def refresh_store_owner_cache(sender, instance, update_fields=None, **kwargs):
+    """تحديث مالك المتجر في كاش صلاحيات متابعة الطلبات (بعد نجاح المعاملة)"""
+    if update_fields and 'owner' not in update_fields:
+        return
+    store_id, owner_id = instance.pk, instance.owner_id
+    transaction.on_commit(lambda: order_access.cache_store_owner(store_id, owner_id))
+
+
+@receiver(post_delete, sender=Store)
+def drop_store_owner_cache(sender, instance, **kwargs):
+    order_access.invalidate_store(instance.pk)
+
+
+@receiver(post_init, sender=Store)
+def remember_store_owner(sender, instance, **kwargs):
+    """المالك عند التحميل لإبطال متاجر المالك السابق عند نقل الملكية"""
+    instance._loaded_owner_id = instance.__dict__.get('owner_id')
+
+
+@receiver(post_save, sender=Store)
+def refresh_vendor_store_ids(sender, instance, created, update_fields=None, **kwargs):
+    """إبطال معرفات متاجر البائع (stores/vendor_context.py)"""
+    previous_owner_id = getattr(instance, '_loaded_owner_id', None)
+    if not created and previous_owner_id == instance.owner_id:
+        return
+    vendor_context.invalidate_owned_stores([previous_owner_id, instance.owner_id])
+    instance._loaded_owner_id = instance.owner_id
+
+
+@receiver(post_delete, sender=Store)
+def drop_vendor_store_ids(sender, instance, **kwargs):
+    vendor_context.invalidate_owned_stores([instance.owner_id])
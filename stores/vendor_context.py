@@ -0,0 +1,93 @@
+"""
+سياق البائع: معرفات المتاجر التي يملكها المستخدم
+
+- تُحسب مرة واحدة لكل طلب (تُحفظ على كائن request.user) ومخزنة في الكاش لكل
+  مستخدم، فصلاحيات IsVendor / IsObjectOwner وتصفية querysets التسعير لا تحتاج
+  استعلاماً إضافياً.
+- تُبطل من stores/signals.py عند إنشاء متجر أو حذفه أو تغيير مالكه (المالك
+  السابق والجديد).
+
+    AUTH_CONFIG = {'VENDOR_STORES_CACHE_TTL': 3600}
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VENDOR_STORES_CACHE_TTL = 60 * 60
+
+VENDOR_STORES_KEY = 'vendor:stores:{user_id}'
+
+# اسم الخاصية على كائن المستخدم (صالحة طوال الطلب فقط)
+_MEMO_ATTR = '_owned_store_ids'
+
+
+def get_vendor_stores_cache_ttl():
+    config = getattr(settings, 'AUTH_CONFIG', {})
+    return int(config.get('VENDOR_STORES_CACHE_TTL', DEFAULT_VENDOR_STORES_CACHE_TTL))
+
+
+def _key(user_id):
+    return VENDOR_STORES_KEY.format(user_id=user_id)
+
+
+def _load_store_ids(user_id):
+    from .models import Store
+
+    key = _key(user_id)
+    try:
+        store_ids = cache.get(key)
+        if store_ids is not None:
+            return frozenset(store_ids)
+    except Exception as e:
+        logger.warning(f'vendor stores cache get failed for user {user_id}: {e}')
+
+    store_ids = list(Store.objects.filter(owner_id=user_id).values_list('id', flat=True))
+    try:
+        cache.set(key, store_ids, get_vendor_stores_cache_ttl())
+    except Exception as e:
+        logger.warning(f'vendor stores cache set failed for user {user_id}: {e}')
+    return frozenset(store_ids)
+
+
+def get_owned_store_ids(user):
+    """frozenset بمعرفات متاجر المستخدم (فارغ لغير المسجلين)"""
+    if not user or not user.is_authenticated:
+        return frozenset()
+    store_ids = getattr(user, _MEMO_ATTR, None)
+    if store_ids is None:
+        store_ids = _load_store_ids(user.pk)
+        setattr(user, _MEMO_ATTR, store_ids)
+    return store_ids
+
+
+def owns_store(user, store_id):
+    try:
+        return int(store_id) in get_owned_store_ids(user)
+    except (TypeError, ValueError):
+        return False
+
+
+def scope_to_owned(queryset, user, field='stores'):
+    """تصفية queryset على متاجر المستخدم (الموظفون يرون الكل)"""
+    if getattr(user, 'is_staff', False):
+        return queryset
+    return queryset.filter(**{f'{field}__in': get_owned_store_ids(user)}).distinct()
+
+
+def invalidate_owned_stores(user_ids):
+    """حذف الكاش بعد نجاح المعاملة"""
+    keys = [_key(user_id) for user_id in set(user_ids) if user_id]
+    if not keys:
+        return
+
+    def _delete():
+        try:
+            cache.delete_many(keys)
+        except Exception as e:
+            logger.warning(f'vendor stores invalidation failed for {len(keys)} users: {e}')
+
+    transaction.on_commit(_delete)